@@ -1,7 +1,5 @@
 """Lightweight analyzers package used by streaming upload endpoints.
 
-Provides a minimal HybridFileAnalyzer for CSV/JSON/XML samples so the
-frontend's streaming analysis flow works without heavy dependencies.
+Provides HybridFileAnalyzer for CSV/JSON/XML uploads: quick samples for the
+frontend's streaming analysis flow plus bounded-memory full-file profiles.
 """
-
-
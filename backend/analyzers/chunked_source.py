@@ -0,0 +1,141 @@
+"""File sources for the analyzers: a single path or an ordered list of chunk files.
+
+A chunked upload can be analyzed in place: ``ChunkedFileReader`` exposes the
+ordered ``chunk_NNNN`` files as one seekable binary stream, so nothing has
+to be concatenated (or copied through Python memory) before profiling.
+"""
+import io
+import os
+from bisect import bisect_right
+from typing import IO, List, Optional, Sequence, Union
+
+Source = Union[str, Sequence[str]]
+
+READ_BUFFER_BYTES = 1024 * 1024
+
+# Shared by every profile mode so a UTF-8 BOM never ends up in a column name
+TEXT_ENCODING = "utf-8-sig"
+# Invalid bytes (a cp1251 or latin-1 upload) become U+FFFD instead of
+# failing the whole profile; profiles report how many were replaced
+TEXT_ERRORS = "replace"
+REPLACEMENT_CHAR = "\ufffd"
+
+
+class ChunkedFileReader(io.RawIOBase):
+    """Read-only, seekable view over several files laid end to end."""
+
+    def __init__(self, paths: Sequence[str]):
+        super().__init__()
+        self._paths: List[str] = list(paths)
+        self._starts: List[int] = []
+        total = 0
+        for path in self._paths:
+            self._starts.append(total)
+            total += os.path.getsize(path)
+        self._size = total
+        self._pos = 0
+        self._index = -1
+        self._fh = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self._size or not self._paths:
+            return 0
+        # Last file starting at or before pos (skips empty chunks)
+        index = bisect_right(self._starts, self._pos) - 1
+        if index != self._index:
+            if self._fh:
+                self._fh.close()
+            self._fh = open(self._paths[index], "rb", buffering=0)
+            self._index = index
+        local = self._pos - self._starts[index]
+        end = self._starts[index + 1] if index + 1 < len(self._starts) else self._size
+        view = memoryview(buffer)[:min(len(buffer), end - self._pos)]
+        self._fh.seek(local)
+        n = self._fh.readinto(view) or 0
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        super().close()
+
+
+def open_binary(source: Source) -> io.BufferedIOBase:
+    """Open a path or an ordered list of chunk paths as one binary stream."""
+    if isinstance(source, (list, tuple)):
+        return io.BufferedReader(ChunkedFileReader(source), buffer_size=READ_BUFFER_BYTES)
+    return open(source, "rb")
+
+
+class DecodedText(io.TextIOWrapper):
+    """UTF-8 text stream that counts the replacement characters it returns."""
+
+    replaced = 0
+
+    # Iteration goes through readline() for subclasses, so it is counted there
+    def readline(self, size: int = -1) -> str:
+        line = super().readline(size)
+        self.replaced += line.count(REPLACEMENT_CHAR)
+        return line
+
+    def read(self, size: Optional[int] = -1) -> str:
+        text = super().read(size)
+        self.replaced += text.count(REPLACEMENT_CHAR)
+        return text
+
+
+def decode_text(data: bytes) -> str:
+    """Decode a block of UTF-8 bytes the way :func:`open_text` does."""
+    return data.decode("utf-8", TEXT_ERRORS)
+
+
+def text_stream(binary: IO[bytes]) -> DecodedText:
+    """Text view of a binary stream (``newline=""`` as csv expects, BOM skipped)."""
+    return DecodedText(binary, encoding=TEXT_ENCODING, errors=TEXT_ERRORS, newline="")
+
+
+def open_text(source: Source) -> DecodedText:
+    """UTF-8 text view of :func:`open_binary`; see :func:`text_stream`."""
+    return text_stream(open_binary(source))
+
+
+def source_size(source: Source) -> int:
+    if isinstance(source, (list, tuple)):
+        return sum(os.path.getsize(path) for path in source)
+    return os.path.getsize(source)
+
+
+def describe_source(source: Source) -> str:
+    """Short label for log messages."""
+    if isinstance(source, (list, tuple)):
+        return f"{len(source)} chunks from {os.path.dirname(source[0]) if source else '?'}"
+    return source
@@ -1,24 +1,56 @@
 import csv
 import json
-from typing import Any, Dict
+import logging
+from typing import Any, Dict, Optional
+
+from .chunked_source import Source, describe_source, open_binary, open_text
+from .json_stream import first_significant_byte, flatten_record, iter_json_records, peak_rss_mb
+from .streaming_profiler import StreamingProfiler
+from .xml_stream import detect_record_path, iter_xml_records
+
+logger = logging.getLogger(__name__)
 
 
 class HybridFileAnalyzer:
     """
     Minimal analyzer for uploaded files to support streaming UI flow.
     - CSV: reads a small sample, infers simple column stats
-    - JSON: attempts to parse NDJSON or array and build basic schema
-    - XML: returns stub metadata (can be extended later)
+    - JSON: streams NDJSON or array records (ijson), nested keys become
+      dotted columns
+    - XML: detects the repeating record element and streams records with
+      iterparse; child tags and attributes become columns
+
+    Profile modes:
+    - sample: first ``sample_size`` rows only (fast, approximate)
+    - stream: one full pass in bounded memory with exact counts, type votes,
+      min/max and approximate distinct counts (CSV, JSON, XML)
+    - columnar: full pass with vectorized chunked type inference (CSV, needs
+      pandas); adds float/date/datetime types and per-column confidence
+    - parallel: the stream profile computed on ``workers`` processes over
+      newline-aligned byte ranges (CSV, NDJSON; other layouts use stream)
     """
 
-    def analyze_uploaded_file(self, file_path: str, source_type: str, sample_size: int = 1000, original_filename: str = "") -> Dict[str, Any]:
+    PROFILE_MODES = ("sample", "stream", "columnar", "parallel")
+
+    def analyze_uploaded_file(self, file_path: Source, source_type: str, sample_size: int = 1000, original_filename: str = "", mode: str = "sample", workers: Optional[int] = None) -> Dict[str, Any]:
         source_type = (source_type or "csv").lower()
+        mode = (mode or "sample").lower()
+        if mode not in self.PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        if mode == "parallel" and source_type in ("csv", "json"):
+            if source_type == "csv" or self._is_ndjson(file_path):
+                return self._profile_parallel(file_path, source_type, original_filename, workers)
+            mode = "stream"
         if source_type == "csv":
+            if mode == "columnar":
+                return self._profile_csv_columnar(file_path, original_filename)
+            if mode == "stream":
+                return self._profile_csv(file_path, original_filename)
             return self._analyze_csv(file_path, sample_size, original_filename)
         if source_type == "json":
-            return self._analyze_json(file_path, sample_size, original_filename)
+            return self._analyze_json(file_path, sample_size, original_filename, mode)
         if source_type == "xml":
-            return self._analyze_xml(file_path, sample_size, original_filename)
+            return self._analyze_xml(file_path, sample_size, original_filename, mode)
         # default fallback
         return {
             "original_filename": original_filename,
@@ -30,13 +62,13 @@ class HybridFileAnalyzer:
             "data_quality_score": 100,
         }
 
-    def _analyze_csv(self, file_path: str, sample_size: int, original_filename: str) -> Dict[str, Any]:
+    def _analyze_csv(self, file_path: Source, sample_size: int, original_filename: str) -> Dict[str, Any]:
         rows = 0
         columns = []
         null_counts: Dict[str, int] = {}
         types: Dict[str, str] = {}
         try:
-            with open(file_path, "r", encoding="utf-8", newline="") as f:
+            with open_text(file_path) as f:
                 reader = csv.DictReader(f)
                 columns = reader.fieldnames or []
                 for col in columns:
@@ -65,67 +97,135 @@ class HybridFileAnalyzer:
             "data_quality_score": 100,
         }
 
-    def _analyze_json(self, file_path: str, sample_size: int, original_filename: str) -> Dict[str, Any]:
-        rows = 0
-        columns: Dict[str, str] = {}
-        null_counts: Dict[str, int] = {}
+    def _profile_csv(self, file_path: Source, original_filename: str) -> Dict[str, Any]:
+        with open_text(file_path) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            profiler = StreamingProfiler(self._guess_type, columns=header)
+            for row in reader:
+                if row:
+                    profiler.add_values(row)
+            profiler.replaced_chars = f.replaced
+        return {
+            "original_filename": original_filename,
+            "source_type": "csv",
+            "profile_mode": "stream",
+            **profiler.result(),
+        }
+
+    def _profile_csv_columnar(self, file_path: Source, original_filename: str) -> Dict[str, Any]:
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                first = f.read(1)
-                f.seek(0)
-                if first == "[":
-                    data = json.load(f)
-                    iterable = data if isinstance(data, list) else []
-                else:
-                    iterable = (json.loads(line) for line in f if line.strip())
-                for i, obj in enumerate(iterable):
-                    if i >= sample_size:
-                        break
-                    if isinstance(obj, dict):
-                        rows += 1
-                        for k, v in obj.items():
-                            if k not in columns:
-                                columns[k] = self._guess_type(v)
-                            if v in (None, ""):
-                                null_counts[k] = null_counts.get(k, 0) + 1
-        except Exception:
-            pass
+            from .columnar_inference import ColumnarTypeInferencer
+        except ImportError as e:
+            logger.warning(f"Columnar inference unavailable ({e}), falling back to stream mode")
+            return self._profile_csv(file_path, original_filename)
+        with open_binary(file_path) as f:
+            result = ColumnarTypeInferencer().infer_csv(f)
+        return {
+            "original_filename": original_filename,
+            "source_type": "csv",
+            "profile_mode": "columnar",
+            **result,
+        }
+
+    def _profile_parallel(self, file_path: Source, source_type: str, original_filename: str, workers: Optional[int]) -> Dict[str, Any]:
+        from .parallel_profiler import profile_parallel
+
+        profiler, ranges = profile_parallel(file_path, source_type, self._guess_type, workers)
+        return {
+            "original_filename": original_filename,
+            "source_type": source_type,
+            "profile_mode": "parallel",
+            "ranges": ranges,
+            **profiler.result(),
+        }
+
+    @staticmethod
+    def _is_ndjson(file_path: Source) -> bool:
+        """One JSON object per line (a pretty-printed document is not)."""
+        with open_binary(file_path) as f:
+            if first_significant_byte(f) != b"{":
+                return False
+            for line in f:
+                if line.strip():
+                    try:
+                        return isinstance(json.loads(line), dict)
+                    except ValueError:
+                        return False
+        return False
+
+    def _analyze_json(self, file_path: Source, sample_size: int, original_filename: str, mode: str = "sample") -> Dict[str, Any]:
+        # Columnar inference is CSV-only; JSON always goes through the profiler
+        limit = sample_size if mode == "sample" else None
+        profiler = StreamingProfiler(self._guess_type)
+        try:
+            for i, obj in enumerate(iter_json_records(file_path)):
+                if limit is not None and i >= limit:
+                    break
+                if isinstance(obj, dict):
+                    profiler.add_row(flatten_record(obj))
+        except Exception as e:
+            logger.warning(f"JSON parsing stopped early for {original_filename or describe_source(file_path)}: {e}")
+        result = profiler.result()
+        if mode == "sample":
+            result.pop("profile")
         return {
             "original_filename": original_filename,
             "source_type": "json",
-            "total_rows": rows,
-            "columns": list(columns.keys()),
-            "column_types": columns,
-            "null_counts": null_counts,
-            "data_quality_score": 100,
+            "profile_mode": "sample" if mode == "sample" else "stream",
+            **result,
+            "peak_rss_mb": peak_rss_mb(),
         }
 
-    def _analyze_xml(self, file_path: str, sample_size: int, original_filename: str) -> Dict[str, Any]:
-        # Stub: parsing XML robustly requires more logic; return minimal metadata
+    def _analyze_xml(self, file_path: Source, sample_size: int, original_filename: str, mode: str = "sample") -> Dict[str, Any]:
+        limit = sample_size if mode == "sample" else None
+        profiler = StreamingProfiler(self._guess_type)
+        record_path = None
+        try:
+            record_path = detect_record_path(file_path)
+            if record_path:
+                for i, row in enumerate(iter_xml_records(file_path, record_path)):
+                    if limit is not None and i >= limit:
+                        break
+                    profiler.add_row(row)
+        except Exception as e:
+            logger.warning(f"XML parsing stopped early for {original_filename or describe_source(file_path)}: {e}")
+        result = profiler.result()
+        if mode == "sample":
+            result.pop("profile")
         return {
             "original_filename": original_filename,
             "source_type": "xml",
-            "total_rows": 0,
-            "columns": [],
-            "column_types": {},
-            "null_counts": {},
-            "data_quality_score": 100,
+            "profile_mode": "sample" if mode == "sample" else "stream",
+            "record_element": record_path[-1] if record_path else None,
+            "record_path": "/" + "/".join(record_path) if record_path else None,
+            **result,
         }
 
     def _guess_type(self, value: Any) -> str:
-        if isinstance(value, (int, float)):
-            return "number"
-        s = str(value)
-        try:
-            int(s)
+        if isinstance(value, bool):
+            return "boolean"
+        if isinstance(value, int):
             return "integer"
-        except Exception:
-            pass
-        try:
-            float(s)
+        if isinstance(value, float):
             return "number"
-        except Exception:
-            pass
+        if isinstance(value, (list, dict)):
+            return "array" if isinstance(value, list) else "object"
+        s = str(value)
+        head = s.lstrip()[:1]
+        # Skip the int()/float() attempts (and their exceptions) for text that
+        # cannot be numeric; this is the hot path of full-file profiles
+        if head and (head.isdigit() or head in "+-."):
+            try:
+                int(s)
+                return "integer"
+            except Exception:
+                pass
+            try:
+                float(s)
+                return "number"
+            except Exception:
+                pass
         if s.lower() in ("true", "false"):
             return "boolean"
         return "string"
@@ -0,0 +1,134 @@
+"""Resumable profiling of a file that arrives in ordered byte chunks.
+
+``IncrementalProfile`` consumes raw chunks as they are uploaded, profiles
+every complete record and carries the trailing partial record over to the
+next chunk. Its state is JSON-serializable, so each upload request can load
+it, feed one or more chunks and store it again; finalizing only has to
+close out the carried tail.
+
+Supported layouts are the line-oriented ones: CSV (quoted fields may span
+lines, record boundaries are found by quote parity) and NDJSON.
+"""
+import base64
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, Optional
+
+from .chunked_source import REPLACEMENT_CHAR, decode_text
+from .json_stream import flatten_record
+from .streaming_profiler import StreamingProfiler
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+SUPPORTED_TYPES = ("csv", "json")
+
+
+def _csv_record_cut(buf: bytes) -> int:
+    """Offset just past the last newline that is outside a quoted field (0 if none)."""
+    if b'"' not in buf:
+        return buf.rfind(b"\n") + 1
+    quotes_total = buf.count(b'"')
+    end = len(buf)
+    quotes_after = 0
+    pos = buf.rfind(b"\n")
+    while pos != -1:
+        quotes_after += buf.count(b'"', pos, end)
+        if (quotes_total - quotes_after) % 2 == 0:
+            return pos + 1
+        end = pos
+        pos = buf.rfind(b"\n", 0, pos)
+    return 0
+
+
+class IncrementalProfile:
+    """Streaming profile that can be paused and resumed between chunks."""
+
+    def __init__(self, source_type: str, guess_type: Callable[[Any], str]):
+        if source_type not in SUPPORTED_TYPES:
+            raise ValueError(f"Incremental profiling is not supported for {source_type}")
+        self.source_type = source_type
+        self.guess_type = guess_type
+        self.next_index = 0
+        self.bytes_consumed = 0
+        self.header: Optional[list] = None
+        self.carry = b""
+        # NDJSON only; a JSON array cannot be split on newlines
+        self.unsupported = False
+        self.profiler = StreamingProfiler(guess_type)
+
+    def feed(self, data: bytes) -> None:
+        """Profile all complete records in ``carry + data`` and keep the tail."""
+        if self.unsupported:
+            return
+        # Still at the start of the file while every byte fed so far is carried
+        at_start = self.bytes_consumed == len(self.carry)
+        self.bytes_consumed += len(data)
+        buf = self.carry + data
+        if at_start:
+            # A BOM can be split across chunks: wait until it is complete
+            if len(buf) < len(UTF8_BOM) and UTF8_BOM.startswith(buf):
+                self.carry = buf
+                return
+            if buf.startswith(UTF8_BOM):
+                buf = buf[len(UTF8_BOM):]
+        if self.source_type == "json" and not self.profiler.total_rows and buf.lstrip()[:1] == b"[":
+            self.unsupported = True
+            self.carry = b""
+            return
+        cut = _csv_record_cut(buf) if self.source_type == "csv" else buf.rfind(b"\n") + 1
+        self.carry = buf[cut:]
+        if cut:
+            self._consume(decode_text(buf[:cut]))
+
+    def finish(self) -> None:
+        """Profile the trailing record that had no final newline."""
+        if self.carry and not self.unsupported:
+            tail, self.carry = self.carry, b""
+            self._consume(decode_text(tail))
+
+    def _consume(self, text: str) -> None:
+        if self.source_type == "csv":
+            reader = csv.reader(io.StringIO(text, newline=""))
+            if self.header is None:
+                self.header = next(reader, None)
+                if self.header is None:
+                    return
+                self.profiler = StreamingProfiler(self.guess_type, columns=self.header)
+            for row in reader:
+                if row:
+                    self.profiler.add_values(row)
+        else:
+            # Only "\n" ends a record: str.splitlines() would also split on
+            # U+2028, \x85 etc. inside JSON strings
+            for line in text.split("\n"):
+                if line.strip():
+                    obj = json.loads(line)
+                    if isinstance(obj, dict):
+                        self.profiler.add_row(flatten_record(obj))
+        self.profiler.replaced_chars += text.count(REPLACEMENT_CHAR)
+
+    def result(self) -> Dict[str, Any]:
+        return self.profiler.result()
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "source_type": self.source_type,
+            "next_index": self.next_index,
+            "bytes_consumed": self.bytes_consumed,
+            "header": self.header,
+            "carry": base64.b64encode(self.carry).decode("ascii"),
+            "unsupported": self.unsupported,
+            "profiler": self.profiler.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], guess_type: Callable[[Any], str]) -> "IncrementalProfile":
+        profile = cls(state["source_type"], guess_type)
+        profile.next_index = state["next_index"]
+        profile.bytes_consumed = state["bytes_consumed"]
+        profile.header = state["header"]
+        profile.carry = base64.b64decode(state["carry"])
+        profile.unsupported = state["unsupported"]
+        profile.profiler = StreamingProfiler.from_state(state["profiler"], guess_type)
+        return profile
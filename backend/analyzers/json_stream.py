@@ -0,0 +1,94 @@
+"""Incremental JSON / NDJSON record reader.
+
+Records are pulled one by one with ijson, so a multi-GB top-level array
+never has to be materialized. Nested objects are flattened into dotted
+column paths (``{"user": {"id": 1}}`` -> ``user.id``).
+"""
+import json
+import logging
+import sys
+from typing import Any, Dict, Iterator
+
+from .chunked_source import Source, open_binary, open_text
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = b" \t\r\n"
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+def flatten_record(obj: Dict[str, Any], prefix: str = "", sep: str = ".") -> Dict[str, Any]:
+    """Flatten nested dicts into dotted keys; lists are kept as leaf values."""
+    flat: Dict[str, Any] = {}
+    for key, value in obj.items():
+        path = f"{prefix}{sep}{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flat.update(flatten_record(value, path, sep))
+        else:
+            flat[path] = value
+    return flat
+
+
+def first_significant_byte(f) -> bytes:
+    """First non-whitespace byte of a binary file (BOM skipped); rewinds ``f``."""
+    head = f.read(4096)
+    f.seek(0)
+    if head.startswith(UTF8_BOM):
+        head = head[len(UTF8_BOM):]
+    stripped = head.lstrip(WHITESPACE)
+    return stripped[:1]
+
+
+def iter_json_records(file_path: Source) -> Iterator[Any]:
+    """
+    Yield top-level records from a JSON array file or an NDJSON file.
+
+    ``[...]`` yields array elements; anything else is read as a stream of
+    concatenated top-level values, which covers NDJSON and single objects.
+    """
+    try:
+        import ijson
+    except ImportError:
+        logger.warning("ijson is not installed, falling back to json module")
+        yield from _iter_json_records_stdlib(file_path)
+        return
+
+    with open_binary(file_path) as f:
+        first = first_significant_byte(f)
+        # ijson rejects a UTF-8 BOM as an invalid character
+        if f.read(len(UTF8_BOM)) != UTF8_BOM:
+            f.seek(0)
+        if first == b"[":
+            yield from ijson.items(f, "item", use_float=True)
+        else:
+            yield from ijson.items(f, "", multiple_values=True, use_float=True)
+
+
+def _iter_json_records_stdlib(file_path: Source) -> Iterator[Any]:
+    with open_text(file_path) as f:
+        # Same check as first_significant_byte; open_text already skips a BOM
+        first = f.read(4096).lstrip(WHITESPACE.decode("ascii"))[:1]
+        f.seek(0)
+        if first == "[":
+            data = json.load(f)
+            yield from (data if isinstance(data, list) else [])
+            return
+        for line in f:
+            line = line.lstrip("\ufeff")
+            if line.strip():
+                yield json.loads(line)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (0.0 if unavailable)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
@@ -0,0 +1,181 @@
+"""Multi-core profiling of line-oriented files (CSV, NDJSON).
+
+The file is cut into newline-aligned byte ranges, each range is profiled
+with a StreamingProfiler in a worker process and the partial profiles are
+merged: counts and type votes add up, min/max combine and HyperLogLog
+sketches merge register-wise, so the result equals a single-pass profile
+(distinct counts stay approximate).
+
+Workers come from one process-wide pool started with the ``forkserver``
+method (``spawn`` where it is unavailable): the API process runs job,
+janitor and log threads, and forking it could copy a lock held by one of
+them into the child.
+
+Limitation: CSV ranges are cut on raw newlines, so quoted fields that
+contain line breaks are not supported in parallel mode.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .chunked_source import REPLACEMENT_CHAR, Source, decode_text, open_binary, source_size, text_stream
+from .json_stream import UTF8_BOM, flatten_record
+from .streaming_profiler import StreamingProfiler
+
+# Ranges smaller than this are not worth a process hop
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+READ_BLOCK_BYTES = 8 * 1024 * 1024
+
+# fork is unsafe in a multi-threaded server process
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Process-wide worker pool, created on first use and reused afterwards.
+
+    ``max_workers`` (default: CPU count) only applies to the call that
+    creates the pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+        return _pool
+
+
+def split_ranges(file_path: Source, parts: int, start: int = 0) -> List[Tuple[int, int]]:
+    """Split ``[start, EOF)`` into at most ``parts`` ranges that begin at line starts."""
+    size = source_size(file_path)
+    if size <= start:
+        return []
+    step = max((size - start) // max(parts, 1), 1)
+    bounds = [start]
+    with open_binary(file_path) as f:
+        for i in range(1, parts):
+            pos = start + i * step
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos - 1)
+            # Reading from pos - 1 keeps a range that already starts on a
+            # line boundary from skipping that whole line
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _iter_range_text(file_path: Source, start: int, end: int) -> Iterator[str]:
+    """Yield decoded blocks of complete lines from ``[start, end)``."""
+    with open_binary(file_path) as f:
+        f.seek(start)
+        remaining = end - start
+        carry = b""
+        while remaining > 0:
+            block = f.read(min(READ_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            block = carry + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0 and remaining > 0:
+                carry = block
+                continue
+            carry = block[cut:] if remaining > 0 else b""
+            yield decode_text(block[:cut] if remaining > 0 else block)
+        if carry:
+            yield decode_text(carry)
+
+
+def _profile_range(file_path: Source, source_type: str, start: int, end: int,
+                   guess_type: Callable[[Any], str], header: Optional[Sequence[str]]) -> StreamingProfiler:
+    profiler = StreamingProfiler(guess_type, columns=header)
+    for text in _iter_range_text(file_path, start, end):
+        profiler.replaced_chars += text.count(REPLACEMENT_CHAR)
+        if source_type == "csv":
+            # newline="" keeps csv's own record splitting: str.splitlines()
+            # would also break on \x0c, \x85, U+2028 etc. inside quoted fields
+            for row in csv.reader(io.StringIO(text, newline="")):
+                if row:
+                    profiler.add_values(row)
+        else:
+            for line in text.split("\n"):
+                if line.strip():
+                    obj = json.loads(line)
+                    if isinstance(obj, dict):
+                        profiler.add_row(flatten_record(obj))
+    return profiler
+
+
+def read_csv_header(file_path: Source) -> Tuple[List[str], int]:
+    """Return the CSV header and the byte offset where data rows start."""
+    with open_binary(file_path) as f:
+        first_line = f.readline()
+    header = next(csv.reader(text_stream(io.BytesIO(first_line))), [])
+    return header, len(first_line)
+
+
+def data_start(file_path: Source) -> int:
+    """Byte offset of the first record of an NDJSON file (past a UTF-8 BOM)."""
+    with open_binary(file_path) as f:
+        return len(UTF8_BOM) if f.read(len(UTF8_BOM)) == UTF8_BOM else 0
+
+
+def profile_parallel(file_path: Source, source_type: str, guess_type: Callable[[Any], str],
+                     workers: Optional[int] = None) -> Tuple[StreamingProfiler, int]:
+    """
+    Profile a CSV or NDJSON file split into up to ``workers`` ranges.
+
+    Ranges run on the shared pool (see ``get_process_pool``), so concurrent
+    calls never start more processes than the pool holds.
+
+    Returns the merged profiler and the number of ranges that were used.
+    """
+    workers = workers or os.cpu_count() or 1
+    header, start = read_csv_header(file_path) if source_type == "csv" else (None, data_start(file_path))
+    size = source_size(file_path)
+    parts = max(1, min(workers, (size - start) // MIN_RANGE_BYTES))
+    ranges = split_ranges(file_path, parts, start)
+    # The header line is decoded here, outside of every range
+    header_replaced = sum(name.count(REPLACEMENT_CHAR) for name in header or [])
+
+    if len(ranges) <= 1:
+        merged = StreamingProfiler(guess_type, columns=header)
+        merged.replaced_chars = header_replaced
+        for range_start, range_end in ranges:
+            merged.merge(_profile_range(file_path, source_type, range_start, range_end, guess_type, header))
+        return merged, len(ranges)
+
+    pool = get_process_pool()
+    futures = [
+        pool.submit(_profile_range, file_path, source_type, range_start, range_end, guess_type, header)
+        for range_start, range_end in ranges
+    ]
+    try:
+        # Merge in file order so dynamically discovered columns keep their order
+        partials = [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    merged = partials[0]
+    merged.replaced_chars += header_replaced
+    for partial in partials[1:]:
+        merged.merge(partial)
+    return merged, len(ranges)
@@ -0,0 +1,128 @@
+"""Content-addressed cache of analysis results in a local SQLite file.
+
+Entries are keyed by the SHA-256 of the analyzed bytes plus the parameters
+that change the answer (source type, profile mode and, for sampled
+profiles, the sample size), so re-uploading the same dataset returns the
+stored profile without reading the file again.
+
+Values are zlib-compressed JSON. The file is bounded by ``max_bytes``:
+when a write pushes the total over the cap, least recently used entries
+are dropped first. SQLite runs in WAL mode, so several API processes can
+share one cache file.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .chunked_source import Source, open_binary
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Modes whose result depends on sample_size; full-pass modes ignore it
+SAMPLED_MODES = ("sample",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS analysis_cache_lru ON analysis_cache (last_access);
+"""
+
+
+def hash_source(source: Source) -> str:
+    """
+    Streaming SHA-256 of a file or of ordered chunk files read as one stream.
+
+    Matches the digest of the same bytes uploaded in one piece, so a file
+    gets one cache entry however it was uploaded.
+    """
+    digest = hashlib.sha256()
+    with open_binary(source) as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+class AnalysisCache:
+    """SQLite-backed LRU cache of analyzer results with a size cap."""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection that commits (or rolls back) and is closed on exit."""
+        # sqlite3.Connection as a context manager only ends the transaction
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(content_hash: str, source_type: str, mode: str, sample_size: int) -> str:
+        if mode not in SAMPLED_MODES:
+            sample_size = 0
+        return f"{content_hash}|{source_type}|{mode}|{sample_size}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE analysis_cache SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        blob = zlib.compress(json.dumps(value, default=str).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, blob, len(blob), now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM analysis_cache ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM analysis_cache WHERE key = ?", stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, size, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM analysis_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": hits, "max_bytes": self.max_bytes}
@@ -0,0 +1,119 @@
+"""Streaming XML record reader built on ``ElementTree.iterparse``.
+
+The repeating record element is detected from a bounded prefix of the
+document, then records are yielded one at a time as flat dicts. Every
+finished element outside the current record is cleared and detached from
+its parent, so memory stays flat for multi-GB exports.
+
+Column naming inside a record:
+- ``@attr`` for record attributes, ``child@attr`` for child attributes
+- ``child`` for leaf text, ``child.grandchild`` for nested elements
+- repeated leaf tags are collected into a list
+"""
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .chunked_source import Source, open_binary
+
+# Start/end events inspected when guessing the record element
+DETECT_EVENTS = 20000
+
+
+def local_name(tag: str) -> str:
+    """Strip an ElementTree ``{namespace}`` prefix."""
+    return tag.rsplit("}", 1)[-1] if tag.startswith("{") else tag
+
+
+def detect_record_path(file_path: Source, max_events: int = DETECT_EVENTS) -> Optional[Tuple[str, ...]]:
+    """
+    Guess the record element path, e.g. ``("export", "items", "item")``.
+
+    Picks the shallowest element path that repeats within the prefix (the
+    most frequent one on ties). A document with a single child under the
+    root treats that child as the only record.
+    """
+    counts: Counter = Counter()
+    path = []
+    events = 0
+    with open_binary(file_path) as f:
+        try:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    path.append(local_name(elem.tag))
+                    counts[tuple(path)] += 1
+                else:
+                    path.pop()
+                    elem.clear()
+                events += 1
+                if events >= max_events:
+                    break
+        except ET.ParseError:
+            # Truncated or broken tail: decide on what was read so far
+            pass
+
+    below_root = [p for p in counts if len(p) >= 2]
+    if not below_root:
+        return None
+    repeated = [p for p in below_root if counts[p] > 1]
+    candidates = repeated or [p for p in below_root if len(p) == 2]
+    return min(candidates, key=lambda p: (len(p), -counts[p]))
+
+
+def _add_value(row: Dict[str, Any], key: str, value: Any) -> None:
+    if key not in row:
+        row[key] = value
+    elif isinstance(row[key], list):
+        row[key].append(value)
+    else:
+        row[key] = [row[key], value]
+
+
+def _flatten_element(elem: ET.Element, path: str, row: Dict[str, Any]) -> None:
+    for name, value in elem.attrib.items():
+        row[f"{path}@{local_name(name)}"] = value
+    if len(elem):
+        for child in elem:
+            _flatten_element(child, f"{path}.{local_name(child.tag)}", row)
+    else:
+        _add_value(row, path, (elem.text or "").strip())
+
+
+def record_to_dict(elem: ET.Element) -> Dict[str, Any]:
+    """Flatten one record element into a column -> value dict."""
+    row: Dict[str, Any] = {}
+    for name, value in elem.attrib.items():
+        row[f"@{local_name(name)}"] = value
+    if len(elem):
+        for child in elem:
+            _flatten_element(child, local_name(child.tag), row)
+    else:
+        text = (elem.text or "").strip()
+        if text:
+            row["#text"] = text
+    return row
+
+
+def iter_xml_records(file_path: Source, record_path: Tuple[str, ...]) -> Iterator[Dict[str, Any]]:
+    """Yield every record at ``record_path`` as a flat dict, releasing it afterwards."""
+    depth = len(record_path)
+    path = []
+    stack = []
+    with open_binary(file_path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                path.append(local_name(elem.tag))
+                stack.append(elem)
+                continue
+
+            inside_record = len(path) > depth and tuple(path[:depth]) == record_path
+            if not inside_record:
+                if tuple(path) == record_path:
+                    yield record_to_dict(elem)
+                elem.clear()
+                if len(stack) > 1:
+                    # Drop finished siblings so the parent does not keep
+                    # one empty element per record alive
+                    del stack[-2][:]
+            path.pop()
+            stack.pop()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+from django.apps import AppConfig
+
+# Процессы, которые обслуживают запросы: только в них есть смысл прогревать LLMIntegration
+SERVER_ENTRYPOINTS = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi')
+
+
+def is_server_process() -> bool:
+    """Процесс запущен сервером приложений или runserver (не migrate, shell, collectstatic ...)"""
+    argv = sys.argv or ['']
+    if os.path.basename(argv[0]) in SERVER_ENTRYPOINTS:
+        return True
+    if len(argv) > 1 and argv[1] == 'runserver':
+        # Родительский процесс автоперезагрузки запросы не обслуживает
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return False
+
+
+class AgentsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.agents"
+
+    def ready(self):
+        # Конфиги, промпты и исполнители этапов загружаются один раз при старте сервера;
+        # в остальных процессах - лениво при первом обращении к get_integration().
+        # MAS_PRELOAD: auto (по умолчанию), true - всегда, false - никогда
+        preload = os.getenv('MAS_PRELOAD', 'auto').lower()
+        if preload == 'true' or (preload == 'auto' and is_server_process()):
+            from .integration import get_integration
+            get_integration()
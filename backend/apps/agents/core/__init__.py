@@ -5,9 +5,16 @@
 from .state import MASState
 from .llm_manager import LLMManager
 from .agent_executor import AgentExecutor
+from .stage_graph import Stage, StageGraph
+from .session_store import SessionStore, SessionConflict, get_session_store
 
 __all__ = [
     'MASState',
     'LLMManager',
-    'AgentExecutor'
+    'AgentExecutor',
+    'Stage',
+    'StageGraph',
+    'SessionStore',
+    'SessionConflict',
+    'get_session_store'
 ]
@@ -0,0 +1,260 @@
+"""
+Контроль допуска запросов к Ollama на процесс
+
+Все этапы и запросы процесса идут к одному серверу Ollama. Контроллер
+ограничивает число одновременных запросов к каждой модели (как
+OLLAMA_NUM_PARALLEL на сервере), остальные ждут в очереди с приоритетом:
+интерактивные запросы (analyze_with_feedback, потоковый анализ) допускаются
+раньше пакетных, внутри приоритета - по порядку поступления.
+
+Ждать слота могут и потоки (invoke), и корутины любого event loop
+(ainvoke/astream): очередь общая, слот передается ожидающему напрямую.
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {'interactive': 0, 'batch': 1}
+DEFAULT_PRIORITY = 'batch'
+
+
+class AdmissionTimeout(TimeoutError):
+    """Слот модели не освободился за queue_timeout"""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным джиттером: U(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class _Waiter:
+    __slots__ = ('priority', 'enqueued_at', 'event', 'loop', 'future', 'granted', 'cancelled')
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class _ModelQueue:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.heap: List[tuple] = []
+        self.queued = {name: 0 for name in PRIORITIES}
+        self.admitted = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class AdmissionController:
+    """Лимит одновременных запросов на модель с приоритетной очередью ожидания"""
+
+    def __init__(self,
+                 max_in_flight_per_model: int = 2,
+                 per_model: Optional[Dict[str, int]] = None,
+                 queue_timeout: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self.configure(max_in_flight_per_model, per_model, queue_timeout)
+
+    def configure(self,
+                  max_in_flight_per_model: int = 2,
+                  per_model: Optional[Dict[str, int]] = None,
+                  queue_timeout: Optional[float] = None):
+        """Новые лимиты действуют сразу (запросы в работе дорабатывают)"""
+        with self._lock:
+            self.max_in_flight = max(int(max_in_flight_per_model), 1)
+            self.per_model = {name: max(int(limit), 1) for name, limit in (per_model or {}).items()}
+            self.queue_timeout = queue_timeout
+            for model, queue in self._queues.items():
+                queue.limit = self.per_model.get(model, self.max_in_flight)
+                self._grant(queue)
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(self.per_model.get(model, self.max_in_flight))
+        return queue
+
+    # --- допуск ---
+
+    def _enter(self, model: str, priority: str, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Занять слот сразу (None) или встать в очередь (ожидающий)"""
+        priority = priority if priority in PRIORITIES else DEFAULT_PRIORITY
+        with self._lock:
+            queue = self._queue(model)
+            if queue.in_flight < queue.limit and not queue.heap:
+                queue.in_flight += 1
+                self._record_wait(queue, 0.0)
+                return None
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(queue.heap, (PRIORITIES[priority], next(self._seq), waiter))
+            queue.queued[priority] += 1
+            return waiter
+
+    def _grant(self, queue: _ModelQueue):
+        """Передать освободившиеся слоты ожидающим (под self._lock)"""
+        while queue.heap and queue.in_flight < queue.limit:
+            _, _, waiter = heapq.heappop(queue.heap)
+            if waiter.cancelled:
+                continue
+            queue.queued[waiter.priority] -= 1
+            waiter.granted = True
+            queue.in_flight += 1
+            self._record_wait(queue, time.monotonic() - waiter.enqueued_at)
+            if waiter.event is not None:
+                waiter.event.set()
+                continue
+            try:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                # event loop ожидающего уже закрыт
+                waiter.cancelled = True
+                queue.in_flight -= 1
+
+    def _abandon(self, model: str, waiter: _Waiter):
+        """Ожидание прервано: убрать из очереди или вернуть уже выданный слот"""
+        with self._lock:
+            queue = self._queue(model)
+            if waiter.granted:
+                queue.in_flight -= 1
+                self._grant(queue)
+            elif not waiter.cancelled:
+                # Запись остается в куче до извлечения, в глубине очереди - нет
+                waiter.cancelled = True
+                queue.queued[waiter.priority] -= 1
+
+    def _timed_out(self, model: str, waited: float) -> AdmissionTimeout:
+        with self._lock:
+            self._queue(model).timeouts += 1
+        logger.warning(f"Слот модели {model} не освободился за {waited:.1f} с")
+        return AdmissionTimeout(f"Модель {model} занята: нет свободного слота за {waited:.1f} с")
+
+    def acquire(self, model: str, priority: str = DEFAULT_PRIORITY, timeout: Optional[float] = None):
+        """Занять слот модели, ожидая в текущем потоке"""
+        timeout = timeout if timeout is not None else self.queue_timeout
+        waiter = self._enter(model, priority, None)
+        if waiter is None:
+            return
+        try:
+            if not waiter.event.wait(timeout):
+                raise self._timed_out(model, time.monotonic() - waiter.enqueued_at)
+        except BaseException:
+            self._abandon(model, waiter)
+            raise
+
+    async def acquire_async(self, model: str, priority: str = DEFAULT_PRIORITY, timeout: Optional[float] = None):
+        """Занять слот модели, не блокируя event loop (отмена задачи снимает ее с очереди)"""
+        timeout = timeout if timeout is not None else self.queue_timeout
+        waiter = self._enter(model, priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            self._abandon(model, waiter)
+            raise self._timed_out(model, time.monotonic() - waiter.enqueued_at)
+        except BaseException:
+            self._abandon(model, waiter)
+            raise
+
+    def release(self, model: str):
+        with self._lock:
+            queue = self._queue(model)
+            queue.in_flight -= 1
+            self._grant(queue)
+
+    @contextlib.contextmanager
+    def slot(self, model: str, priority: str = DEFAULT_PRIORITY):
+        self.acquire(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, model: str, priority: str = DEFAULT_PRIORITY):
+        await self.acquire_async(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    # --- метрики ---
+
+    @staticmethod
+    def _record_wait(queue: _ModelQueue, waited: float):
+        queue.admitted += 1
+        queue.wait_total += waited
+        queue.wait_max = max(queue.wait_max, waited)
+
+    def record_retry(self, model: str):
+        with self._lock:
+            self._queue(model).retries += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очереди, занятые слоты и время ожидания по моделям"""
+        with self._lock:
+            models = {
+                model: {
+                    'limit': queue.limit,
+                    'in_flight': queue.in_flight,
+                    'queue_depth': sum(queue.queued.values()),
+                    'queued': dict(queue.queued),
+                    'admitted': queue.admitted,
+                    'timeouts': queue.timeouts,
+                    'retries': queue.retries,
+                    'wait_seconds_total': round(queue.wait_total, 3),
+                    'wait_seconds_avg': round(queue.wait_total / queue.admitted, 3) if queue.admitted else 0.0,
+                    'wait_seconds_max': round(queue.wait_max, 3),
+                }
+                for model, queue in self._queues.items()
+            }
+        return {
+            'max_in_flight_per_model': self.max_in_flight,
+            'queue_timeout': self.queue_timeout,
+            'models': models,
+        }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller(config: Optional[Dict[str, Any]] = None) -> AdmissionController:
+    """
+    Контроллер процесса; config (секция llm_config.admission) применяется
+    к уже созданному контроллеру, чтобы перезагрузка конфигурации меняла лимиты
+    """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        if config is not None:
+            _controller.configure(
+                config.get('max_in_flight_per_model', 2),
+                config.get('per_model'),
+                config.get('queue_timeout'),
+            )
+        return _controller
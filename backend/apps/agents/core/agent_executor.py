@@ -2,20 +2,34 @@
 Исполнитель ИИ-инженера
 """
 import os
-import yaml
 import json
+import time
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+import contextlib
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from pathlib import Path
 from datetime import datetime
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, message_chunk_to_message
 from langchain_core.runnables import RunnableConfig
 
+from .agent_log import AgentLogWriter, get_agent_log_writer
+from .config_cache import load_yaml, mas_temp_dir
+from .context_builder import ContextBuilder, estimate_tokens
 from .llm_manager import LLMManager
+from .metrics import get_stage_metrics
+from .rule_engine import RuleEngine
+from .schema_cache import STAGE_FIELDS, Schema, extract_schema
 from .state import MASState
+from .structured_output import PARSED_STAGES, StructuredOutputError, parse_stage_output
 
 logger = logging.getLogger(__name__)
 
+# Статистика одного запуска этапа (сбрасывается перед каждым запуском)
+_RUN_STATS = ('started_at', 'wall_seconds', 'queue_wait_seconds', 'llm_seconds', 'first_token_seconds',
+              'retries', 'cache', 'completion_tokens', 'tokens_per_second', 'outcome', 'model', 'structured', 'source')
+_SECONDS_STATS = ('wall_seconds', 'queue_wait_seconds', 'llm_seconds', 'first_token_seconds')
+
 
 class AgentExecutor:
     """
@@ -45,20 +59,37 @@ class AgentExecutor:
         # Загружаем промпт для агента (из объединенного файла секций)
         self.prompt = self._load_prompt()
         
-        # Получаем LLM для агента
-        self.llm = self.llm_manager.get_llm(agent_name)
+        # Контекст промпта собирается в пределах бюджета токенов (agents_config.context)
+        self.context_builder = ContextBuilder(self.general_config.get('agents_config', {}).get('context'))
+        
+        # Ответы по правилам, когда Ollama недоступна
+        self.rule_engine = RuleEngine(self.general_config)
         
         # Директории для логов и временных файлов
         self.logs_dir = self.base_dir / 'logs'
-        self.temp_dir = Path('/tmp/mas_temp')
+        # Каталог чистит apps.api.janitor (MAS_TEMP_TTL_SECONDS / MAS_TEMP_MAX_BYTES)
+        self.temp_dir = Path(mas_temp_dir(self.general_config))
         self._ensure_directories()
     
+    @property
+    def llm(self):
+        """
+        LLM для агента: берется у менеджера при каждом вызове (словарь в памяти),
+        поэтому долгоживущий исполнитель подхватит Ollama, поднявшуюся позже
+        """
+        return self.llm_manager.get_llm(self.agent_name)
+    
+    @property
+    def timeout(self) -> Optional[float]:
+        """Таймаут этапа из agents_config.timeouts (секунды, None - без ограничения)"""
+        value = self.general_config.get('agents_config', {}).get('timeouts', {}).get(self.agent_name)
+        return float(value) if value else None
+    
     def _load_general_config(self) -> Dict[str, Any]:
         """Загрузка общей конфигурации"""
         config_path = self.base_dir / 'config' / 'general_config.yaml'
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return load_yaml(config_path) or {}
         except Exception as e:
             logger.error(f"Ошибка загрузки конфигурации: {e}")
             return {}
@@ -68,12 +99,11 @@ class AgentExecutor:
         unified_path = self.base_dir / 'config' / 'prompts' / 'unified_prompt.yaml'
         if unified_path.exists():
             try:
-                with open(unified_path, 'r', encoding='utf-8') as f:
-                    unified = yaml.safe_load(f)
-                    sections = unified.get('sections', {}) if isinstance(unified, dict) else {}
-                    section = sections.get(self.agent_name)
-                    if section:
-                        return self._transform_prompt(section)
+                unified = load_yaml(unified_path)
+                sections = unified.get('sections', {}) if isinstance(unified, dict) else {}
+                section = sections.get(self.agent_name)
+                if section:
+                    return self._transform_prompt(section)
             except Exception as e:
                 logger.error(f"Ошибка загрузки unified промпта: {e}")
         
@@ -81,9 +111,7 @@ class AgentExecutor:
         legacy_path = self.base_dir / 'config' / 'prompts' / f'{self.agent_name}_prompt.yaml'
         if legacy_path.exists():
             try:
-                with open(legacy_path, 'r', encoding='utf-8') as f:
-                    prompt_config = yaml.safe_load(f)
-                    return self._transform_prompt(prompt_config)
+                return self._transform_prompt(load_yaml(legacy_path))
             except Exception as e:
                 logger.error(f"Ошибка загрузки промпта для {self.agent_name}: {e}")
         
@@ -160,42 +188,292 @@ class AgentExecutor:
         """
         logger.info(f"Выполнение агента: {self.agent_name}")
         
-        # Подготовка сообщений для LLM
-        messages = self._prepare_messages(state)
+        with self._instrument(state) as stats:
+            # Подготовка сообщений для LLM
+            messages = self._prepare_messages(state)
+            
+            # Логирование входных данных
+            self._log_input(state, messages)
+            
+            try:
+                use_cache = state.get('use_llm_cache', True) is not False
+                llm = self.llm
+                stats['model'] = self._model_name(llm)
+                
+                # Структурно такой же источник уже разбирался - берем готовый ответ этапа
+                schema_context, cached = self._lookup_schema_cache(state, llm, use_cache)
+                
+                rule_response = self._rule_based_response(state, llm)
+                
+                if cached:
+                    response = cached[0]
+                elif rule_response:
+                    response = rule_response
+                else:
+                    # Вызов LLM
+                    response = self.llm_manager.invoke_with_retry(
+                        llm, messages, use_cache=use_cache, priority=state.get('priority', 'batch'), stats=stats
+                    )
+                
+                return self._complete(state, response, schema_context, cached)
+                
+            except Exception as e:
+                return self._record_error(state, e)
+    
+    async def aexecute(self, state: MASState) -> Dict[str, Any]:
+        """
+        Асинхронное выполнение агента через llm.ainvoke
         
-        # Логирование входных данных
-        self._log_input(messages)
+        Вызов модели ограничен таймаутом этапа (agents_config.timeouts):
+        по истечении запрос к Ollama отменяется, а ошибка пишется в errors.
+        Отмена задачи (отключение клиента) пробрасывается вызывающему.
         
-        try:
-            # Вызов LLM
-            response = self.llm_manager.invoke_with_retry(self.llm, messages)
-            
-            # Логирование ответа
-            self._log_response(response)
+        Args:
+            state: Текущее состояние МАС
             
-            # Обработка ответа и обновление состояния
-            updated_state = self._process_response(state, response)
+        Returns:
+            Обновленное состояние
+        """
+        logger.info(f"Асинхронное выполнение агента: {self.agent_name}")
+        
+        with self._instrument(state) as stats:
+            messages = self._prepare_messages(state)
+            self._log_input(state, messages)
             
-            # Сохранение промежуточных результатов
-            if self.general_config.get('agents_config', {}).get('save_intermediate', True):
-                self._save_intermediate_results(updated_state)
+            try:
+                use_cache = state.get('use_llm_cache', True) is not False
+                llm = await self.llm_manager.aget_llm(self.agent_name)
+                stats['model'] = self._model_name(llm)
+                schema_context, cached = self._lookup_schema_cache(state, llm, use_cache)
+                
+                rule_response = self._rule_based_response(state, llm)
+                
+                if cached:
+                    response = cached[0]
+                elif rule_response:
+                    response = rule_response
+                else:
+                    response = await asyncio.wait_for(
+                        self.llm_manager.ainvoke_with_retry(
+                            llm, messages, use_cache=use_cache, priority=state.get('priority', 'batch'), stats=stats
+                        ),
+                        timeout=self.timeout
+                    )
+                
+                return self._complete(state, response, schema_context, cached)
+                
+            except asyncio.TimeoutError:
+                return self._record_error(state, self._timeout_error())
+            except Exception as e:
+                return self._record_error(state, e)
+    
+    async def astream(self, state: MASState) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковое выполнение агента через llm.astream
+        
+        Фрагменты ответа отдаются по мере генерации; по окончании состояние
+        обновлено так же, как после execute (state меняется на месте).
+        Таймаут этапа считается от начала генерации, как в aexecute.
+        
+        Args:
+            state: Текущее состояние МАС
             
-            return updated_state
+        Yields:
+            {'event': 'token', 'stage': ..., 'content': ...}
+        """
+        logger.info(f"Потоковое выполнение агента: {self.agent_name}")
+        
+        with self._instrument(state) as stats:
+            messages = self._prepare_messages(state)
+            self._log_input(state, messages)
             
+            try:
+                use_cache = state.get('use_llm_cache', True) is not False
+                llm = await self.llm_manager.aget_llm(self.agent_name)
+                stats['model'] = self._model_name(llm)
+                schema_context, cached = self._lookup_schema_cache(state, llm, use_cache)
+                
+                rule_response = self._rule_based_response(state, llm)
+                
+                if cached or rule_response:
+                    response = cached[0] if cached else rule_response
+                    yield {'event': 'token', 'stage': self.agent_name, 'content': response.content}
+                else:
+                    full = None
+                    loop = asyncio.get_running_loop()
+                    deadline = loop.time() + self.timeout if self.timeout else None
+                    chunks = self.llm_manager.astream_with_retry(
+                        llm, messages, use_cache=use_cache, priority=state.get('priority', 'batch'), stats=stats
+                    )
+                    try:
+                        while True:
+                            remaining = max(deadline - loop.time(), 0) if deadline else None
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                            except StopAsyncIteration:
+                                break
+                            full = chunk if full is None else full + chunk
+                            if chunk.content:
+                                yield {'event': 'token', 'stage': self.agent_name, 'content': chunk.content}
+                    finally:
+                        await chunks.aclose()
+                    if full is None:
+                        raise ValueError("LLM вернула пустой поток")
+                    response = message_chunk_to_message(full)
+                
+                self._complete(state, response, schema_context, cached)
+                
+            except asyncio.TimeoutError:
+                self._record_error(state, self._timeout_error())
+            except Exception as e:
+                self._record_error(state, e)
+    
+    @contextlib.contextmanager
+    def _instrument(self, state: MASState):
+        """
+        Статистика запуска этапа в execution_stats['stages'][agent_name]
+        
+        Время этапа (wall_seconds), ожидание слота модели, время вызовов
+        модели, повторы и кэш заполняет LLMManager, токены ответа - _complete.
+        Значения прошлого запуска этапа (повтор шага сессии) сбрасываются;
+        по завершении запуск учитывается в метриках процесса (/api/v1/metrics).
+        """
+        stats = self._stage_stats(state)
+        for key in _RUN_STATS:
+            stats.pop(key, None)
+        stats['started_at'] = datetime.now().isoformat()
+        errors_before = len(state.get('errors') or [])
+        started = time.monotonic()
+        # Исключение или отмена изнутри этапа (ошибки LLM пишутся в errors)
+        outcome = 'cancelled'
+        try:
+            yield stats
+            outcome = 'error' if len(state.get('errors') or []) > errors_before else 'ok'
+        finally:
+            stats['wall_seconds'] = time.monotonic() - started
+            stats['outcome'] = outcome
+            for key in _SECONDS_STATS:
+                if key in stats:
+                    stats[key] = round(stats[key], 3)
+            get_stage_metrics().observe(self.agent_name, stats, outcome)
+    
+    @staticmethod
+    def _model_name(llm: Any) -> str:
+        return getattr(llm, 'model', None) or llm.__class__.__name__
+    
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(f"Этап {self.agent_name} не уложился в таймаут {self.timeout:g} с")
+    
+    def _rule_based_response(self, state: MASState, llm: Any) -> Optional[AIMessage]:
+        """
+        Ответ этапа по правилам (RuleEngine) вместо заглушки, если Ollama недоступна
+        
+        None - модель доступна или для этапа нет правил.
+        """
+        if not self.llm_manager.is_fallback(llm):
+            return None
+        try:
+            response = self.rule_engine.response(self.agent_name, state)
+        except ValueError:
+            return None
+        logger.warning(f"Ollama недоступна, ответ этапа {self.agent_name} построен по правилам")
+        stats = self._stage_stats(state)
+        stats['model'] = 'rules'
+        stats['source'] = 'rules'
+        state.setdefault('warnings', []).append({
+            'agent': self.agent_name,
+            'warning': "LLM недоступна, ответ построен по правилам без модели",
+            'timestamp': datetime.now().isoformat()
+        })
+        return response
+    
+    def _lookup_schema_cache(self, state: MASState, llm: Any, use_cache: bool) -> Tuple[Optional[Tuple[str, Schema]], Optional[Tuple]]:
+        """Контекст кэша по схеме и найденная запись (ответ, поля, сходство)"""
+        schema_context = self._schema_cache_context(state, llm) if use_cache else None
+        cached = None
+        if schema_context:
+            try:
+                cached = self.llm_manager.schema_cache.lookup(*schema_context)
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша по схеме для {self.agent_name}: {e}")
+        if cached:
+            logger.info(f"Ответ этапа {self.agent_name} взят из кэша по схеме (сходство {cached[2]:.2f})")
+        return schema_context, cached
+    
+    def _complete(self,
+                  state: MASState,
+                  response: Any,
+                  schema_context: Optional[Tuple[str, Schema]],
+                  cached: Optional[Tuple]) -> MASState:
+        """Обработка полученного ответа: лог, состояние, кэш по схеме, промежуточные результаты"""
+        # Логирование ответа
+        self._log_response(state, response)
+        
+        # Фактическое число токенов (у ответов из кэша - от исходного вызова,
+        # поэтому в статистику запуска не идут)
+        stats = self._stage_stats(state)
+        usage = getattr(response, 'usage_metadata', None)
+        metadata = getattr(response, 'response_metadata', None) or {}
+        if cached:
+            stats['cache'] = 'schema'
+        elif not metadata.get('llm_cache') and not metadata.get('rule_based'):
+            if usage:
+                stats.setdefault('prompt_tokens', {})['actual'] = usage.get('input_tokens')
+            content = response.content if isinstance(getattr(response, 'content', None), str) else str(response)
+            stats['completion_tokens'] = (usage or {}).get('output_tokens') or estimate_tokens(content)
+            if stats.get('llm_seconds'):
+                stats['tokens_per_second'] = round(stats['completion_tokens'] / stats['llm_seconds'], 1)
+        
+        # Обработка ответа и обновление состояния
+        updated_state = self._process_response(state, response)
+        
+        if cached:
+            for name, value in cached[1].items():
+                if value is not None:
+                    updated_state[name] = value
+        elif schema_context:
+            self._store_schema_cache(schema_context, response, updated_state)
+        
+        # Сохранение промежуточных результатов
+        if self.general_config.get('agents_config', {}).get('save_intermediate', True):
+            self._save_intermediate_results(updated_state)
+        
+        return updated_state
+    
+    def _record_error(self, state: MASState, error: Exception) -> MASState:
+        """Добавление ошибки этапа в состояние"""
+        logger.error(f"Ошибка выполнения агента {self.agent_name}: {error}")
+        
+        if 'errors' not in state:
+            state['errors'] = []
+        
+        state['errors'].append({
+            'agent': self.agent_name,
+            'error': str(error),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+        return state
+    
+    def _schema_cache_context(self, state: MASState, llm: Any) -> Optional[Tuple[str, Schema]]:
+        """Область и схема для кэша по структуре источника или None, если этап не кэшируется"""
+        if not self.llm_manager.schema_cache or self.agent_name not in self.llm_manager.semantic_cache_stages:
+            return None
+        # Обратная связь пользователя меняет ответ при той же схеме
+        if state.get('user_feedback'):
+            return None
+        model = getattr(llm, 'model', None)
+        schema = extract_schema(state)
+        if not model or not schema:
+            return None
+        return self.llm_manager.schema_cache.make_scope(self.agent_name, model, state), schema
+    
+    def _store_schema_cache(self, schema_context: Tuple[str, Schema], response: Any, state: MASState):
+        fields = {name: state.get(name) for name in STAGE_FIELDS[self.agent_name]}
+        try:
+            self.llm_manager.schema_cache.store(*schema_context, response, fields)
         except Exception as e:
-            logger.error(f"Ошибка выполнения агента {self.agent_name}: {e}")
-            
-            # Добавляем ошибку в состояние
-            if 'errors' not in state:
-                state['errors'] = []
-            
-            state['errors'].append({
-                'agent': self.agent_name,
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            return state
+            logger.warning(f"Ошибка записи в кэш по схеме для {self.agent_name}: {e}")
     
     def _prepare_messages(self, state: MASState) -> List[Any]:
         """
@@ -213,54 +491,57 @@ class AgentExecutor:
         messages.append(SystemMessage(content=self.prompt))
         
         # Добавляем контекст из состояния
-        context = self._build_context(state)
+        context, context_report = self._build_context(state)
         if context:
             messages.append(HumanMessage(content=context))
         
-        # Добавляем историю сообщений, если есть
+        # Добавляем историю сообщений (последние history_messages в пределах бюджета)
+        history, history_tokens = [], 0
         if 'messages' in state and state['messages']:
-            for msg in state['messages'][-5:]:  # Последние 5 сообщений
-                if isinstance(msg, (SystemMessage, HumanMessage, AIMessage)):
-                    messages.append(msg)
+            # Разобранные ответы этапов уже есть в контексте полями состояния
+            recent = [
+                msg for msg in state['messages']
+                if isinstance(msg, (SystemMessage, HumanMessage, AIMessage))
+                and not (msg.response_metadata or {}).get('structured')
+            ][-self.context_builder.history_messages:]
+            history, history_tokens = self.context_builder.trim_history(recent)
+            messages.extend(history)
+        
+        # Оценка размера промпта по частям (фактическое значение - в _complete)
+        prompt_tokens = {
+            'system': estimate_tokens(self.prompt),
+            'context': context_report['tokens'],
+            'history': history_tokens,
+            'sections': context_report['sections'],
+            'truncated': context_report['truncated'],
+        }
+        prompt_tokens['total'] = prompt_tokens['system'] + prompt_tokens['context'] + prompt_tokens['history']
+        self._stage_stats(state)['prompt_tokens'] = prompt_tokens
+        logger.info(
+            f"Промпт {self.agent_name}: ~{prompt_tokens['total']} токенов "
+            f"(контекст {prompt_tokens['context']}, история {history_tokens}"
+            f"{', сжаты: ' + ', '.join(context_report['truncated']) if context_report['truncated'] else ''})"
+        )
         
         return messages
     
-    def _build_context(self, state: MASState) -> str:
+    def _build_context(self, state: MASState) -> Tuple[str, Dict[str, Any]]:
         """
-        Построение контекста для агента из состояния
+        Построение контекста для агента из состояния в пределах бюджета токенов
         
         Args:
             state: Текущее состояние
             
         Returns:
-            Строка контекста
+            Строка контекста и отчет о токенах по секциям
         """
-        context_parts = []
-        
-        # Добавляем информацию о источнике данных
-        if state.get('source_config'):
-            context_parts.append(f"Конфигурация источника: {json.dumps(state['source_config'], ensure_ascii=False)}")
-        
-        # Добавляем метаданные
-        if state.get('source_metadata'):
-            context_parts.append(f"Метаданные: {json.dumps(state['source_metadata'], ensure_ascii=False)}")
-        
-        # Добавляем образец данных
-        if state.get('data_sample'):
-            context_parts.append(f"Образец данных: {state['data_sample']}")
-        
-        # Добавляем результаты предыдущих агентов
-        if state.get('storage_recommendation'):
-            context_parts.append(f"Рекомендованное хранилище: {state['storage_recommendation']}")
-        
-        if state.get('ddl_scripts'):
-            context_parts.append(f"DDL скрипты: {state['ddl_scripts']}")
-        
-        # Добавляем обратную связь от пользователя
-        if state.get('user_feedback'):
-            context_parts.append(f"Обратная связь: {json.dumps(state['user_feedback'], ensure_ascii=False)}")
-        
-        return "\n\n".join(context_parts) if context_parts else ""
+        return self.context_builder.build(state)
+    
+    def _stage_stats(self, state: MASState) -> Dict[str, Any]:
+        """Статистика этапа: execution_stats['stages'][agent_name]"""
+        if state.get('execution_stats') is None:
+            state['execution_stats'] = {}
+        return state['execution_stats'].setdefault('stages', {}).setdefault(self.agent_name, {})
     
     def _process_response(self, state: MASState, response: Any) -> MASState:
         """
@@ -279,6 +560,9 @@ class AgentExecutor:
         
         state['messages'].append(response)
         
+        # Структурированный ответ раскладывается в поля состояния
+        self._apply_structured_output(state, response)
+        
         # Обновляем информацию об агенте
         state['current_agent'] = self.agent_name
         
@@ -293,30 +577,75 @@ class AgentExecutor:
         
         return state
     
-    def _log_input(self, messages: List[Any]):
-        """Логирование входных данных"""
-        if not self.general_config.get('agents_config', {}).get('verbose', False):
+    def _apply_structured_output(self, state: MASState, response: Any):
+        """
+        Поля состояния из ответа этапа (storage_recommendation, ddl_scripts, ...)
+        
+        Разобранный ответ помечается response_metadata['structured'] и не
+        входит в историю промптов следующих этапов - они получают эти поля
+        в контексте. Неразобранный ответ остается в истории текстом, причина
+        пишется в warnings.
+        """
+        content = getattr(response, 'content', None)
+        if self.agent_name not in PARSED_STAGES or not isinstance(content, str):
+            return
+        
+        stats = self._stage_stats(state)
+        try:
+            fields = parse_stage_output(self.agent_name, content)
+        except StructuredOutputError as e:
+            logger.warning(f"Ответ этапа {self.agent_name} не разобран: {e}")
+            stats['structured'] = False
+            state.setdefault('warnings', []).append({
+                'agent': self.agent_name,
+                'warning': f"Ответ не соответствует схеме этапа: {e}",
+                'timestamp': datetime.now().isoformat()
+            })
             return
         
-        log_file = self.logs_dir / f"{self.agent_name}_inputs.log"
-        timestamp = datetime.now().isoformat()
+        state.update(fields)
+        stats['structured'] = True
+        response.response_metadata = {**(response.response_metadata or {}), 'structured': True}
+    
+    @property
+    def io_log(self) -> Optional[AgentLogWriter]:
+        """Журнал входов/ответов или None, если verbose выключен"""
+        agents_config = self.general_config.get('agents_config', {})
+        if not agents_config.get('verbose', False):
+            return None
+        return get_agent_log_writer(str(self.logs_dir), agents_config.get('io_log'))
+    
+    def _log_record(self, state: MASState, event: str, **fields) -> Dict[str, Any]:
+        return {
+            'event': event,
+            'agent': self.agent_name,
+            'execution_id': state.get('execution_id'),
+            'session_id': state.get('session_id'),
+            **fields,
+        }
+    
+    def _log_input(self, state: MASState, messages: List[Any]):
+        """Логирование входных данных (запись ставится в очередь фонового писателя)"""
+        io_log = self.io_log
+        if io_log is None:
+            return
         
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"\n--- {timestamp} ---\n")
-            for msg in messages:
-                f.write(f"{msg.__class__.__name__}: {msg.content}\n")
+        io_log.write(self._log_record(
+            state, 'input',
+            messages=[{'type': msg.__class__.__name__, 'content': msg.content} for msg in messages],
+        ))
     
-    def _log_response(self, response: Any):
+    def _log_response(self, state: MASState, response: Any):
         """Логирование ответа"""
-        if not self.general_config.get('agents_config', {}).get('verbose', False):
+        io_log = self.io_log
+        if io_log is None:
             return
         
-        log_file = self.logs_dir / f"{self.agent_name}_responses.log"
-        timestamp = datetime.now().isoformat()
-        
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"\n--- {timestamp} ---\n")
-            f.write(f"{response.content if hasattr(response, 'content') else str(response)}\n")
+        io_log.write(self._log_record(
+            state, 'response',
+            content=response.content if hasattr(response, 'content') else str(response),
+            usage=getattr(response, 'usage_metadata', None),
+        ))
     
     def _save_intermediate_results(self, state: MASState):
         """Сохранение промежуточных результатов"""
@@ -0,0 +1,262 @@
+"""
+Журнал входов и ответов агентов (agents_config.verbose)
+
+Записи - JSON-строки с execution_id/session_id, по которым промпты и ответы
+одного анализа собираются вместе. Запрос только кладет запись в очередь;
+фоновый поток пишет их пачками в <logs_dir>/agent_io.jsonl.
+
+Файл ротируется по размеру (max_bytes) и возрасту (max_age_seconds):
+закрытый сегмент сжимается (zstd, если установлен zstandard, иначе gzip),
+хранится не больше backup_count сегментов - объем логов ограничен.
+
+В файл пишут все процессы API. Запись идет под разделяемой блокировкой
+(flock на agent_io.lock), переименование при ротации - под эксклюзивной;
+перед записью писатель сверяет inode открытого файла с путем и, если файл
+уже ротировал другой процесс, открывает новый. Поэтому записи не попадают
+в переименованный сегмент после того, как его начали сжимать.
+Если очередь переполнена, запись отбрасывается (счетчик dropped), поток
+запроса не ждет диск.
+"""
+import atexit
+import fcntl
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = 'agent_io'
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compress(path: str, method: str) -> str:
+    """Сжимает закрытый сегмент и удаляет исходный файл; возвращает путь архива"""
+    if method == 'zstd' and zstandard is not None:
+        target = f"{path}.zst"
+        with open(path, 'rb') as src, open(target, 'wb') as dst:
+            zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    else:
+        target = f"{path}.gz"
+        with open(path, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+    os.unlink(path)
+    return target
+
+
+class AgentLogWriter:
+    """Буферизованная фоновая запись JSONL с ротацией и сжатием сегментов"""
+
+    def __init__(self,
+                 directory: str,
+                 max_bytes: int = 50 * 1024 ** 2,
+                 max_age_seconds: float = 24 * 3600,
+                 backup_count: int = 10,
+                 compression: str = 'zstd',
+                 queue_size: int = 10000,
+                 flush_interval: float = 1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.backup_count = backup_count
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.path = os.path.join(directory, f"{LOG_NAME}.jsonl")
+        self.lock_path = os.path.join(directory, f"{LOG_NAME}.lock")
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._lock_file = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._metrics: Dict[str, Any] = {
+            'written': 0,
+            'dropped': 0,
+            'rotations': 0,
+            'errors': 0,
+        }
+
+    # --- запись из запросов ---
+
+    def write(self, record: Dict[str, Any]):
+        """Поставить запись в очередь (не блокирует; при переполнении запись теряется)"""
+        self._ensure_started()
+        record.setdefault('ts', datetime.now().isoformat())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._metrics['dropped'] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, 'queued': self._queue.qsize(), 'path': self.path}
+
+    # --- фоновый поток ---
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='agent-log-writer', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: float = 5.0):
+        """Дождаться записи всего, что уже в очереди"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put({'_flush': done}, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch: List[Dict[str, Any]] = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < 1000:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                with self._lock:
+                    self._metrics['errors'] += 1
+                logger.warning(f"Ошибка записи журнала агентов: {e}")
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        waiters = [record.pop('_flush') for record in batch if '_flush' in record]
+        records = [record for record in batch if record]
+        try:
+            if self._file is not None and self._should_rotate():
+                self._rotate()
+            if records:
+                data = ''.join(
+                    json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records
+                ).encode('utf-8')
+                with self._file_lock(fcntl.LOCK_SH):
+                    if self._file is not None and self._replaced():
+                        self._close()
+                    if self._file is None:
+                        self._open()
+                    self._file.write(data)
+                    self._file.flush()
+                    # Размер общего файла, включая записи других процессов
+                    self._size = os.fstat(self._file.fileno()).st_size
+                with self._lock:
+                    self._metrics['written'] += len(records)
+        finally:
+            for waiter in waiters:
+                waiter.set()
+
+    # --- ротация ---
+
+    @contextmanager
+    def _file_lock(self, operation: int) -> Iterator[None]:
+        """flock на agent_io.lock: общий для записи, эксклюзивный для ротации"""
+        if self._lock_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(self.lock_path, 'a')
+        fcntl.flock(self._lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _replaced(self) -> bool:
+        """Открытый файл уже переименован (ротирован другим процессом)"""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self._file.fileno())
+        return (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        # Возраст продолженного после перезапуска файла - от его создания
+        self._opened_at = os.stat(self.path).st_ctime if self._size else time.time()
+
+    def _should_rotate(self) -> bool:
+        return self._size >= self.max_bytes or (
+            self.max_age_seconds and time.time() - self._opened_at >= self.max_age_seconds
+        )
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+
+    def _rotate(self):
+        with self._file_lock(fcntl.LOCK_EX):
+            if self._replaced():
+                # Другой процесс уже ротировал файл: следующая запись откроет новый
+                self._close()
+                return
+            size = os.fstat(self._file.fileno()).st_size
+            self._close()
+            if not size:
+                return
+            segment = os.path.join(
+                self.directory, f"{LOG_NAME}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.jsonl"
+            )
+            os.replace(self.path, segment)
+        # После переименования под эксклюзивной блокировкой в сегмент никто не пишет
+        _compress(segment, self.compression)
+        with self._lock:
+            self._metrics['rotations'] += 1
+        self._prune()
+
+    def _prune(self):
+        """Удаляет сжатые сегменты сверх backup_count (самые старые)"""
+        segments = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(f"{LOG_NAME}-") and name.endswith(('.gz', '.zst'))
+        )
+        for name in segments[:max(len(segments) - self.backup_count, 0)]:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+
+
+_writers: Dict[str, AgentLogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_agent_log_writer(directory: str, config: Optional[Dict[str, Any]] = None) -> AgentLogWriter:
+    """Общий писатель процесса для каталога (секция agents_config.io_log)"""
+    config = config or {}
+    with _writers_lock:
+        if directory not in _writers:
+            _writers[directory] = AgentLogWriter(
+                directory,
+                max_bytes=config.get('max_bytes', 50 * 1024 ** 2),
+                max_age_seconds=config.get('max_age_seconds', 24 * 3600),
+                backup_count=config.get('backup_count', 10),
+                compression=config.get('compression', 'zstd'),
+                queue_size=config.get('queue_size', 10000),
+                flush_interval=config.get('flush_interval', 1.0),
+            )
+            # Записи из очереди дописываются при нормальном завершении процесса
+            atexit.register(_writers[directory].flush)
+        return _writers[directory]
@@ -0,0 +1,68 @@
+"""
+Кэш YAML-конфигураций и промптов по mtime файла
+
+Файл перечитывается с диска, только если он изменился; вызывающий код
+получает копию, поэтому может свободно ее менять.
+"""
+import copy
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+import yaml
+
+GENERAL_CONFIG_PATH = Path(__file__).parent.parent / 'config' / 'general_config.yaml'
+DEFAULT_TEMP_DIR = '/tmp/mas_temp'
+
+_cache: Dict[str, Tuple[float, Any]] = {}
+_lock = threading.Lock()
+
+
+def load_yaml(path: Union[str, Path]) -> Any:
+    """
+    Содержимое YAML-файла (перечитывается при изменении mtime)
+
+    Raises:
+        OSError, yaml.YAMLError: как и обычное чтение файла
+    """
+    path = str(path)
+    mtime = os.stat(path).st_mtime
+    with _lock:
+        cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+        with _lock:
+            _cache[path] = (mtime, data)
+    else:
+        data = cached[1]
+    return copy.deepcopy(data)
+
+
+def files_signature(paths: Iterable[Union[str, Path]]) -> Tuple:
+    """Отпечаток набора файлов по mtime (отсутствующий файл - None)"""
+    signature = []
+    for path in paths:
+        try:
+            signature.append((str(path), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            signature.append((str(path), None))
+    return tuple(signature)
+
+
+def mas_temp_dir(general_config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Каталог промежуточных результатов агентов: MAS_TEMP_DIR или paths.temp_dir
+
+    Единственный источник пути и для исполнителей, и для apps.api.janitor,
+    который этот каталог чистит.
+    """
+    if os.getenv('MAS_TEMP_DIR'):
+        return os.environ['MAS_TEMP_DIR']
+    if general_config is None:
+        try:
+            general_config = load_yaml(GENERAL_CONFIG_PATH) or {}
+        except Exception:
+            general_config = {}
+    return (general_config.get('paths') or {}).get('temp_dir') or DEFAULT_TEMP_DIR
@@ -0,0 +1,243 @@
+"""
+Сборка контекста промпта в пределах бюджета токенов
+
+Каждая секция контекста (конфигурация источника, метаданные, образец
+данных, DDL ...) укладывается в свой бюджет, а все вместе - в общий
+max_tokens; бюджет раздается секциям в порядке важности (PRIORITY).
+Секция, не влезающая в бюджет, сжимается в несколько шагов:
+- широкие схемы: подробно первые max_columns колонок, остальные - число,
+  распределение по типам и имена;
+- образец данных: первые sample_rows строк;
+- длинные строковые значения: первые max_value_chars символов;
+после этого остаток обрезается по длине.
+
+Токенизатора модели в зависимостях нет, поэтому число токенов
+оценивается по размеру текста (estimate_tokens); фактическое число
+токенов промпта Ollama возвращает в usage_metadata ответа.
+"""
+import json
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+# Секции в порядке вывода: ключ состояния -> заголовок
+SECTIONS = (
+    ('source_config', 'Конфигурация источника'),
+    ('source_metadata', 'Метаданные'),
+    ('data_sample', 'Образец данных'),
+    ('storage_recommendation', 'Рекомендованное хранилище'),
+    ('data_profile', 'Профиль данных'),
+    ('ddl_scripts', 'DDL скрипты'),
+    ('pipeline_config', 'Конфигурация пайплайна'),
+    ('pipeline_code', 'Код пайплайна'),
+    ('user_feedback', 'Обратная связь'),
+)
+
+# Порядок раздачи общего бюджета: важные секции получают его первыми
+PRIORITY = ('user_feedback', 'storage_recommendation', 'data_profile', 'source_metadata', 'ddl_scripts',
+            'pipeline_config', 'pipeline_code', 'data_sample', 'source_config')
+
+DEFAULT_BUDGETS = {
+    'source_config': 800,
+    'source_metadata': 2000,
+    'data_sample': 1200,
+    'storage_recommendation': 200,
+    'data_profile': 600,
+    'ddl_scripts': 1500,
+    'pipeline_config': 300,
+    'pipeline_code': 1500,
+    'user_feedback': 500,
+}
+
+# Секции с текстом, который нельзя резать по значениям (DDL, код, ответы)
+_TEXT_SECTIONS = ('storage_recommendation', 'ddl_scripts', 'pipeline_code', 'user_feedback')
+
+# Сколько раз уменьшать лимиты сжатия, прежде чем обрезать текст
+_SHRINK_STEPS = 4
+
+_encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов: ~4 байта UTF-8 на токен (~4 символа латиницы, ~2 кириллицы)"""
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до оценки max_tokens с пометкой об обрезке"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    marker = f"\n… [обрезано, ~{estimate_tokens(text) - max_tokens} токенов]"
+    limit = max(max_tokens * 4 - len(marker.encode('utf-8')), 0)
+    return text.encode('utf-8')[:limit].decode('utf-8', errors='ignore') + marker
+
+
+def _column_type(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        dtype = value.get('type') or value.get('dtype')
+        return str(dtype) if dtype else None
+    if isinstance(value, str) and len(value) <= 32:
+        return value
+    return None
+
+
+def _is_scalar(value: Any) -> bool:
+    return not isinstance(value, (dict, list, tuple))
+
+
+class ContextBuilder:
+    """Контекст и история сообщений для промпта этапа в пределах бюджета токенов"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config: секция agents_config.context
+        """
+        config = config or {}
+        self.max_tokens = int(config.get('max_tokens', 6000))
+        self.history_max_tokens = int(config.get('history_max_tokens', 1500))
+        self.history_messages = int(config.get('history_messages', 5))
+        self.budgets = {**DEFAULT_BUDGETS, **(config.get('sections') or {})}
+        self.max_columns = int(config.get('max_columns', 40))
+        self.sample_rows = int(config.get('sample_rows', 5))
+        self.max_value_chars = int(config.get('max_value_chars', 200))
+
+    def build(self, state: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Returns:
+            (контекст, отчет {'tokens', 'sections': {секция: токены}, 'truncated': [...]})
+        """
+        remaining = self.max_tokens
+        labels = dict(SECTIONS)
+        rendered: Dict[str, str] = {}
+        report: Dict[str, Any] = {'sections': {}, 'truncated': []}
+
+        for name in PRIORITY:
+            value = state.get(name)
+            if not value:
+                continue
+            # Заголовок и разделитель секции тоже входят в max_tokens
+            overhead = estimate_tokens(f"\n\n{labels[name]}: ")
+            budget = min(int(self.budgets.get(name, remaining)), remaining - overhead)
+            if budget <= 0:
+                report['truncated'].append(name)
+                continue
+            text, truncated = self._fit(name, value, budget)
+            tokens = estimate_tokens(text)
+            remaining -= tokens + overhead
+            rendered[name] = text
+            report['sections'][name] = tokens
+            if truncated:
+                report['truncated'].append(name)
+
+        context = "\n\n".join(f"{label}: {rendered[name]}" for name, label in SECTIONS if name in rendered)
+        report['tokens'] = estimate_tokens(context)
+        return context, report
+
+    def trim_history(self, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], int]:
+        """
+        Последние history_messages сообщений в пределах history_max_tokens
+
+        Бюджет раздается от новых сообщений к старым; сообщение, которое не
+        влезает целиком, обрезается, более старые отбрасываются.
+
+        Returns:
+            (сообщения в исходном порядке, оценка токенов)
+        """
+        remaining = self.history_max_tokens
+        kept: List[BaseMessage] = []
+        for message in reversed(messages[-self.history_messages:] if self.history_messages > 0 else []):
+            if remaining <= 0:
+                break
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            tokens = estimate_tokens(content)
+            if tokens > remaining:
+                message = message.__class__(content=truncate_to_tokens(content, remaining))
+                tokens = estimate_tokens(message.content)
+            kept.append(message)
+            remaining -= tokens
+        kept.reverse()
+        return kept, self.history_max_tokens - remaining
+
+    # --- сжатие секций ---
+
+    def _fit(self, name: str, value: Any, budget: int) -> Tuple[str, bool]:
+        full = self._render_within(value, budget)
+        if full is not None:
+            return full, False
+        if name in _TEXT_SECTIONS:
+            return truncate_to_tokens(self._render(value), budget), True
+
+        rows, columns, chars = self.sample_rows, self.max_columns, self.max_value_chars
+        text = ''
+        for _ in range(_SHRINK_STEPS):
+            text = self._render(self._compact(value, rows, columns, chars))
+            if estimate_tokens(text) <= budget:
+                return text, True
+            rows, columns, chars = max(rows // 2, 1), max(columns // 2, 5), max(chars // 2, 20)
+        return truncate_to_tokens(text, budget), True
+
+    @staticmethod
+    def _render(value: Any) -> str:
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _render_within(value: Any, max_tokens: int) -> Optional[str]:
+        """
+        Полный текст значения или None, если он больше max_tokens
+
+        Сериализация прерывается, как только превышен бюджет: образец на
+        миллионы токенов целиком в JSON не переводится.
+        """
+        if isinstance(value, str):
+            return value if estimate_tokens(value) <= max_tokens else None
+        limit = max_tokens * 4
+        size, parts = 0, []
+        for part in _encoder.iterencode(value):
+            size += len(part.encode('utf-8'))
+            if size > limit:
+                return None
+            parts.append(part)
+        return ''.join(parts)
+
+    def _compact(self, value: Any, rows: int, columns: int, chars: int) -> Any:
+        if isinstance(value, dict):
+            items = list(value.items())
+            result = {str(key): self._compact(item, rows, columns, chars) for key, item in items[:columns]}
+            if len(items) > columns:
+                result['_omitted'] = self._summarize_columns(items[columns:], columns)
+            return result
+        if isinstance(value, (list, tuple)):
+            # Список имен/значений - как колонки, список записей - как строки образца
+            limit = columns if all(_is_scalar(item) for item in value) else rows
+            result = [self._compact(item, rows, columns, chars) for item in value[:limit]]
+            if len(value) > limit:
+                result.append(f"... еще {len(value) - limit}")
+            return result
+        if isinstance(value, str):
+            if '\n' in value:
+                # Текстовый образец (CSV и т.п.): заголовок и первые строки
+                lines = value.splitlines()
+                kept = [line[:chars * columns] for line in lines[:rows + 1]]
+                if len(lines) > rows + 1:
+                    kept.append(f"... еще {len(lines) - rows - 1} строк")
+                return "\n".join(kept)
+            if len(value) > chars:
+                return value[:chars] + '…'
+        return value
+
+    @staticmethod
+    def _summarize_columns(items: List[Tuple[Any, Any]], columns: int) -> Dict[str, Any]:
+        """Сводка по колонкам, не вошедшим в подробную часть: число, типы, имена"""
+        summary: Dict[str, Any] = {'count': len(items)}
+        types = Counter(dtype for dtype in (_column_type(value) for _, value in items) if dtype)
+        if types:
+            summary['by_type'] = dict(types.most_common())
+        names = [str(key) for key, _ in items[:columns * 2]]
+        if len(items) > len(names):
+            names.append(f"... еще {len(items) - len(names)}")
+        summary['names'] = names
+        return summary
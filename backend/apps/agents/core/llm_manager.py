@@ -2,13 +2,22 @@
 Менеджер LLM с поддержкой только локальных моделей через Ollama (на будущее предусмотрен гибридный режим: Ollama + облачные провайдеры)
 """
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+import contextlib
+from typing import Optional, Dict, Any, List, AsyncIterator
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import BaseMessage, HumanMessage
-import yaml
+from langchain_core.messages import AIMessageChunk, BaseMessage, message_chunk_to_message
 from pathlib import Path
 
+from .admission import DEFAULT_PRIORITY, AdmissionTimeout, backoff_delay, get_admission_controller
+from .config_cache import load_yaml
+from .model_registry import DEFAULT_OLLAMA_URL, get_model_registry
+from .response_cache import get_response_cache
+from .schema_cache import STAGE_FIELDS, get_schema_cache
+from .structured_output import STAGE_SCHEMAS, output_format
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +38,22 @@ class LLMManager:
         # Всегда используем Ollama
         self.provider = 'ollama'
         self.models_cache: Dict[str, BaseChatModel] = {}
+        # Заглушки на время недоступности Ollama; менеджер пересоздается вместе
+        # с LLMIntegration при смене конфигурации, поэтому кэш живет одну ее версию
+        self.fallback_cache: Dict[str, BaseChatModel] = {}
+        # Персистентный кэш ответов (общий для процесса)
+        self.response_cache = get_response_cache(self.llm_config.get('response_cache', {}))
+        # Кэш второго уровня по структуре источника (только для этапов из STAGE_FIELDS)
+        semantic_config = self.llm_config.get('semantic_cache', {})
+        self.schema_cache = get_schema_cache(semantic_config)
+        self.semantic_cache_stages = [
+            stage for stage in semantic_config.get('stages', list(STAGE_FIELDS)) if stage in STAGE_FIELDS
+        ]
+        # Лимит одновременных запросов к модели и приоритетная очередь (общие для процесса)
+        admission_config = self.llm_config.get('admission', {})
+        self.admission = get_admission_controller(admission_config)
+        self.backoff_base = float(admission_config.get('backoff_base', 0.5))
+        self.backoff_max = float(admission_config.get('backoff_max', 8))
         
     def _load_config(self, config_path: Optional[str] = None) -> Dict[str, Any]:
         """Загрузка конфигурации из файла"""
@@ -36,8 +61,7 @@ class LLMManager:
             config_path = Path(__file__).parent.parent / 'config' / 'general_config.yaml'
         
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return load_yaml(config_path)
         except Exception as e:
             logger.error(f"Ошибка загрузки конфигурации: {e}")
             return self._get_default_config()
@@ -62,68 +86,122 @@ class LLMManager:
             }
         }
     
-    def get_llm(self, agent_type: str, use_tools: bool = False) -> BaseChatModel:
+    def get_llm(self, agent_type: str, use_tools: bool = False, for_async: bool = False) -> BaseChatModel:
         """
         Получение LLM для конкретного агента
         
         Args:
             agent_type: Тип агента (input_analysis, ddl_generation, etc.)
             use_tools: Использовать ли инструменты
+            for_async: Экземпляр для ainvoke/astream (вызывать из корутины:
+                реестр держит отдельные экземпляры на каждый event loop;
+                aget_llm заранее обновляет статус Ollama вне event loop)
             
         Returns:
             Экземпляр LLM
         """
         cache_key = f"{agent_type}_{use_tools}"
         
-        if cache_key in self.models_cache:
+        if not for_async and cache_key in self.models_cache:
             return self.models_cache[cache_key]
         
         llm = None
         
         # Всегда используем Ollama
-        llm = self._try_ollama(agent_type)
+        llm = self._try_ollama(agent_type, for_async=for_async)
         
         if not llm:
-            logger.error(f"Не удалось инициализировать LLM для агента {agent_type}")
-            llm = self._get_fallback_llm(agent_type)
+            # Модель не кэшируем: при следующем запросе снова проверим Ollama
+            # (статус /api/tags кэширует реестр), а заглушку создаем один раз
+            if agent_type not in self.fallback_cache:
+                logger.error(f"Не удалось инициализировать LLM для агента {agent_type}")
+                self.fallback_cache[agent_type] = self._get_fallback_llm(agent_type)
+            return self.fallback_cache[agent_type]
         
         if llm and use_tools:
             # Здесь в будущем можно добавить привязку инструментов
             pass
         
-        if llm:
+        if not for_async:
             self.models_cache[cache_key] = llm
-            
         return llm
     
-    def _try_ollama(self, agent_type: str) -> Optional[BaseChatModel]:
-        """Попытка инициализации Ollama"""
+    async def aget_llm(self, agent_type: str, use_tools: bool = False) -> BaseChatModel:
+        """
+        get_llm(for_async=True) для корутин
+        
+        Статус Ollama (/api/tags) обновляется в потоке до выбора модели,
+        поэтому проверка доступности не блокирует event loop.
+        """
+        ollama_config = self.llm_config.get('ollama', {})
+        if ollama_config.get('enabled', False):
+            await get_model_registry().acheck_health(ollama_config.get('url', DEFAULT_OLLAMA_URL))
+        return self.get_llm(agent_type, use_tools, for_async=True)
+    
+    def output_format(self, agent_type: str) -> Optional[Dict[str, Any]]:
+        """JSON Schema ответа этапа для format Ollama (llm_config.structured_output)"""
+        structured = self.llm_config.get('structured_output', {})
+        if not structured.get('enabled', True) or agent_type not in structured.get('stages', STAGE_SCHEMAS):
+            return None
+        return output_format(agent_type)
+    
+    def _try_ollama(self, agent_type: str, for_async: bool = False) -> Optional[BaseChatModel]:
+        """
+        Модель Ollama из реестра процесса
+        
+        Доступность проверяется через /api/tags (без генерации), экземпляры
+        и пул соединений общие для всех этапов и запросов.
+        """
         ollama_config = self.llm_config.get('ollama', {})
         
         if not ollama_config.get('enabled', False):
             return None
         
         try:
-            from langchain_ollama import ChatOllama
-            
             model_name = ollama_config['models'].get(agent_type, 'llama3.2:latest')
-            
-            llm = ChatOllama(
-                model=model_name,
-                base_url=ollama_config.get('url', 'http://localhost:11434'),
-                temperature=ollama_config.get('temperature', 0.7),
-                num_predict=ollama_config.get('max_tokens', 4096),
+            llm = get_model_registry().get_chat_model(
+                ollama_config, model_name, for_async=for_async, output_format=self.output_format(agent_type)
             )
-            
-            # Проверка доступности модели
-            test_response = llm.invoke([HumanMessage(content="test")])
-            logger.info(f"Модель {model_name} успешно инициализирована для {agent_type}")
+            if llm:
+                logger.info(f"Модель {model_name} используется для {agent_type}")
             return llm
             
         except Exception as e:
             logger.warning(f"Не удалось инициализировать модель для {agent_type}: {e}")
             return None
     
+    def _admitted(self, llm: BaseChatModel, priority: str):
+        """Слот модели у контроллера допуска (заглушки без модели не ограничиваются)"""
+        model = getattr(llm, 'model', None)
+        return self.admission.slot(model, priority) if model else contextlib.nullcontext()
+    
+    def _aadmitted(self, llm: BaseChatModel, priority: str):
+        model = getattr(llm, 'model', None)
+        return self.admission.aslot(model, priority) if model else contextlib.nullcontext()
+    
+    def _backoff(self, llm: BaseChatModel, attempt: int) -> float:
+        """Задержка перед повтором attempt + 1 (учитывается в метриках модели)"""
+        model = getattr(llm, 'model', None)
+        if model:
+            self.admission.record_retry(model)
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+    
+    @staticmethod
+    def _add_stat(stats: Optional[Dict[str, Any]], key: str, value: float):
+        """Накопить значение в статистике этапа (если ее передали)"""
+        if stats is not None:
+            stats[key] = stats.get(key, 0) + value
+    
+    @staticmethod
+    def _set_cache_hit(stats: Optional[Dict[str, Any]]):
+        if stats is not None:
+            stats['cache'] = 'response'
+    
+    def check_health(self, force: bool = False) -> Dict[str, Any]:
+        """Доступность Ollama и загруженные модели (GET /api/tags)"""
+        ollama_config = self.llm_config.get('ollama', {})
+        return get_model_registry().check_health(ollama_config.get('url', DEFAULT_OLLAMA_URL), force=force)
+    
     # Удалены облачные провайдеры — используется только Ollama
     
     def _get_fallback_llm(self, agent_type: str) -> BaseChatModel:
@@ -144,32 +222,202 @@ class LLMManager:
         
         return FakeListChatModel(responses=responses)
     
+    @staticmethod
+    def is_fallback(llm: Any) -> bool:
+        """Заглушка вместо модели (Ollama недоступна)"""
+        from langchain_core.language_models import FakeListChatModel
+        
+        return isinstance(llm, FakeListChatModel)
+    
     def invoke_with_retry(self, 
                          llm: BaseChatModel, 
                          messages: List[BaseMessage],
-                         retry_count: int = 3) -> Any:
+                         retry_count: int = 3,
+                         use_cache: bool = True,
+                         priority: str = DEFAULT_PRIORITY,
+                         stats: Optional[Dict[str, Any]] = None) -> Any:
         """
         Вызов LLM с повторными попытками при ошибках
         
+        Запрос ждет свободный слот модели у контроллера допуска; повтор после
+        ошибки - с экспоненциальной задержкой и джиттером, чтобы не добивать
+        перегруженную Ollama. Истекшее ожидание слота не повторяется.
+        
         Args:
             llm: Экземпляр LLM
             messages: Список сообщений
             retry_count: Количество попыток
+            use_cache: Брать ответ из кэша, если такой же промпт уже отправлялся
+            priority: 'interactive' или 'batch' - порядок в очереди к модели
+            stats: статистика этапа - сюда добавляются ожидание слота
+                (queue_wait_seconds), время вызовов модели (llm_seconds),
+                повторы (retries) и попадание в кэш ответов (cache)
             
         Returns:
             Ответ от LLM
         """
+        cache_key = None
+        if use_cache and self.response_cache:
+            cache_key = self.response_cache.make_key(llm, messages)
+        if cache_key:
+            try:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Ответ LLM взят из кэша: {cache_key[:48]}")
+                    self._set_cache_hit(stats)
+                    return cached
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша ответов LLM: {e}")
+        
         last_error = None
         
         for attempt in range(retry_count):
             try:
-                response = llm.invoke(messages)
+                requested = time.monotonic()
+                with self._admitted(llm, priority):
+                    started = time.monotonic()
+                    self._add_stat(stats, 'queue_wait_seconds', started - requested)
+                    response = llm.invoke(messages)
+                    self._add_stat(stats, 'llm_seconds', time.monotonic() - started)
+                if cache_key:
+                    try:
+                        self.response_cache.put(cache_key, response)
+                    except Exception as e:
+                        logger.warning(f"Ошибка записи в кэш ответов LLM: {e}")
                 return response
+            except AdmissionTimeout:
+                raise
             except Exception as e:
                 last_error = e
                 logger.warning(f"Попытка {attempt + 1}/{retry_count} не удалась: {e}")
                 
                 # Без гибридного режима дополнительных переключений нет
+                if attempt + 1 < retry_count:
+                    self._add_stat(stats, 'retries', 1)
+                    time.sleep(self._backoff(llm, attempt))
+        
+        raise last_error
+    
+    async def ainvoke_with_retry(self,
+                                 llm: BaseChatModel,
+                                 messages: List[BaseMessage],
+                                 retry_count: int = 3,
+                                 use_cache: bool = True,
+                                 priority: str = DEFAULT_PRIORITY,
+                                 stats: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Асинхронный вариант invoke_with_retry (llm.ainvoke): не блокирует event loop
+        
+        Отмена задачи (asyncio.CancelledError) не перехватывается и прерывает
+        запрос к модели без повторных попыток.
+        """
+        cache_key = None
+        if use_cache and self.response_cache:
+            cache_key = self.response_cache.make_key(llm, messages)
+        if cache_key:
+            try:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Ответ LLM взят из кэша: {cache_key[:48]}")
+                    self._set_cache_hit(stats)
+                    return cached
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша ответов LLM: {e}")
+        
+        last_error = None
+        
+        for attempt in range(retry_count):
+            try:
+                requested = time.monotonic()
+                async with self._aadmitted(llm, priority):
+                    started = time.monotonic()
+                    self._add_stat(stats, 'queue_wait_seconds', started - requested)
+                    response = await llm.ainvoke(messages)
+                    self._add_stat(stats, 'llm_seconds', time.monotonic() - started)
+                if cache_key:
+                    try:
+                        self.response_cache.put(cache_key, response)
+                    except Exception as e:
+                        logger.warning(f"Ошибка записи в кэш ответов LLM: {e}")
+                return response
+            except AdmissionTimeout:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Попытка {attempt + 1}/{retry_count} не удалась: {e}")
+                if attempt + 1 < retry_count:
+                    self._add_stat(stats, 'retries', 1)
+                    await asyncio.sleep(self._backoff(llm, attempt))
+        
+        raise last_error
+    
+    async def astream_with_retry(self,
+                                 llm: BaseChatModel,
+                                 messages: List[BaseMessage],
+                                 retry_count: int = 3,
+                                 use_cache: bool = True,
+                                 priority: str = DEFAULT_PRIORITY,
+                                 stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[AIMessageChunk]:
+        """
+        Потоковый вызов LLM (llm.astream) с повторными попытками и кэшем ответов
+        
+        Повтор возможен, только пока клиенту не отдан ни один фрагмент. Ответ
+        из кэша отдается одним фрагментом; собранный ответ пишется в кэш так
+        же, как в invoke_with_retry.
+        
+        Yields:
+            Фрагменты ответа (AIMessageChunk)
+        """
+        cache_key = None
+        if use_cache and self.response_cache:
+            cache_key = self.response_cache.make_key(llm, messages)
+        if cache_key:
+            try:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Ответ LLM взят из кэша: {cache_key[:48]}")
+                    self._set_cache_hit(stats)
+                    yield AIMessageChunk(content=cached.content, response_metadata=cached.response_metadata)
+                    return
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша ответов LLM: {e}")
+        
+        last_error = None
+        
+        for attempt in range(retry_count):
+            full = None
+            try:
+                requested = time.monotonic()
+                async with self._aadmitted(llm, priority):
+                    started = time.monotonic()
+                    self._add_stat(stats, 'queue_wait_seconds', started - requested)
+                    try:
+                        async for chunk in llm.astream(messages):
+                            if full is None and stats is not None:
+                                stats['first_token_seconds'] = time.monotonic() - started
+                            full = chunk if full is None else full + chunk
+                            yield chunk
+                    finally:
+                        # Время генерации, включая прерванный поток
+                        self._add_stat(stats, 'llm_seconds', time.monotonic() - started)
+            except AdmissionTimeout:
+                raise
+            except Exception as e:
+                if full is not None:
+                    raise
+                last_error = e
+                logger.warning(f"Попытка {attempt + 1}/{retry_count} не удалась: {e}")
+                if attempt + 1 < retry_count:
+                    self._add_stat(stats, 'retries', 1)
+                    await asyncio.sleep(self._backoff(llm, attempt))
+                continue
+            
+            if cache_key and full is not None:
+                try:
+                    self.response_cache.put(cache_key, message_chunk_to_message(full))
+                except Exception as e:
+                    logger.warning(f"Ошибка записи в кэш ответов LLM: {e}")
+            return
         
         raise last_error
     
@@ -0,0 +1,160 @@
+"""
+Метрики этапов пайплайна на процесс
+
+Каждый запуск этапа (AgentExecutor) добавляет сюда свою статистику из
+execution_stats['stages'][этап]: время этапа и ожидания слота модели,
+токены, повторы, попадания в кэши. render_prometheus отдает накопленное
+в текстовом формате Prometheus вместе с очередью контроллера допуска.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Границы гистограмм времени, секунды
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(**labels: Any) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class StageMetrics:
+    """Счетчики и гистограммы по (этап, модель)"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._runs: Dict[Tuple[str, str, str], int] = {}
+        self._counters: Dict[Tuple[str, str, str], float] = {}
+        self._histograms: Dict[Tuple[str, str, str], _Histogram] = {}
+
+    def observe(self, stage: str, stats: Dict[str, Any], outcome: str = 'ok'):
+        """
+        Учесть запуск этапа
+
+        Args:
+            stats: статистика этапа (execution_stats['stages'][stage])
+            outcome: 'ok', 'error' или 'cancelled'
+        """
+        model = stats.get('model') or 'unknown'
+        key = (stage, model)
+        with self._lock:
+            self._runs[key + (outcome,)] = self._runs.get(key + (outcome,), 0) + 1
+            if stats.get('cache'):
+                self._add('cache_hits', key + (stats['cache'],), 1)
+            counters = {
+                'retries': stats.get('retries'),
+                'prompt_tokens': (stats.get('prompt_tokens') or {}).get('actual'),
+                'completion_tokens': stats.get('completion_tokens'),
+                'llm_seconds': stats.get('llm_seconds'),
+            }
+            for name, value in counters.items():
+                if value:
+                    self._add(name, key + ('',), value)
+            for name in ('wall_seconds', 'queue_wait_seconds', 'first_token_seconds'):
+                if stats.get(name) is not None:
+                    histogram = self._histograms.get((name,) + key)
+                    if histogram is None:
+                        histogram = self._histograms[(name,) + key] = _Histogram(self.buckets)
+                    histogram.observe(stats[name])
+
+    def _add(self, name: str, key: Tuple[str, str, str], value: float):
+        self._counters[(name,) + key] = self._counters.get((name,) + key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._runs.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    # --- экспорт ---
+
+    def render_prometheus(self, admission: Optional[Dict[str, Any]] = None) -> str:
+        """Текстовый формат Prometheus (admission - AdmissionController.metrics())"""
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header('mas_stage_runs_total', 'counter', 'Stage runs by outcome')
+            for (stage, model, outcome), value in sorted(self._runs.items()):
+                lines.append(f"mas_stage_runs_total{_labels(stage=stage, model=model, outcome=outcome)} {value}")
+
+            counters = (
+                ('cache_hits', 'mas_stage_cache_hits_total', 'Stage answers served from a cache', 'cache'),
+                ('retries', 'mas_stage_retries_total', 'LLM call retries', None),
+                ('prompt_tokens', 'mas_stage_prompt_tokens_total', 'Prompt tokens reported by the model', None),
+                ('completion_tokens', 'mas_stage_completion_tokens_total', 'Completion tokens generated', None),
+                ('llm_seconds', 'mas_stage_llm_seconds_total', 'Time spent in model calls after admission', None),
+            )
+            for name, metric, help_text, extra in counters:
+                header(metric, 'counter', help_text)
+                for (counter, stage, model, label), value in sorted(self._counters.items()):
+                    if counter != name:
+                        continue
+                    labels = {'stage': stage, 'model': model, **({extra: label} if extra else {})}
+                    lines.append(f"{metric}{_labels(**labels)} {value:g}")
+
+            histograms = (
+                ('wall_seconds', 'mas_stage_duration_seconds', 'Stage wall time'),
+                ('queue_wait_seconds', 'mas_stage_queue_wait_seconds', 'Time waiting for a model slot'),
+                ('first_token_seconds', 'mas_stage_first_token_seconds', 'Time to first streamed token'),
+            )
+            for name, metric, help_text in histograms:
+                header(metric, 'histogram', help_text)
+                for (histogram_name, stage, model), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{metric}_bucket{_labels(stage=stage, model=model, le=f'{bound:g}')} {count}")
+                    lines.append(f"{metric}_bucket{_labels(stage=stage, model=model, le='+Inf')} {histogram.count}")
+                    lines.append(f"{metric}_sum{_labels(stage=stage, model=model)} {histogram.total:g}")
+                    lines.append(f"{metric}_count{_labels(stage=stage, model=model)} {histogram.count}")
+
+        if admission:
+            gauges = (
+                ('in_flight', 'mas_admission_in_flight', 'gauge', 'Requests running on the model'),
+                ('queue_depth', 'mas_admission_queue_depth', 'gauge', 'Requests waiting for a model slot'),
+                ('limit', 'mas_admission_limit', 'gauge', 'Concurrent request limit per model'),
+                ('timeouts', 'mas_admission_timeouts_total', 'counter', 'Requests that timed out waiting for a slot'),
+                ('wait_seconds_total', 'mas_admission_wait_seconds_total', 'counter', 'Total time waiting for a slot'),
+            )
+            for field, metric, kind, help_text in gauges:
+                header(metric, kind, help_text)
+                for model, values in sorted(admission.get('models', {}).items()):
+                    lines.append(f"{metric}{_labels(model=model)} {values.get(field, 0):g}")
+
+        return '\n'.join(lines) + '\n'
+
+
+_metrics: Optional[StageMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_stage_metrics() -> StageMetrics:
+    """Метрики этапов процесса (создаются при первом обращении)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = StageMetrics()
+        return _metrics
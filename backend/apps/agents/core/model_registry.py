@@ -0,0 +1,260 @@
+"""
+Реестр моделей Ollama на процесс
+
+- Модели создаются лениво при первом обращении и переиспользуются всеми
+  LLMManager/AgentExecutor процесса: этапы с одинаковыми параметрами модели
+  получают один и тот же экземпляр ChatOllama.
+- Все экземпляры работают через общий httpx transport (один пул
+  HTTP-соединений на адрес Ollama), который передается в ChatOllama через
+  публичные sync_client_kwargs/async_client_kwargs. Async соединения
+  привязаны к event loop, поэтому для async вызовов (ainvoke/astream)
+  экземпляры и transport свои у каждого event loop, общие внутри него;
+  transport закрывается, когда loop собран сборщиком мусора, и в reset().
+- Доступность проверяется дешевым GET /api/tags (список загруженных
+  моделей, без генерации); результат кэшируется на health_ttl секунд.
+  Из корутин проверка идет через acheck_health в потоке, чтобы запрос
+  к Ollama не останавливал event loop.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEALTH_TIMEOUT_SECONDS = 2.0
+DEFAULT_OLLAMA_URL = 'http://localhost:11434'
+
+
+class ModelRegistry:
+    """Общие для процесса клиенты Ollama, экземпляры моделей и статус доступности"""
+
+    def __init__(self, health_ttl: float = 30.0):
+        self.health_ttl = health_ttl
+        self._lock = threading.RLock()
+        self._transports: Dict[str, Any] = {}
+        self._models: Dict[Tuple, Any] = {}
+        # event loop -> {'transports': {base_url: AsyncHTTPTransport}, 'models': {key: ChatOllama},
+        #                'finalizer': weakref.finalize}
+        self._loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Dict]]" = \
+            weakref.WeakKeyDictionary()
+        self._health: Dict[str, Dict[str, Any]] = {}
+
+    # --- пулы соединений ---
+
+    @staticmethod
+    def _limits(max_connections: int):
+        import httpx
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+    def _get_transport(self, base_url: str, max_connections: int) -> Any:
+        """Общий sync transport для адреса (один пул соединений)"""
+        with self._lock:
+            if base_url not in self._transports:
+                import httpx
+                self._transports[base_url] = httpx.HTTPTransport(limits=self._limits(max_connections))
+            return self._transports[base_url]
+
+    def _get_async_transport(self, base_url: str, max_connections: int) -> Any:
+        """Общий async transport для адреса в текущем event loop"""
+        transports = self._get_loop_state()['transports']
+        with self._lock:
+            if base_url not in transports:
+                import httpx
+                transports[base_url] = httpx.AsyncHTTPTransport(limits=self._limits(max_connections))
+            return transports[base_url]
+
+    def _get_loop_state(self) -> Dict[str, Any]:
+        """Пулы соединений и модели текущего event loop (вызывать из корутины)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._prune_closed_loops()
+            state = self._loop_state.get(loop)
+            if state is None:
+                transports: Dict[str, Any] = {}
+                state = self._loop_state[loop] = {
+                    'transports': transports,
+                    'models': {},
+                    # Без ссылки на loop: иначе он никогда не будет собран
+                    'finalizer': weakref.finalize(loop, _close_async_transports, transports),
+                }
+            return state
+
+    def _prune_closed_loops(self):
+        """
+        Забывает закрытые event loop (вызывается под lock)
+
+        Пока в пуле есть соединения, они ссылаются на свой loop, и finalizer
+        не сработает; закрытый loop освобождаем явно.
+        """
+        for loop in [loop for loop in self._loop_state if loop.is_closed()]:
+            state = self._loop_state.pop(loop)
+            state['finalizer'].detach()
+            _close_async_transports(state['transports'])
+
+    # --- проверка доступности ---
+
+    def check_health(self, base_url: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Доступность Ollama и список загруженных моделей через GET /api/tags
+
+        Returns:
+            {'available': bool, 'models': [...], 'checked_at': ts, 'error': ...}
+        """
+        cached = self._cached_health(base_url)
+        if cached and not force:
+            return cached
+
+        import httpx
+
+        status: Dict[str, Any] = {'available': False, 'models': [], 'checked_at': time.time()}
+        try:
+            response = httpx.get(f"{base_url.rstrip('/')}/api/tags", timeout=HEALTH_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            status['models'] = [model.get('name') for model in response.json().get('models', [])]
+            status['available'] = True
+        except Exception as e:
+            status['error'] = str(e)
+            logger.warning(f"Ollama недоступна по адресу {base_url}: {e}")
+
+        with self._lock:
+            self._health[base_url] = status
+        return status
+
+    async def acheck_health(self, base_url: str, force: bool = False) -> Dict[str, Any]:
+        """check_health для корутин: HTTP-запрос выполняется в потоке, не в event loop"""
+        cached = self._cached_health(base_url)
+        if cached and not force:
+            return cached
+        return await asyncio.to_thread(self.check_health, base_url, force)
+
+    def _cached_health(self, base_url: str, fresh: bool = True) -> Optional[Dict[str, Any]]:
+        """Последний статус адреса (fresh - только не старше health_ttl)"""
+        with self._lock:
+            cached = self._health.get(base_url)
+        if cached and (not fresh or time.time() - cached['checked_at'] < self.health_ttl):
+            return cached
+        return None
+
+    @staticmethod
+    def _model_loaded(model_name: str, loaded: list) -> bool:
+        names = set(loaded)
+        return model_name in names or (':' not in model_name and f'{model_name}:latest' in names)
+
+    # --- модели ---
+
+    def get_chat_model(self, ollama_config: Dict[str, Any], model_name: str,
+                       for_async: bool = False, output_format: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        """
+        Экземпляр ChatOllama для модели или None, если Ollama или модель недоступны
+
+        Args:
+            ollama_config: секция llm_config.ollama
+            model_name: имя модели Ollama
+            for_async: экземпляр для ainvoke/astream в текущем event loop;
+                статус берется из кэша, если он есть (его обновляет
+                acheck_health), чтобы не блокировать loop запросом к Ollama
+            output_format: JSON Schema ответа (параметр format Ollama)
+        """
+        base_url = ollama_config.get('url', DEFAULT_OLLAMA_URL)
+        temperature = ollama_config.get('temperature', 0.7)
+        num_predict = ollama_config.get('max_tokens', 4096)
+        key = (base_url, model_name, temperature, num_predict,
+               json.dumps(output_format, sort_keys=True) if output_format else None)
+        models = self._get_loop_state()['models'] if for_async else self._models
+
+        with self._lock:
+            if key in models:
+                return models[key]
+
+        health = (for_async and self._cached_health(base_url, fresh=False)) or self.check_health(base_url)
+        if not health['available']:
+            return None
+        if not self._model_loaded(model_name, health['models']):
+            logger.warning(f"Модель {model_name} не загружена в Ollama ({base_url}); доступны: {health['models']}")
+            return None
+
+        from langchain_ollama import ChatOllama
+
+        timeout = ollama_config.get('timeout')
+        max_connections = ollama_config.get('max_connections', 8)
+        with self._lock:
+            if key in models:
+                return models[key]
+            # ChatOllama создает свои клиенты на каждый экземпляр; общий transport
+            # сводит все этапы и модели к одному пулу соединений
+            if for_async:
+                transport_kwargs = {'async_client_kwargs': {
+                    'transport': self._get_async_transport(base_url, max_connections)
+                }}
+            else:
+                transport_kwargs = {'sync_client_kwargs': {
+                    'transport': self._get_transport(base_url, max_connections)
+                }}
+            llm = ChatOllama(
+                model=model_name,
+                base_url=base_url,
+                temperature=temperature,
+                num_predict=num_predict,
+                format=output_format,
+                client_kwargs={'timeout': timeout},
+                **transport_kwargs,
+            )
+            models[key] = llm
+            logger.info(f"Модель {model_name} зарегистрирована ({base_url}{', async' if for_async else ''})")
+            return llm
+
+    def reset(self):
+        """Сбрасывает модели, статусы и закрывает пулы соединений (например, после смены конфигурации)"""
+        with self._lock:
+            transports = list(self._transports.values())
+            loop_states = list(self._loop_state.items())
+            self._transports.clear()
+            self._models.clear()
+            self._loop_state.clear()
+            self._health.clear()
+        for transport in transports:
+            transport.close()
+        for loop, state in loop_states:
+            state['finalizer'].detach()
+            _close_async_transports(state['transports'], loop)
+
+
+def _close_async_transports(transports: Dict[str, Any], loop: Optional[asyncio.AbstractEventLoop] = None):
+    """
+    Закрывает async transports event loop
+
+    В работающем loop закрытие планируется в нем самом. Если loop уже
+    остановлен или собран, закрываем во временном loop в отдельном потоке
+    (вызов может прийти из корутины другого loop); соединения, которые без
+    своего loop закрыть нельзя, освобождаются вместе с сокетами.
+    """
+    for transport in list(transports.values()):
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(transport.aclose(), loop)
+        else:
+            threading.Thread(target=_aclose_quietly, args=(transport,), daemon=True).start()
+    transports.clear()
+
+
+def _aclose_quietly(transport: Any):
+    try:
+        asyncio.run(transport.aclose())
+    except Exception as e:
+        logger.debug(f"Не удалось закрыть пул соединений Ollama: {e}")
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Реестр моделей процесса (создается при первом обращении)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
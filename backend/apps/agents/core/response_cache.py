@@ -0,0 +1,159 @@
+"""
+Персистентный кэш ответов LLM
+
+Ключ - модель, температура и хеш нормализованного списка сообщений: один и
+тот же промпт (с точностью до пробелов по краям строк) не отправляется в
+Ollama повторно. Записи живут ttl_seconds, файл ограничен max_bytes
+(сначала вытесняются давно не использованные). Хранилище - SQLite в режиме
+WAL, общий файл для всех процессов API.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS llm_response_cache_lru ON llm_response_cache (last_access);
+"""
+
+
+def normalize_messages(messages: List[BaseMessage]) -> List[List[str]]:
+    """Тип и текст каждого сообщения без концевых пробелов строк"""
+    normalized = []
+    for msg in messages:
+        content = msg.content if isinstance(msg.content, str) else json.dumps(msg.content, sort_keys=True)
+        lines = [line.rstrip() for line in content.strip().splitlines()]
+        normalized.append([msg.type, "\n".join(lines)])
+    return normalized
+
+
+class LLMResponseCache:
+    """Кэш ответов LLM с TTL и ограничением размера"""
+
+    def __init__(self, path: str, ttl_seconds: int = 24 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def make_key(llm: Any, messages: List[BaseMessage]) -> Optional[str]:
+        """
+        Ключ кэша или None, если модель не кэшируется
+        (заглушки без имени модели, например FakeListChatModel)
+        """
+        model = getattr(llm, 'model', None)
+        if not model:
+            return None
+        payload = json.dumps({
+            'model': model,
+            'temperature': getattr(llm, 'temperature', None),
+            'num_predict': getattr(llm, 'num_predict', None),
+            'format': getattr(llm, 'format', None),
+            'messages': normalize_messages(messages),
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return f"{model}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE llm_response_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+        message = messages_from_dict(json.loads(zlib.decompress(row[0])))[0]
+        message.response_metadata = {**(message.response_metadata or {}), 'llm_cache': 'hit'}
+        return message
+
+    def put(self, key: str, response: BaseMessage):
+        if not isinstance(response, BaseMessage):
+            return
+        blob = zlib.compress(json.dumps(messages_to_dict([response]), ensure_ascii=False).encode('utf-8'))
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache "
+                "(key, model, value, size, created_at, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, key.split(':', 1)[0], blob, len(blob), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_response_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM llm_response_cache ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM llm_response_cache WHERE key = ?", stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, size, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM llm_response_cache"
+            ).fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': hits, 'max_bytes': self.max_bytes}
+
+
+_caches: Dict[str, LLMResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(config: Dict[str, Any]) -> Optional[LLMResponseCache]:
+    """
+    Кэш процесса по секции llm_config.response_cache (None, если выключен)
+    """
+    if not config.get('enabled', False):
+        return None
+    path = os.getenv('MAS_LLM_CACHE_PATH') or config.get('path', '/tmp/mas_llm_cache.sqlite3')
+    with _caches_lock:
+        if path not in _caches:
+            try:
+                _caches[path] = LLMResponseCache(
+                    path,
+                    ttl_seconds=config.get('ttl_seconds', 24 * 3600),
+                    max_bytes=config.get('max_bytes', 256 * 1024 * 1024),
+                )
+            except Exception as e:
+                logger.warning(f"Кэш ответов LLM недоступен: {e}")
+                return None
+        return _caches[path]
@@ -0,0 +1,510 @@
+"""
+Детерминированные ответы этапов по правилам, без LLM
+
+По профилю источника (HybridFileAnalyzer: колонки, типы, NULL, число строк)
+правила выбирают класс данных и хранилище из storage_config.default_rules,
+строят DDL под хранилище и спецификацию Airflow DAG из pipeline_config.
+
+Ответы имеют тот же JSON-формат, что и ответы модели (STAGE_SCHEMAS), и
+разбираются в MASState тем же parse_stage_output. Используются, когда
+Ollama недоступна, и как запасной ответ, если LLM не уложилась в SLO.
+Одинаковый профиль всегда дает одинаковый ответ.
+"""
+import json
+import re
+from pathlib import PurePath
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+
+from .structured_output import parse_stage_output
+
+# Классы данных - ключи storage_config.default_rules
+TRANSACTIONAL = 'transactional_data'
+ANALYTICAL = 'analytical_data'
+RAW = 'raw_data'
+TIME_SERIES = 'time_series'
+
+_USE_CASES = {
+    TRANSACTIONAL: 'transactional',
+    ANALYTICAL: 'analytical',
+    TIME_SERIES: 'analytical',
+    RAW: 'archival',
+}
+
+_STORAGE_REASONS = {
+    'postgres': 'транзакционная нагрузка, точечные чтения и обновления по ключу',
+    'clickhouse': 'аналитические запросы и агрегации по большим объемам',
+    'hdfs': 'дешевое хранение сырых и слабоструктурированных данных',
+}
+
+_COLUMN_TYPES = {
+    'postgres': {'integer': 'BIGINT', 'number': 'DOUBLE PRECISION', 'boolean': 'BOOLEAN', 'date': 'DATE',
+                 'datetime': 'TIMESTAMP', 'object': 'JSONB', 'array': 'JSONB', 'string': 'TEXT'},
+    'clickhouse': {'integer': 'Int64', 'number': 'Float64', 'boolean': 'UInt8', 'date': 'Date',
+                   'datetime': 'DateTime', 'object': 'String', 'array': 'String', 'string': 'String'},
+    'hdfs': {'integer': 'BIGINT', 'number': 'DOUBLE', 'boolean': 'BOOLEAN', 'date': 'DATE',
+             'datetime': 'TIMESTAMP', 'object': 'STRING', 'array': 'STRING', 'string': 'STRING'},
+}
+
+_CONNECTIONS = {'postgres': 'postgres_default', 'clickhouse': 'clickhouse_default', 'hdfs': 'webhdfs_default'}
+
+_TIME_NAME = re.compile(r'(^|_)(date|time|ts|timestamp|dt|datetime|created|updated)($|_)|_at$')
+_TIME_TYPES = ('date', 'datetime')
+_NUMERIC_TYPES = ('integer', 'number')
+# Синонимы типов анализаторов (колоночный режим, внешние профили)
+_TYPE_ALIASES = {'float': 'number', 'double': 'number', 'int': 'integer', 'bool': 'boolean', 'timestamp': 'datetime'}
+
+# Пороги классификации
+_ANALYTICAL_ROWS = 1_000_000
+_NESTED_SHARE = 0.3
+_NUMERIC_SHARE = 0.6
+_MEASURE_SHARE = 0.3
+
+_DAG_TEMPLATE = '''"""
+{description}
+
+Сгенерировано по правилам (без LLM): источник {source_type}, хранилище {storage}.
+"""
+from datetime import datetime, timedelta
+
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+
+default_args = {{
+    'owner': {owner!r},
+    'retries': {retries},
+    'retry_delay': timedelta(minutes={retry_delay}),
+}}
+
+COLUMNS = {columns!r}
+TARGET_TABLE = {table!r}
+TARGET_CONN_ID = {conn_id!r}
+
+
+def extract(**context):
+    """Читает источник (путь или параметры подключения - в conf запуска DAG)"""
+    import pandas as pd
+    source = context['dag_run'].conf.get('source_path')
+    frame = pd.read_{reader}(source)
+    return frame[[column for column in COLUMNS if column in frame.columns]].to_json(orient='records')
+
+
+def transform(**context):
+    import io
+    import pandas as pd
+    frame = pd.read_json(io.StringIO(context['ti'].xcom_pull(task_ids='extract')), orient='records')
+{transform_steps}
+    return frame.to_json(orient='records')
+
+
+def load(**context):
+    """Загружает результат в {storage} через подключение Airflow TARGET_CONN_ID"""
+    import io
+    import pandas as pd
+    frame = pd.read_json(io.StringIO(context['ti'].xcom_pull(task_ids='transform')), orient='records')
+    # Колонки источника -> колонки таблицы из DDL
+    frame = frame[[column for column in COLUMNS if column in frame.columns]].rename(columns=COLUMNS)
+    context['ti'].log.info(f"Загрузка {{len(frame)}} строк в {{TARGET_TABLE}} ({{TARGET_CONN_ID}})")
+{load_steps}
+
+
+with DAG(
+    dag_id={dag_id!r},
+    default_args=default_args,
+    schedule={schedule!r},
+    start_date=datetime(2024, 1, 1),
+    catchup=False,
+    tags=['ai-data-engineer', 'rule-based'],
+) as dag:
+    extract_task = PythonOperator(task_id='extract', python_callable=extract)
+    transform_task = PythonOperator(task_id='transform', python_callable=transform)
+    load_task = PythonOperator(task_id='load', python_callable=load)
+
+    extract_task >> transform_task >> load_task
+'''
+
+_TRANSFORM_STEPS = {
+    'dropna': "    frame = frame.dropna(how='all')",
+    'deduplicate': "    frame = frame.drop_duplicates({subset})",
+    'filter': "    frame = frame[frame.notna().any(axis=1)]",
+}
+
+_READERS = {'csv': 'csv', 'json': 'json', 'xml': 'xml'}
+
+# Запись в хранилище через хук провайдера Airflow (подключение TARGET_CONN_ID)
+_LOAD_STEPS = {
+    'postgres': """\
+    from airflow.providers.postgres.hooks.postgres import PostgresHook
+    rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+    PostgresHook(postgres_conn_id=TARGET_CONN_ID).insert_rows(
+        TARGET_TABLE, rows, target_fields=list(frame.columns), commit_every=10000)""",
+    'clickhouse': """\
+    from airflow_clickhouse_plugin.hooks.clickhouse import ClickHouseHook
+    rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+    columns = ', '.join(frame.columns)
+    ClickHouseHook(clickhouse_conn_id=TARGET_CONN_ID).execute(
+        f'INSERT INTO {TARGET_TABLE} ({columns}) VALUES', list(rows))""",
+    'hdfs': """\
+    from airflow.providers.apache.hdfs.hooks.webhdfs import WebHDFSHook
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+    path = f"/data/raw/{TARGET_TABLE}/load_date={context['ds']}/{context['ts_nodash']}.parquet"
+    WebHDFSHook(webhdfs_conn_id=TARGET_CONN_ID).get_conn().write(path, data=buffer.getvalue(), overwrite=True)""",
+}
+
+_LOAD_PACKAGES = {
+    'postgres': 'apache-airflow-providers-postgres',
+    'clickhouse': 'airflow-clickhouse-plugin',
+    'hdfs': 'apache-airflow-providers-apache-hdfs',
+}
+
+
+def _identifier(name: str) -> str:
+    """Имя колонки/таблицы, допустимое во всех трех диалектах"""
+    ident = re.sub(r'[^0-9a-zA-Z_]+', '_', str(name)).strip('_').lower() or 'col'
+    return f'c_{ident}' if ident[0].isdigit() else ident
+
+
+class _Profile:
+    """Нормализованный профиль источника"""
+
+    def __init__(self, metadata: Dict[str, Any], source_type: str):
+        self.source_type = (metadata.get('source_type') or source_type or 'csv').lower()
+        types = metadata.get('column_types') or {}
+        self.columns: List[str] = list(metadata.get('columns') or types)
+        self.types = {}
+        for column in self.columns:
+            column_type = str(types.get(column) or 'string').lower()
+            self.types[column] = _TYPE_ALIASES.get(column_type, column_type)
+        self.rows = int(metadata.get('total_rows') or 0)
+        self.nulls = metadata.get('null_counts') or {}
+        self.stats = metadata.get('profile') or {}
+        self.quality = metadata.get('data_quality_score')
+        self.filename = metadata.get('original_filename') or ''
+
+    def share(self, predicate) -> float:
+        if not self.columns:
+            return 0.0
+        return sum(1 for column in self.columns if predicate(column)) / len(self.columns)
+
+    def is_time(self, column: str) -> bool:
+        return self.types[column] in _TIME_TYPES or bool(_TIME_NAME.search(_identifier(column)))
+
+    def is_nested(self, column: str) -> bool:
+        return '.' in column or self.types[column] in ('object', 'array')
+
+    def is_measure(self, column: str) -> bool:
+        """Числовой показатель (идентификаторы id/*_id не считаются)"""
+        ident = _identifier(column)
+        return self.types[column] in _NUMERIC_TYPES and ident != 'id' and not ident.endswith('_id')
+
+    def nullable(self, column: str) -> bool:
+        return bool(self.nulls.get(column)) or self.rows == 0
+
+    def time_column(self) -> Optional[str]:
+        typed = [column for column in self.columns if self.types[column] in _TIME_TYPES]
+        named = [column for column in self.columns if self.is_time(column)]
+        return (typed or named or [None])[0]
+
+    def key_column(self) -> Optional[str]:
+        """Колонка-идентификатор: id или *_id без NULL и (по профилю) с уникальными значениями"""
+        candidates = [column for column in self.columns if _identifier(column) == 'id']
+        candidates += [column for column in self.columns
+                       if _identifier(column).endswith('_id') and column not in candidates]
+        for column in candidates:
+            if self.nulls.get(column):
+                continue
+            distinct = (self.stats.get(column) or {}).get('distinct_estimate')
+            if distinct is None or not self.rows or distinct >= 0.95 * self.rows:
+                return column
+        return None
+
+
+class RuleEngine:
+    """Рекомендация хранилища, DDL, спецификация пайплайна и отчет по правилам"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config: general_config (секции storage_config и pipeline_config)
+        """
+        config = config or {}
+        storage_config = config.get('storage_config') or {}
+        self.rules = {
+            TRANSACTIONAL: 'postgres', ANALYTICAL: 'clickhouse', RAW: 'hdfs', TIME_SERIES: 'clickhouse',
+            **(storage_config.get('default_rules') or {}),
+        }
+        self.available = list(storage_config.get('available_storages') or ('postgres', 'clickhouse', 'hdfs'))
+        self.pipeline_config = config.get('pipeline_config') or {}
+
+    # --- профиль ---
+
+    @staticmethod
+    def profile_from_state(state: Dict[str, Any]) -> _Profile:
+        """
+        Профиль из состояния: source_metadata или профиль анализатора файла,
+        переданный в запросе (source_metadata / metadata / analysis_result / сам запрос)
+        """
+        source_config = state.get('source_config') or {}
+        candidates = [
+            state.get('source_metadata'),
+            source_config.get('source_metadata'),
+            source_config.get('metadata'),
+            source_config.get('analysis_result'),
+            source_config.get('profile'),
+            source_config,
+        ]
+        for candidate in candidates:
+            if isinstance(candidate, dict) and ('columns' in candidate or 'column_types' in candidate):
+                return _Profile(candidate, state.get('source_type'))
+        return _Profile({}, state.get('source_type'))
+
+    # --- этапы ---
+
+    def classify(self, profile: _Profile) -> Tuple[str, List[str]]:
+        """Класс данных и причины выбора"""
+        nested = profile.share(profile.is_nested)
+        numeric = profile.share(profile.is_measure)
+        time_column = profile.time_column()
+
+        if not profile.columns:
+            return RAW, ['структура источника неизвестна - данные сохраняются как есть']
+        if profile.source_type in ('json', 'xml') and nested >= _NESTED_SHARE:
+            return RAW, [f'вложенные поля: {nested:.0%} колонок']
+        if time_column and numeric >= _MEASURE_SHARE:
+            return TIME_SERIES, [f'колонка времени {time_column}', f'числовые показатели: {numeric:.0%} колонок']
+        if profile.rows >= _ANALYTICAL_ROWS:
+            return ANALYTICAL, [f'{profile.rows} строк']
+        if numeric >= _NUMERIC_SHARE:
+            return ANALYTICAL, [f'числовые колонки: {numeric:.0%}']
+        key = profile.key_column()
+        return TRANSACTIONAL, [f'ключ {key}' if key else 'небольшой объем записей без выраженных метрик']
+
+    def storage_for(self, data_class: str) -> str:
+        storage = self.rules.get(data_class, 'postgres')
+        if storage not in self.available and self.available:
+            storage = self.available[0]
+        return storage
+
+    def input_analysis(self, profile: _Profile) -> Dict[str, Any]:
+        data_class, reasons = self.classify(profile)
+        storage = self.storage_for(data_class)
+        nested = profile.share(profile.is_nested)
+        issues = [
+            f'{column}: {count} пустых значений' for column, count in profile.nulls.items()
+            if count and profile.rows and count / profile.rows >= 0.2
+        ]
+        if profile.quality is not None and profile.quality < 80:
+            issues.append(f'оценка качества данных {profile.quality}')
+        recommendations = []
+        time_column = profile.time_column()
+        if storage == 'clickhouse' and time_column:
+            recommendations.append(f'партиционирование по месяцу {_identifier(time_column)}')
+        if profile.key_column():
+            recommendations.append(f'ключ {_identifier(profile.key_column())} для дедупликации')
+        alternatives = [name for name in dict.fromkeys(self.rules.values()) if name != storage and name in self.available]
+        return {
+            'storage_recommendation': storage,
+            'reasoning': f"Класс данных {data_class} ({'; '.join(reasons)}) - правило default_rules: {storage}",
+            'data_characteristics': {
+                'volume': 'small' if profile.rows < 100_000 else 'medium' if profile.rows < 10_000_000 else 'large',
+                'velocity': 'batch',
+                'variety': ('unstructured' if not profile.columns
+                            else 'semi-structured' if nested >= _NESTED_SHARE else 'structured'),
+                'main_use_case': _USE_CASES[data_class],
+            },
+            'optimization_recommendations': recommendations,
+            'potential_issues': issues,
+            'alternative_storages': [
+                {'storage': name, 'reason': _STORAGE_REASONS.get(name, ''), 'priority': i + 2}
+                for i, name in enumerate(alternatives)
+            ],
+        }
+
+    def table_name(self, profile: _Profile) -> str:
+        return _identifier(PurePath(profile.filename).stem if profile.filename else f'{profile.source_type}_source')
+
+    @staticmethod
+    def column_idents(profile: _Profile) -> Dict[str, str]:
+        """Колонка источника -> уникальное имя колонки таблицы (общее для DDL и DAG)"""
+        idents: Dict[str, str] = {}
+        for column in profile.columns:
+            ident = _identifier(column)
+            while ident in idents.values():
+                ident += '_'
+            idents[column] = ident
+        return idents
+
+    def ddl_generation(self, profile: _Profile, storage: str) -> Dict[str, Any]:
+        table = self.table_name(profile)
+        types = _COLUMN_TYPES.get(storage, _COLUMN_TYPES['postgres'])
+        key = profile.key_column()
+        time_column = profile.time_column()
+        ident_of = self.column_idents(profile)
+        columns = [
+            (column, ident, types.get(profile.types[column], types['string']))
+            for column, ident in ident_of.items()
+        ]
+        indexes: List[Dict[str, str]] = []
+        partitioning = ''
+        notes: List[str] = []
+
+        if storage == 'clickhouse':
+            order_by = [ident_of[c] for c in (time_column, key) if c]
+            definitions = [
+                f"    {ident} {f'Nullable({sql_type})' if profile.nullable(column) and ident not in order_by else sql_type}"
+                for column, ident, sql_type in columns
+            ]
+            engine = 'MergeTree'
+            tail = f"ENGINE = MergeTree\n"
+            if time_column and profile.types[time_column] in _TIME_TYPES:
+                partitioning = f'toYYYYMM({ident_of[time_column]})'
+                tail += f"PARTITION BY {partitioning}\n"
+            tail += f"ORDER BY ({', '.join(order_by)})" if order_by else "ORDER BY tuple()"
+            ddl = f"CREATE TABLE IF NOT EXISTS {table} (\n" + ',\n'.join(definitions) + f"\n)\n{tail};"
+            notes.append('ORDER BY по времени и ключу - основной индекс MergeTree')
+        elif storage == 'hdfs':
+            definitions = [f"    {ident} {sql_type}" for _, ident, sql_type in columns]
+            engine = 'Parquet'
+            partitioning = 'load_date'
+            ddl = (f"CREATE EXTERNAL TABLE IF NOT EXISTS {table} (\n" + ',\n'.join(definitions) +
+                   f"\n)\nPARTITIONED BY (load_date STRING)\nSTORED AS PARQUET\nLOCATION '/data/raw/{table}';")
+            notes.append('партиция на дату загрузки, формат Parquet')
+        else:
+            definitions = [
+                f"    {ident} {sql_type}{'' if profile.nullable(column) else ' NOT NULL'}"
+                for column, ident, sql_type in columns
+            ]
+            if key:
+                definitions.append(f"    PRIMARY KEY ({ident_of[key]})")
+            engine = 'heap'
+            ddl = f"CREATE TABLE IF NOT EXISTS {table} (\n" + ',\n'.join(definitions) + "\n);"
+            if time_column:
+                index = f'idx_{table}_{ident_of[time_column]}'
+                indexes.append({'name': index, 'ddl': f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({ident_of[time_column]});"})
+        if not columns:
+            notes.append('колонки источника неизвестны - таблица требует ручного описания')
+
+        return {
+            'main_table': {'name': table, 'ddl': ddl, 'engine': engine},
+            'indexes': indexes,
+            'partitioning': partitioning,
+            'comments': [f'{ident} <- {column}' for column, ident, _ in columns if ident != column],
+            'optimization_notes': notes,
+        }
+
+    def pipeline_generation(self, profile: _Profile, storage: str) -> Dict[str, Any]:
+        table = self.table_name(profile)
+        params = self.pipeline_config.get('default_params') or {}
+        supported = self.pipeline_config.get('supported_transformations') or list(_TRANSFORM_STEPS)
+        key = profile.key_column()
+
+        transformations = []
+        if 'dropna' in supported and any(profile.nulls.values()):
+            transformations.append('dropna')
+        if 'deduplicate' in supported:
+            transformations.append('deduplicate')
+        steps = [
+            _TRANSFORM_STEPS[name].format(subset=f"subset=[{key!r}]" if key else '')
+            for name in transformations
+        ] or ['    pass']
+
+        dag_id = f'{table}_etl'
+        schedule = self.pipeline_config.get('default_schedule', '0 0 * * *')
+        config = {
+            'retries': int(params.get('retries', 2)),
+            'retry_delay': params.get('retry_delay', 5),
+            'email_on_failure': False,
+        }
+        code = _DAG_TEMPLATE.format(
+            description=f'ETL {profile.source_type} -> {storage}.{table}',
+            source_type=profile.source_type,
+            storage=storage,
+            owner=params.get('owner', 'ai-data-engineer'),
+            retries=config['retries'],
+            retry_delay=config['retry_delay'],
+            columns=self.column_idents(profile),
+            table=table,
+            conn_id=_CONNECTIONS.get(storage, f'{storage}_default'),
+            reader=_READERS.get(profile.source_type, 'csv'),
+            transform_steps='\n'.join(steps),
+            load_steps=_LOAD_STEPS.get(storage, _LOAD_STEPS['postgres']),
+            dag_id=dag_id,
+            schedule=schedule,
+        )
+        return {
+            'dag_id': dag_id,
+            'schedule': schedule,
+            'transformations': transformations,
+            'dag_code': code,
+            'config': config,
+            'dependencies': [
+                _CONNECTIONS.get(storage, f'{storage}_default'),
+                _LOAD_PACKAGES.get(storage, _LOAD_PACKAGES['postgres']),
+            ],
+            'notes': ['путь к источнику передается в conf запуска (source_path)'],
+        }
+
+    def report_generation(self, state: Dict[str, Any]) -> str:
+        scripts = state.get('ddl_scripts') or []
+        pipeline_config = state.get('pipeline_config') or {}
+        profile = (state.get('data_profile') or {}).get('characteristics') or {}
+        lines = [
+            '# Отчет о настройке ETL',
+            '',
+            '## Общие сведения',
+            f"Источник: {state.get('source_type') or 'не указан'}. "
+            f"Рекомендованное хранилище: {state.get('storage_recommendation') or 'не определено'}.",
+            '',
+            '## Хранилище',
+            state.get('storage_reasoning') or '',
+        ]
+        if profile:
+            lines.append('Характеристики: ' + ', '.join(f'{name}: {value}' for name, value in profile.items()) + '.')
+        lines += ['', '## DDL']
+        lines += [f"```sql\n{script['ddl']}\n```" for script in scripts] or ['DDL не сформирован.']
+        lines += [
+            '',
+            '## Пайплайн',
+            f"DAG {pipeline_config.get('dag_id', '-')}, расписание {pipeline_config.get('schedule', '-')}, "
+            f"трансформации: {', '.join(state.get('transformations') or []) or 'нет'}.",
+            '',
+            '## Ограничения',
+            'Результат построен по правилам storage_config.default_rules без участия LLM: '
+            'рекомендуется проверить типы колонок и ключи перед развертыванием.',
+        ]
+        return '\n'.join(lines)
+
+    # --- ответы этапов ---
+
+    def stage_output(self, stage: str, state: Dict[str, Any]) -> str:
+        """Ответ этапа в формате ответа модели (JSON по STAGE_SCHEMAS, отчет - Markdown)"""
+        profile = self.profile_from_state(state)
+        if stage == 'input_analysis':
+            return json.dumps(self.input_analysis(profile), ensure_ascii=False)
+        storage = state.get('storage_recommendation') or self.input_analysis(profile)['storage_recommendation']
+        if stage == 'ddl_generation':
+            return json.dumps(self.ddl_generation(profile, storage), ensure_ascii=False)
+        if stage == 'pipeline_generation':
+            return json.dumps(self.pipeline_generation(profile, storage), ensure_ascii=False)
+        if stage == 'report_generation':
+            return self.report_generation(state)
+        raise ValueError(f"Нет правил для этапа {stage}")
+
+    def response(self, stage: str, state: Dict[str, Any]) -> AIMessage:
+        return AIMessage(content=self.stage_output(stage, state), response_metadata={'rule_based': True})
+
+    def apply(self, state: Dict[str, Any], stages: List[str]) -> Dict[str, Any]:
+        """Выполнить этапы по правилам: поля, сообщения и completed_agents как после LLM"""
+        for stage in stages:
+            message = self.response(stage, state)
+            state.update(parse_stage_output(stage, message.content))
+            message.response_metadata['structured'] = True
+            state.setdefault('messages', []).append(message)
+            if stage not in state.setdefault('completed_agents', []):
+                state['completed_agents'].append(stage)
+            state['current_agent'] = stage
+            stages = state.setdefault('execution_stats', {}).setdefault('stages', {})
+            stages.setdefault(stage, {}).update(source='rules', model='rules')
+        return state
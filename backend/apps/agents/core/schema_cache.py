@@ -0,0 +1,315 @@
+"""
+Кэш второго уровня по структуре данных (schema fingerprint)
+
+Источники, которые отличаются только значениями в data_sample, получают
+одинаковый отпечаток схемы: имена колонок, выведенные типы и доли NULL.
+Для этапов input_analysis и ddl_generation ответ модели и извлеченные поля
+состояния (storage_recommendation, ddl_scripts ...) переиспользуются для
+структурно совпадающих источников.
+
+Поиск в два шага: точное совпадение отпечатка, затем ближайшая схема с
+похожим числом колонок, если ее сходство не ниже порога этапа.
+Сходство - доля колонок объединения, совпавших по имени и типу (колонка с
+отличающейся долей NULL засчитывается наполовину: меняется NULL/NOT NULL).
+
+Ближайшая схема допустима только для этапов из NEAREST_MATCH_STAGES: DDL
+или пайплайн для схемы без одной колонки был бы просто неверным, поэтому
+остальные этапы требуют точного совпадения (порог 1.0), если порог этапа
+не задан явно в stage_thresholds.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+logger = logging.getLogger(__name__)
+
+# Поля состояния, которые этап заполняет и которые можно переиспользовать
+STAGE_FIELDS = {
+    'input_analysis': ('storage_recommendation', 'storage_reasoning', 'storage_alternatives', 'data_profile'),
+    'ddl_generation': ('ddl_scripts', 'ddl_recommendations'),
+}
+
+# Ответ этапа зависит и от результатов предыдущих этапов
+STAGE_UPSTREAM = {
+    'input_analysis': (),
+    'ddl_generation': ('storage_recommendation',),
+}
+
+# Этапы, которым подходит ответ для похожей (не идентичной) схемы
+NEAREST_MATCH_STAGES = ('input_analysis',)
+
+Schema = Dict[str, Tuple[str, float]]
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS schema_cache (
+    fingerprint TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    column_count INTEGER NOT NULL,
+    schema_json TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS schema_cache_scope_width ON schema_cache (scope, column_count);
+CREATE INDEX IF NOT EXISTS schema_cache_lru ON schema_cache (last_access);
+"""
+
+
+def _null_ratio(stats: Dict[str, Any], total_rows: Optional[int]) -> float:
+    if stats.get('null_percentage') is not None:
+        return float(stats['null_percentage']) / 100
+    if stats.get('null_ratio') is not None:
+        return float(stats['null_ratio'])
+    if stats.get('null_count') is not None and total_rows:
+        return float(stats['null_count']) / total_rows
+    return 0.0
+
+
+def _schema_from_metadata(meta: Dict[str, Any]) -> Optional[Schema]:
+    """Схема из профиля в любом из форматов анализаторов проекта"""
+    total_rows = meta.get('total_rows') or meta.get('row_count')
+    columns = meta.get('columns')
+    profile = meta.get('profile')
+    schema: Schema = {}
+
+    if isinstance(profile, dict) and profile:
+        for name, stats in profile.items():
+            schema[name] = (str(stats.get('type', 'unknown')), _null_ratio(stats, total_rows))
+    elif isinstance(columns, dict) and columns:
+        # Формат фронтенда: имя -> {dtype, null_percentage, ...} или имя -> тип
+        for name, stats in columns.items():
+            if isinstance(stats, dict):
+                dtype = stats.get('dtype') or stats.get('type', 'unknown')
+                schema[name] = (str(dtype), _null_ratio(stats, total_rows))
+            else:
+                schema[name] = (str(stats), 0.0)
+    elif isinstance(columns, list) and columns:
+        # Формат HybridFileAnalyzer: columns + column_types + null_counts
+        column_types = meta.get('column_types', {})
+        null_counts = meta.get('null_counts', {})
+        for name in columns:
+            nulls = null_counts.get(name)
+            ratio = float(nulls) / total_rows if nulls is not None and total_rows else 0.0
+            schema[str(name)] = (str(column_types.get(name, 'unknown')), ratio)
+    return schema or None
+
+
+def extract_schema(state: Dict[str, Any]) -> Optional[Schema]:
+    """
+    Схема источника из source_metadata или из результата анализа в source_config
+
+    Returns:
+        {нормализованное имя колонки: (тип, доля NULL)} или None
+    """
+    candidates = [state.get('source_metadata')]
+    source_config = state.get('source_config') or {}
+    if isinstance(source_config, dict):
+        candidates += [
+            source_config.get('analysis_result'),
+            source_config.get('metadata'),
+            (source_config.get('analysis_result') or {}).get('metadata')
+            if isinstance(source_config.get('analysis_result'), dict) else None,
+            source_config,
+        ]
+    for meta in candidates:
+        if isinstance(meta, dict):
+            schema = _schema_from_metadata(meta)
+            if schema:
+                return {name.strip().lower(): (dtype.lower(), ratio) for name, (dtype, ratio) in schema.items()}
+    return None
+
+
+def schema_fingerprint(schema: Schema, null_ratio_tolerance: float) -> str:
+    """Канонический отпечаток: доли NULL округляются до шага null_ratio_tolerance"""
+    step = max(null_ratio_tolerance, 1e-6)
+    canonical = sorted((name, dtype, round(ratio / step)) for name, (dtype, ratio) in schema.items())
+    return hashlib.sha256(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+
+def schema_similarity(left: Schema, right: Schema, null_ratio_tolerance: float) -> float:
+    names = set(left) | set(right)
+    if not names:
+        return 0.0
+    score = 0.0
+    for name in names:
+        if name not in left or name not in right:
+            continue
+        (left_type, left_nulls), (right_type, right_nulls) = left[name], right[name]
+        if left_type != right_type:
+            continue
+        score += 1.0 if abs(left_nulls - right_nulls) <= null_ratio_tolerance else 0.5
+    return score / len(names)
+
+
+class SchemaCache:
+    """Кэш ответов этапов по отпечатку схемы источника"""
+
+    def __init__(self,
+                 path: str,
+                 similarity_threshold: float = 0.95,
+                 null_ratio_tolerance: float = 0.05,
+                 ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 5000,
+                 stage_thresholds: Optional[Dict[str, float]] = None):
+        self.path = path
+        # Порог поиска ближайшей схемы для NEAREST_MATCH_STAGES
+        self.similarity_threshold = similarity_threshold
+        # Явные пороги по этапам; остальным этапам нужен точный отпечаток
+        self.stage_thresholds = {stage: float(value) for stage, value in (stage_thresholds or {}).items()}
+        self.null_ratio_tolerance = null_ratio_tolerance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA_SQL)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Соединение с commit/rollback и закрытием на выходе"""
+        # with sqlite3.Connection только завершает транзакцию, но не закрывает соединение
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_scope(stage: str, model: str, state: Dict[str, Any]) -> str:
+        """Область поиска: этап, модель, тип источника и входы от предыдущих этапов"""
+        upstream = {name: state.get(name) for name in STAGE_UPSTREAM.get(stage, ())}
+        payload = json.dumps([stage, model, state.get('source_type'), upstream], sort_keys=True, default=str)
+        return f"{stage}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+    def threshold_for(self, stage: str) -> float:
+        """Минимальное сходство схемы для переиспользования ответа этапа"""
+        if stage in self.stage_thresholds:
+            return self.stage_thresholds[stage]
+        if stage in NEAREST_MATCH_STAGES:
+            return self.similarity_threshold
+        return 1.0
+
+    def lookup(self, scope: str, schema: Schema) -> Optional[Tuple[BaseMessage, Dict[str, Any], float]]:
+        """
+        Returns:
+            (ответ модели, поля состояния, сходство) или None
+        """
+        now = time.time()
+        fingerprint = schema_fingerprint(schema, self.null_ratio_tolerance)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, value FROM schema_cache WHERE scope = ? AND fingerprint = ? AND created_at >= ?",
+                (scope, fingerprint, now - self.ttl_seconds),
+            ).fetchone()
+            similarity = 1.0
+            threshold = self.threshold_for(scope.partition(':')[0])
+            if row is None and threshold < 1.0:
+                row, similarity = self._nearest(conn, scope, schema, now, threshold)
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE schema_cache SET last_access = ?, hits = hits + 1 WHERE scope = ? AND fingerprint = ?",
+                (now, scope, row[0]),
+            )
+        value = json.loads(zlib.decompress(row[1]))
+        response = messages_from_dict(value['response'])[0]
+        response.response_metadata = {
+            **(response.response_metadata or {}), 'semantic_cache': 'hit', 'schema_similarity': round(similarity, 4)
+        }
+        return response, value['fields'], similarity
+
+    def _nearest(self, conn: sqlite3.Connection, scope: str, schema: Schema, now: float, threshold: float):
+        # При пороге t схема шире/уже более чем в 1/t раз пройти его не может
+        width = len(schema)
+        low = math.floor(width * threshold)
+        high = math.ceil(width / max(threshold, 1e-6))
+        best, best_score = None, 0.0
+        rows = conn.execute(
+            "SELECT fingerprint, value, schema_json FROM schema_cache "
+            "WHERE scope = ? AND column_count BETWEEN ? AND ? AND created_at >= ?",
+            (scope, low, high, now - self.ttl_seconds),
+        )
+        for fingerprint, value, schema_json in rows:
+            candidate = {name: (dtype, ratio) for name, dtype, ratio in json.loads(schema_json)}
+            score = schema_similarity(schema, candidate, self.null_ratio_tolerance)
+            if score > best_score:
+                best, best_score = (fingerprint, value), score
+        if best is None or best_score < threshold:
+            return None, 0.0
+        return best, best_score
+
+    def store(self, scope: str, schema: Schema, response: BaseMessage, fields: Dict[str, Any]):
+        if not isinstance(response, BaseMessage):
+            return
+        now = time.time()
+        value = zlib.compress(json.dumps({
+            'response': messages_to_dict([response]),
+            'fields': fields,
+        }, ensure_ascii=False, default=str).encode('utf-8'))
+        schema_json = json.dumps(sorted([name, dtype, ratio] for name, (dtype, ratio) in schema.items()))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_cache "
+                "(fingerprint, scope, column_count, schema_json, value, created_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (schema_fingerprint(schema, self.null_ratio_tolerance), scope, len(schema), schema_json,
+                 value, now, now),
+            )
+            conn.execute("DELETE FROM schema_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM schema_cache WHERE rowid IN ("
+                "SELECT rowid FROM schema_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM schema_cache"
+            ).fetchone()
+        return {
+            'entries': entries,
+            'hits': hits,
+            'similarity_thresholds': {stage: self.threshold_for(stage) for stage in STAGE_FIELDS},
+        }
+
+
+_caches: Dict[str, SchemaCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_schema_cache(config: Dict[str, Any]) -> Optional[SchemaCache]:
+    """Кэш процесса по секции llm_config.semantic_cache (None, если выключен)"""
+    if not config.get('enabled', False):
+        return None
+    path = os.getenv('MAS_SCHEMA_CACHE_PATH') or config.get('path', '/tmp/mas_schema_cache.sqlite3')
+    with _caches_lock:
+        if path not in _caches:
+            try:
+                _caches[path] = SchemaCache(
+                    path,
+                    similarity_threshold=float(config.get('similarity_threshold', 0.95)),
+                    null_ratio_tolerance=float(config.get('null_ratio_tolerance', 0.05)),
+                    ttl_seconds=config.get('ttl_seconds', 7 * 24 * 3600),
+                    max_entries=config.get('max_entries', 5000),
+                    stage_thresholds=config.get('stage_thresholds'),
+                )
+            except Exception as e:
+                logger.warning(f"Кэш по схеме данных недоступен: {e}")
+                return None
+        return _caches[path]
@@ -0,0 +1,156 @@
+"""
+Граф этапов пайплайна
+
+Каждый этап объявляет ключи MASState, которые читает (reads) и пишет
+(writes). Этап зависит от всех этапов, пишущих читаемые им ключи, и
+запускается сразу после них; независимые этапы выполняются параллельно.
+
+Параллельные этапы работают с копиями состояния, поэтому не видят
+промежуточных изменений друг друга. Результат копии переносится в общее
+состояние по завершении этапа; списки messages/completed_agents/errors/
+warnings собираются в порядке объявления этапов, чтобы итог (и промпты
+следующих этапов) не зависел от того, какой этап закончил первым.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .state import MASState
+
+logger = logging.getLogger(__name__)
+
+# Списки, которые этапы дополняют, а не перезаписывают
+APPEND_KEYS = ('messages', 'completed_agents', 'errors', 'warnings')
+
+DEFAULT_STAGES = {
+    'input_analysis': {
+        'reads': ['source_config', 'source_metadata', 'data_sample'],
+        'writes': ['storage_recommendation', 'storage_reasoning', 'storage_alternatives', 'data_profile'],
+    },
+    'ddl_generation': {
+        'reads': ['storage_recommendation', 'data_profile'],
+        'writes': ['ddl_scripts', 'ddl_recommendations'],
+    },
+    'pipeline_generation': {
+        'reads': ['storage_recommendation', 'data_profile'],
+        'writes': ['pipeline_code', 'pipeline_config', 'transformations'],
+    },
+    'report_generation': {
+        'reads': ['storage_recommendation', 'ddl_scripts', 'pipeline_code', 'pipeline_config'],
+        'writes': ['report', 'report_sections'],
+    },
+}
+
+StageRunner = Callable[[str, MASState], Awaitable[MASState]]
+
+
+class Stage:
+    """Этап графа: имя и ключи состояния, которые он читает и пишет"""
+
+    def __init__(self, name: str, reads: Iterable[str] = (), writes: Iterable[str] = ()):
+        self.name = name
+        self.reads = tuple(reads)
+        self.writes = tuple(writes)
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, reads={list(self.reads)}, writes={list(self.writes)})"
+
+
+class StageGraph:
+    """Планировщик этапов по зависимостям между ключами состояния"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        writers: Dict[str, List[str]] = {}
+        for stage in stages:
+            for key in stage.writes:
+                writers.setdefault(key, []).append(stage.name)
+        self.dependencies = {
+            stage.name: {writer for key in stage.reads for writer in writers.get(key, ()) if writer != stage.name}
+            for stage in stages
+        }
+        self._check_acyclic()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], names: Iterable[str]) -> 'StageGraph':
+        """
+        Граф из секции agents_config.stages (по умолчанию DEFAULT_STAGES)
+
+        Args:
+            config: {имя этапа: {'reads': [...], 'writes': [...]}}
+            names: этапы в порядке объявления
+        """
+        config = config or DEFAULT_STAGES
+        stages = []
+        for name in names:
+            spec = config.get(name) or DEFAULT_STAGES.get(name, {})
+            stages.append(Stage(name, spec.get('reads', ()), spec.get('writes', ())))
+        return cls(stages)
+
+    def _check_acyclic(self):
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Циклическая зависимость между этапами: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    async def run(self, state: MASState, run_stage: StageRunner) -> MASState:
+        """
+        Выполнить все этапы; state обновляется на месте и возвращается
+
+        Args:
+            state: Состояние МАС
+            run_stage: корутина (имя этапа, копия состояния) -> копия после этапа.
+                Ошибки этапа она записывает в errors копии; исключение из нее
+                отменяет остальные этапы и пробрасывается.
+        """
+        order = [stage.name for stage in self.stages]
+        base = {key: list(state.get(key) or []) for key in APPEND_KEYS}
+        outputs: Dict[str, Dict[str, list]] = {}
+        pending = list(order)
+        running: Dict[asyncio.Task, tuple] = {}
+
+        try:
+            while pending or running:
+                for name in list(pending):
+                    if self.dependencies[name] <= outputs.keys():
+                        pending.remove(name)
+                        branch = self._fork(state)
+                        snapshot = dict(branch)
+                        forked_lengths = {key: len(branch[key]) for key in APPEND_KEYS}
+                        running[asyncio.ensure_future(run_stage(name, branch))] = (name, snapshot, forked_lengths)
+                        logger.debug(f"Этап {name} запущен")
+                if not running:
+                    raise RuntimeError(f"Этапы не могут быть запущены: {pending}")
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(finished, key=lambda t: order.index(running[t][0])):
+                    name, snapshot, forked_lengths = running.pop(task)
+                    branch = task.result()
+                    outputs[name] = {
+                        key: list(branch.get(key) or [])[forked_lengths[key]:] for key in APPEND_KEYS
+                    }
+                    for key, value in branch.items():
+                        if key not in APPEND_KEYS and (key not in snapshot or snapshot[key] is not value):
+                            state[key] = value
+                    for key in APPEND_KEYS:
+                        state[key] = base[key] + [
+                            item for done in order if done in outputs for item in outputs[done][key]
+                        ]
+        finally:
+            for task in running:
+                task.cancel()
+
+        return state
+
+    @staticmethod
+    def _fork(state: MASState) -> MASState:
+        """Копия состояния для этапа: дополняемые списки копируются, остальное общее"""
+        branch = MASState(**state)
+        for key in APPEND_KEYS:
+            branch[key] = list(state.get(key) or [])
+        return branch
@@ -44,6 +44,11 @@ class MASState(TypedDict, total=False):
     next_agent: Optional[str]
     completed_agents: List[str]
 
+    # Per-request options
+    use_llm_cache: Optional[bool]
+    # Admission queue priority: 'interactive' (user is waiting on the stage) or 'batch'
+    priority: Optional[str]
+
     # Feedback
     user_feedback: Optional[Dict[str, Any]]
     user_confirmations: Optional[Dict[str, bool]]
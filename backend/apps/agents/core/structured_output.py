@@ -0,0 +1,268 @@
+"""
+Структурированный ответ этапов
+
+Для этапов с JSON-ответом (форматы из unified_prompt.yaml) модель получает
+JSON Schema в параметре format Ollama: генерация ограничена схемой, и ответ
+разбирается одним json.loads без повторного запроса к модели. Разобранный
+ответ проверяется по той же схеме и раскладывается в поля MASState
+(storage_recommendation, ddl_scripts, pipeline_code, ...). Следующие этапы
+получают эти поля в контексте вместо полного текста прошлых ответов.
+
+Отчет (report_generation) остается Markdown: его текст пишется в report,
+разделы второго уровня - в report_sections.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+STORAGES = ('postgres', 'clickhouse', 'hdfs')
+_STORAGE_ALIASES = {'postgresql': 'postgres', 'pg': 'postgres', 'hive': 'hdfs', 'spark': 'hdfs'}
+
+_STRING_LIST = {'type': 'array', 'items': {'type': 'string'}}
+
+# JSON Schema ответов этапов (передаются в format Ollama)
+STAGE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    'input_analysis': {
+        'type': 'object',
+        'properties': {
+            'storage_recommendation': {'type': 'string', 'enum': list(STORAGES)},
+            'reasoning': {'type': 'string'},
+            'data_characteristics': {
+                'type': 'object',
+                'properties': {
+                    'volume': {'type': 'string', 'enum': ['small', 'medium', 'large']},
+                    'velocity': {'type': 'string', 'enum': ['batch', 'streaming', 'real-time']},
+                    'variety': {'type': 'string', 'enum': ['structured', 'semi-structured', 'unstructured']},
+                    'main_use_case': {'type': 'string', 'enum': ['transactional', 'analytical', 'archival']},
+                },
+                'required': ['volume', 'velocity', 'variety', 'main_use_case'],
+            },
+            'optimization_recommendations': _STRING_LIST,
+            'potential_issues': _STRING_LIST,
+            'alternative_storages': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'storage': {'type': 'string'},
+                        'reason': {'type': 'string'},
+                        'priority': {'type': 'integer'},
+                    },
+                    'required': ['storage', 'reason'],
+                },
+            },
+        },
+        'required': ['storage_recommendation', 'reasoning', 'data_characteristics'],
+    },
+    'ddl_generation': {
+        'type': 'object',
+        'properties': {
+            'main_table': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string'},
+                    'ddl': {'type': 'string'},
+                    'engine': {'type': 'string'},
+                },
+                'required': ['name', 'ddl'],
+            },
+            'indexes': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {'name': {'type': 'string'}, 'ddl': {'type': 'string'}},
+                    'required': ['name', 'ddl'],
+                },
+            },
+            'partitioning': {'type': 'string'},
+            'comments': _STRING_LIST,
+            'optimization_notes': _STRING_LIST,
+        },
+        'required': ['main_table'],
+    },
+    'pipeline_generation': {
+        'type': 'object',
+        'properties': {
+            'dag_id': {'type': 'string'},
+            'schedule': {'type': 'string'},
+            'transformations': _STRING_LIST,
+            'dag_code': {'type': 'string'},
+            'config': {
+                'type': 'object',
+                'properties': {
+                    'retries': {'type': 'integer'},
+                    'retry_delay': {'type': 'number'},
+                    'email_on_failure': {'type': 'boolean'},
+                },
+            },
+            'dependencies': _STRING_LIST,
+            'notes': _STRING_LIST,
+        },
+        'required': ['dag_id', 'schedule', 'dag_code'],
+    },
+}
+
+
+class StructuredOutputError(ValueError):
+    """Ответ этапа не разобран или не соответствует схеме"""
+
+
+# --- разбор и проверка ---
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def extract_json(text: str) -> Any:
+    """
+    JSON из ответа модели
+
+    С format ответ - чистый JSON; без него (заглушка, старый кэш) модель
+    может обернуть его в ```json ... ``` или добавить текст вокруг объекта.
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    candidate = _FENCE.sub('', text)
+    start, end = candidate.find('{'), candidate.rfind('}')
+    if start == -1 or end <= start:
+        raise StructuredOutputError("В ответе нет JSON-объекта")
+    try:
+        return json.loads(candidate[start:end + 1])
+    except ValueError as e:
+        raise StructuredOutputError(f"Некорректный JSON в ответе: {e}") from e
+
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = '$') -> List[str]:
+    """Ошибки соответствия подмножеству JSON Schema (type/properties/required/items/enum)"""
+    expected = schema.get('type')
+    if expected:
+        python_type = _TYPES[expected]
+        # bool - подкласс int, но не число в смысле схемы
+        if not isinstance(value, python_type) or (expected in ('integer', 'number') and isinstance(value, bool)):
+            return [f"{path}: ожидается {expected}, получено {type(value).__name__}"]
+    errors = []
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} не из {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get('required', ()):
+            if key not in value:
+                errors.append(f"{path}: нет поля {key}")
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value and value[key] is not None:
+                errors.extend(validate(value[key], subschema, f"{path}.{key}"))
+    elif isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{i}]"))
+    return errors
+
+
+# --- поля состояния ---
+
+def _input_analysis(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'storage_recommendation': data['storage_recommendation'],
+        'storage_reasoning': data.get('reasoning'),
+        'storage_alternatives': data.get('alternative_storages') or [],
+        'data_profile': {
+            'characteristics': data.get('data_characteristics') or {},
+            'optimization_recommendations': data.get('optimization_recommendations') or [],
+            'potential_issues': data.get('potential_issues') or [],
+        },
+    }
+
+
+def _ddl_generation(data: Dict[str, Any]) -> Dict[str, Any]:
+    main = data['main_table']
+    scripts = [{'name': main['name'], 'type': 'table', 'ddl': main['ddl']}]
+    scripts.extend({'name': index['name'], 'type': 'index', 'ddl': index['ddl']} for index in data.get('indexes') or [])
+    return {
+        'ddl_scripts': scripts,
+        'ddl_recommendations': {
+            'engine': main.get('engine'),
+            'partitioning': data.get('partitioning'),
+            'comments': data.get('comments') or [],
+            'optimization_notes': data.get('optimization_notes') or [],
+        },
+    }
+
+
+def _pipeline_generation(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'pipeline_code': data['dag_code'],
+        'pipeline_config': {
+            'dag_id': data['dag_id'],
+            'schedule': data['schedule'],
+            **(data.get('config') or {}),
+            'dependencies': data.get('dependencies') or [],
+            'notes': data.get('notes') or [],
+        },
+        'transformations': data.get('transformations') or [],
+    }
+
+
+_SECTION_HEADING = re.compile(r'^##\s+(.+?)\s*$', re.MULTILINE)
+
+
+def _report_generation(content: str) -> Dict[str, Any]:
+    sections: Dict[str, str] = {}
+    headings = list(_SECTION_HEADING.finditer(content))
+    for heading, following in zip(headings, headings[1:] + [None]):
+        end = following.start() if following else len(content)
+        sections[heading.group(1)] = content[heading.end():end].strip()
+    return {'report': content.strip(), 'report_sections': sections}
+
+
+_MAPPERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    'input_analysis': _input_analysis,
+    'ddl_generation': _ddl_generation,
+    'pipeline_generation': _pipeline_generation,
+}
+
+# Этапы, ответ которых раскладывается в поля состояния
+PARSED_STAGES = tuple(_MAPPERS) + ('report_generation',)
+
+
+def _normalize(stage: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Мелкие расхождения без ограничения схемой: регистр и синонимы хранилищ"""
+    if stage == 'input_analysis' and isinstance(data.get('storage_recommendation'), str):
+        storage = data['storage_recommendation'].strip().lower()
+        data['storage_recommendation'] = _STORAGE_ALIASES.get(storage, storage)
+    return data
+
+
+def parse_stage_output(stage: str, content: str) -> Dict[str, Any]:
+    """
+    Поля MASState из ответа этапа
+
+    Raises:
+        StructuredOutputError: ответ не JSON или не соответствует схеме этапа
+    """
+    if stage == 'report_generation':
+        return _report_generation(content)
+    if stage not in _MAPPERS:
+        return {}
+    data = extract_json(content)
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"Ожидается JSON-объект, получено {type(data).__name__}")
+    data = _normalize(stage, data)
+    errors = validate(data, STAGE_SCHEMAS[stage])
+    if errors:
+        raise StructuredOutputError("; ".join(errors[:5]))
+    return _MAPPERS[stage](data)
+
+
+def output_format(stage: str) -> Optional[Dict[str, Any]]:
+    """JSON Schema для параметра format Ollama (None - ответ свободным текстом)"""
+    return STAGE_SCHEMAS.get(stage)
@@ -1,25 +1,33 @@
 """
-Интеграция LLM (Ollama) с Django API с последовательными этапами
+Интеграция LLM (Ollama) с Django API: этапы выполняются по графу зависимостей
 """
 import asyncio
+import copy
 import logging
+import threading
+import time
 import uuid
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable, List
 from pathlib import Path
 
 from .core import (
     MASState,
     LLMManager,
     AgentExecutor,
+    StageGraph,
 )
+from .core.config_cache import files_signature
+from .core.rule_engine import RuleEngine
+from .core.session_store import SessionConflict, get_session_store, snapshot_state, state_delta
+from .core.stage_graph import APPEND_KEYS
 
 logger = logging.getLogger(__name__)
 
 
 class LLMIntegration:
     """
-    Интеграция последовательного пайплайна на одной локальной LLM
+    Интеграция пайплайна этапов на одной локальной LLM
     """
     
     def __init__(self):
@@ -30,6 +38,20 @@ class LLMIntegration:
         self.ddl_generator = AgentExecutor(agent_name='ddl_generation', llm_manager=self.llm_manager)
         self.pipeline_generator = AgentExecutor(agent_name='pipeline_generation', llm_manager=self.llm_manager)
         self.report_generator = AgentExecutor(agent_name='report_generation', llm_manager=self.llm_manager)
+        self.stages = {
+            executor.agent_name: executor
+            for executor in (self.input_analyzer, self.ddl_generator, self.pipeline_generator, self.report_generator)
+        }
+        # Зависимости этапов по ключам состояния (agents_config.stages)
+        self.stage_graph = StageGraph.from_config(
+            self.llm_manager.config.get('agents_config', {}).get('stages'), self.stages
+        )
+        # Сессии analyze_with_feedback (секция session_store)
+        self.session_store = get_session_store(self.llm_manager.config.get('session_store'))
+        # Запасной ответ по правилам при промахе SLO (agents_config.fallback)
+        self.rule_engine = RuleEngine(self.llm_manager.config)
+        # Запросы к LLM, оставленные дорабатывать после промаха SLO
+        self._background: set = set()
         
     async def analyze_data_source(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -47,8 +69,8 @@ class LLMIntegration:
             # Создаем начальное состояние
             initial_state = self._create_initial_state(request_data)
             
-            # Запускаем этапы последовательно в одном процессе
-            result = await self._run_sequential(initial_state)
+            # Запускаем этапы по графу зависимостей (независимые - параллельно)
+            result = await self._run_stages(initial_state)
             
             # Форматируем результат для API
             response = self._format_response(result)
@@ -56,6 +78,9 @@ class LLMIntegration:
             logger.info("Анализ успешно завершен")
             return response
             
+        except asyncio.CancelledError:
+            logger.info("Анализ источника данных отменен")
+            raise
         except Exception as e:
             logger.error(f"Ошибка анализа источника данных: {e}")
             return {
@@ -64,6 +89,80 @@ class LLMIntegration:
                 'message': 'Произошла ошибка при анализе источника данных'
             }
     
+    async def analyze_data_source_stream(self, request_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый анализ: фрагменты ответа модели отдаются по мере генерации
+        
+        События (поле 'event'):
+            start - execution_id и список этапов, отдается сразу
+            stage_start / stage_end - границы этапа (stage_end с длительностью и ошибками этапа)
+            token - фрагмент ответа модели текущего этапа
+            done - итоговый ответ, как у analyze_data_source
+            error - анализ прерван
+        """
+        runner = None
+        try:
+            logger.info(f"Начало потокового анализа источника данных: {request_data.get('source_type', 'unknown')}")
+            state = self._create_initial_state(request_data)
+            # Пользователь смотрит на поток - обслуживается раньше пакетных анализов
+            state['priority'] = 'interactive'
+            yield {
+                'event': 'start',
+                'execution_id': state['execution_id'],
+                'stages': list(self.stages),
+                'dependencies': {name: sorted(deps) for name, deps in self.stage_graph.dependencies.items()}
+            }
+            
+            # Параллельные этапы пишут события в общую очередь; фрагменты
+            # разных этапов различаются полем stage
+            events: asyncio.Queue = asyncio.Queue()
+            
+            async def run_stage(name: str, branch: MASState) -> MASState:
+                started = time.monotonic()
+                errors_before = len(branch.get('errors', []))
+                await events.put({'event': 'stage_start', 'stage': name})
+                async for event in self.stages[name].astream(branch):
+                    await events.put(event)
+                await events.put({
+                    'event': 'stage_end',
+                    'stage': name,
+                    'elapsed_seconds': round(time.monotonic() - started, 3),
+                    'errors': branch.get('errors', [])[errors_before:]
+                })
+                return branch
+            
+            runner = asyncio.ensure_future(self.stage_graph.run(state, run_stage))
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                while not events.empty():
+                    yield events.get_nowait()
+                break
+            runner.result()
+            
+            yield {'event': 'done', 'result': self._format_response(state)}
+            logger.info("Потоковый анализ успешно завершен")
+            
+        except (asyncio.CancelledError, GeneratorExit):
+            # Клиент отключился: поток к Ollama закрывается вместе с генератором
+            logger.info("Потоковый анализ отменен: клиент отключился")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка потокового анализа источника данных: {e}")
+            yield {
+                'event': 'error',
+                'status': 'error',
+                'error': str(e),
+                'message': 'Произошла ошибка при анализе источника данных'
+            }
+        finally:
+            if runner is not None and not runner.done():
+                runner.cancel()
+    
     async def analyze_with_feedback(self, 
                                    request_data: Dict[str, Any],
                                    session_id: Optional[str] = None) -> Dict[str, Any]:
@@ -78,10 +177,9 @@ class LLMIntegration:
             Результат текущего этапа анализа
         """
         try:
-            if session_id and self._has_session(session_id):
+            state = self._load_session(session_id) if session_id else None
+            if state is not None:
                 # Продолжаем существующую сессию
-                state = self._load_session(session_id)
-                
                 # Применяем обратную связь, если есть
                 if 'user_feedback' in request_data:
                     state['user_feedback'] = request_data['user_feedback']
@@ -93,8 +191,11 @@ class LLMIntegration:
                 state['interactive_mode'] = True
                 state['session_id'] = session_id
             
+            # Пользователь ждет этап - запросы к модели идут раньше пакетных
+            state['priority'] = 'interactive'
+            
             # Выполняем один шаг последовательного пайплайна (в будущем добавим ожидание и комментарии от пользователя)
-            state = self._run_next_stage(state)
+            state = await self._run_next_stage(state)
             
             # Сохраняем состояние сессии
             self._save_session(session_id, state)
@@ -104,6 +205,15 @@ class LLMIntegration:
             
             return response
             
+        except SessionConflict as e:
+            # Параллельный запрос к той же сессии: клиент должен повторить шаг
+            logger.warning(f"Конфликт версий сессии {session_id}: {e}")
+            return {
+                'status': 'error',
+                'error': str(e),
+                'error_code': 'session_conflict',
+                'session_id': session_id
+            }
         except Exception as e:
             logger.error(f"Ошибка интерактивного анализа: {e}")
             return {
@@ -131,34 +241,118 @@ class LLMIntegration:
             start_time=datetime.now().isoformat(),
             completed_agents=[],
             errors=[],
-            warnings=[]
+            warnings=[],
+            # Общий для параллельных этапов словарь: каждый пишет в stages[имя]
+            execution_stats={},
+            # use_llm_cache: false - не брать ответы LLM из кэша для этого запроса
+            use_llm_cache=request_data.get('use_llm_cache', True),
+            # Очередь к Ollama: интерактивные режимы переопределяют на 'interactive'
+            priority='batch'
         )
         
         return state
     
-    async def _run_sequential(self, initial_state: MASState) -> MASState:
+    async def _run_stages(self, initial_state: MASState) -> MASState:
         """
-        Последовательный запуск этапов: анализ -> DDL -> пайплайн -> отчет
+        Запуск этапов по графу: анализ -> (DDL || пайплайн) -> отчет
+        
+        Этапы ждут модель через ainvoke, поэтому один event loop
+        обслуживает много анализов одновременно.
         """
-        state = initial_state
-        state = self.input_analyzer.execute(state)
-        state = self.ddl_generator.execute(state)
-        state = self.pipeline_generator.execute(state)
-        state = self.report_generator.execute(state)
-        return state
+        async def run_stage(name: str, branch: MASState) -> MASState:
+            return await self.stages[name].aexecute(branch)
+        
+        async def run(state: MASState) -> MASState:
+            return await self.stage_graph.run(state, run_stage)
+        
+        return await self._run_with_fallback(initial_state, list(self.stages), run, 'slo_seconds')
     
-    def _run_next_stage(self, state: MASState) -> MASState:
+    async def _run_next_stage(self, state: MASState) -> MASState:
         """Выполнить следующий этап на основе состояния"""
         current = state.get('current_agent')
         if current is None:
-            return self.input_analyzer.execute(state)
-        if current == 'input_analysis':
-            return self.ddl_generator.execute(state)
-        if current == 'ddl_generation':
-            return self.pipeline_generator.execute(state)
-        if current == 'pipeline_generation':
-            return self.report_generator.execute(state)
-        return state
+            executor = self.input_analyzer
+        elif current == 'input_analysis':
+            executor = self.ddl_generator
+        elif current == 'ddl_generation':
+            executor = self.pipeline_generator
+        elif current == 'pipeline_generation':
+            executor = self.report_generator
+        else:
+            return state
+        return await self._run_with_fallback(state, [executor.agent_name], executor.aexecute, 'stage_slo_seconds')
+    
+    @staticmethod
+    def _fork_state(state: MASState) -> MASState:
+        """Копия состояния для отдельной ветви: журналы и статистика не общие с исходным"""
+        fork = MASState(**state)
+        for key in APPEND_KEYS:
+            fork[key] = list(state.get(key) or [])
+        fork['execution_stats'] = copy.deepcopy(state.get('execution_stats') or {})
+        return fork
+    
+    async def _run_with_fallback(self,
+                                 state: MASState,
+                                 stages: List[str],
+                                 run: Callable[[MASState], Awaitable[MASState]],
+                                 slo_key: str) -> MASState:
+        """
+        Этапы LLM со спекулятивным ответом по правилам (agents_config.fallback)
+        
+        Ответ RuleEngine для тех же этапов строится в потоке одновременно с
+        запросами к модели. Если LLM не уложилась в SLO (slo_key), возвращается
+        ответ по правилам, а запрос к модели отменяется или, при
+        continue_in_background, дорабатывает и наполняет кэши ответов.
+        Этапы, завершившиеся ошибкой LLM, дополняются ответом по правилам.
+        """
+        fallback = self.llm_manager.config.get('agents_config', {}).get('fallback') or {}
+        slo = fallback.get(slo_key)
+        if not fallback.get('enabled', False) or not slo:
+            return await run(state)
+        
+        # У правил и у LLM свои копии: этапы меняют состояние на месте, а
+        # дорабатывающая в фоне LLM не должна трогать состояние вызывающего
+        rules = asyncio.ensure_future(asyncio.to_thread(self.rule_engine.apply, self._fork_state(state), stages))
+        errors_before = len(state.get('errors') or [])
+        llm = asyncio.ensure_future(run(self._fork_state(state)))
+        
+        try:
+            result = await asyncio.wait_for(asyncio.shield(llm), timeout=slo)
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM не уложилась в SLO {slo:g} с для {stages}, ответ по правилам")
+            if fallback.get('continue_in_background', False):
+                self._background.add(llm)
+                llm.add_done_callback(self._background.discard)
+            else:
+                llm.cancel()
+            result = await rules
+            result.setdefault('warnings', []).append({
+                'agent': 'fallback',
+                'warning': f"LLM не уложилась в {slo:g} с, ответ построен по правилам без модели",
+                'timestamp': datetime.now().isoformat()
+            })
+            result.setdefault('execution_stats', {})['fallback'] = {'reason': 'slo', 'slo_seconds': slo, 'stages': stages}
+            return result
+        except BaseException:
+            llm.cancel()
+            rules.cancel()
+            raise
+        
+        rules.cancel()
+        failed = [
+            stage for stage in stages
+            if any(error.get('agent') == stage for error in (result.get('errors') or [])[errors_before:])
+        ]
+        if failed:
+            # Поля упавших этапов - по правилам от полей, которые LLM успела построить
+            self.rule_engine.apply(result, failed)
+            result.setdefault('warnings', []).append({
+                'agent': 'fallback',
+                'warning': f"Этапы {', '.join(failed)} построены по правилам после ошибки LLM",
+                'timestamp': datetime.now().isoformat()
+            })
+            result.setdefault('execution_stats', {})['fallback'] = {'reason': 'error', 'stages': failed}
+        return result
     
     def _format_response(self, state: MASState) -> Dict[str, Any]:
         """
@@ -184,13 +378,44 @@ class LLMIntegration:
             'pipeline_config': state.get('pipeline_config', {}),
             'pipeline_code': state.get('pipeline_code', ''),
             'report': state.get('report', ''),
-            'execution_stats': state.get('execution_stats', {}),
+            'execution_stats': self._finalize_stats(state),
             'errors': state.get('errors', []),
             'warnings': state.get('warnings', [])
         }
         
         return response
     
+    def _finalize_stats(self, state: MASState) -> Dict[str, Any]:
+        """
+        Итоги выполнения в execution_stats: end_time, общая длительность и суммы по этапам
+        
+        DDL и пайплайн идут параллельно, поэтому сумма wall_seconds этапов
+        может быть больше total_seconds; slowest_stage - этап с наибольшим
+        временем, главный кандидат на оптимизацию.
+        """
+        stats = state.get('execution_stats') or {}
+        state['execution_stats'] = stats
+        if not state.get('end_time'):
+            state['end_time'] = datetime.now().isoformat()
+        stats['start_time'] = state.get('start_time')
+        stats['end_time'] = state['end_time']
+        if state.get('start_time'):
+            elapsed = datetime.fromisoformat(state['end_time']) - datetime.fromisoformat(state['start_time'])
+            stats['total_seconds'] = round(elapsed.total_seconds(), 3)
+        
+        stages = list(stats.get('stages', {}).values())
+        stats['totals'] = {
+            'prompt_tokens': sum((stage.get('prompt_tokens') or {}).get('actual') or 0 for stage in stages),
+            'completion_tokens': sum(stage.get('completion_tokens') or 0 for stage in stages),
+            'queue_wait_seconds': round(sum(stage.get('queue_wait_seconds') or 0 for stage in stages), 3),
+            'llm_seconds': round(sum(stage.get('llm_seconds') or 0 for stage in stages), 3),
+            'retries': sum(stage.get('retries') or 0 for stage in stages),
+            'cache_hits': sum(1 for stage in stages if stage.get('cache')),
+        }
+        if stages:
+            stats['slowest_stage'] = max(stats['stages'], key=lambda name: stats['stages'][name].get('wall_seconds') or 0)
+        return stats
+    
     def _format_interactive_response(self, state: MASState, session_id: str) -> Dict[str, Any]:
         """
         Форматирование ответа для интерактивного режима
@@ -251,20 +476,7 @@ class LLMIntegration:
         
         return response
     
-    def _has_session(self, session_id: str) -> bool:
-        """
-        Проверка наличия сессии
-        
-        Args:
-            session_id: ID сессии
-            
-        Returns:
-            True если сессия существует
-        """
-        session_file = Path(f'/tmp/mas_sessions/{session_id}.json')
-        return session_file.exists()
-    
-    def _load_session(self, session_id: str) -> MASState:
+    def _load_session(self, session_id: str) -> Optional[MASState]:
         """
         Загрузка состояния сессии
         
@@ -272,50 +484,36 @@ class LLMIntegration:
             session_id: ID сессии
             
         Returns:
-            Сохраненное состояние
+            Сохраненное состояние или None, если сессии нет. Версия и базовая
+            копия для расчета дельты хранятся в служебных ключах _session_*
         """
-        import json
-        
-        session_file = Path(f'/tmp/mas_sessions/{session_id}.json')
-        
-        with open(session_file, 'r', encoding='utf-8') as f:
-            state_dict = json.load(f)
-        
-        # Преобразуем словарь обратно в MASState
+        loaded = self.session_store.load(session_id)
+        if loaded is None:
+            return None
+        state_dict, version = loaded
         state = MASState(**state_dict)
+        state['_session_version'] = version
+        state['_session_baseline'] = snapshot_state(state)
         return state
     
     def _save_session(self, session_id: str, state: MASState):
         """
-        Сохранение состояния сессии
+        Сохранение шага сессии: дописывается только дельта к загруженному состоянию
         
         Args:
             session_id: ID сессии
             state: Текущее состояние
+            
+        Raises:
+            SessionConflict: сессию изменил другой запрос после загрузки
         """
-        import json
-        
-        session_dir = Path('/tmp/mas_sessions')
-        session_dir.mkdir(exist_ok=True)
-        
-        session_file = session_dir / f'{session_id}.json'
-        
-        # Конвертируем состояние в сериализуемый формат
-        state_dict = {}
-        for key, value in state.items():
-            if value is not None and not key.startswith('_'):
-                try:
-                    json.dumps(value)  # Проверяем сериализуемость
-                    state_dict[key] = value
-                except (TypeError, ValueError):
-                    # Пропускаем несериализуемые объекты или сохраняем как строку
-                    if hasattr(value, 'content'):
-                        state_dict[key] = str(value.content)
-                    else:
-                        state_dict[key] = str(value)
-        
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(state_dict, f, ensure_ascii=False, indent=2)
+        delta = state_delta(state.get('_session_baseline') or {}, state)
+        version = self.session_store.append(
+            session_id, delta, state.get('_session_version', 0),
+            state={key: value for key, value in state.items() if not key.startswith('_')},
+        )
+        state['_session_version'] = version
+        state['_session_baseline'] = snapshot_state(state)
     
     async def get_pipeline_code(self, execution_id: str) -> Optional[str]:
         """
@@ -344,3 +542,77 @@ class LLMIntegration:
         # Здесь можно реализовать загрузку из БД или файловой системы
         # Пока возвращаем заглушку
         return None
+
+
+# --- Экземпляр интеграции на процесс ---
+
+CONFIG_DIR = Path(__file__).parent / 'config'
+# Как часто проверять mtime конфигов и промптов (секунды)
+RELOAD_CHECK_INTERVAL = 2.0
+
+_integration: Optional[LLMIntegration] = None
+_integration_signature: Optional[tuple] = None
+_last_reload_check = 0.0
+_integration_lock = threading.Lock()
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _watched_files() -> list:
+    """general_config.yaml и все файлы промптов (включая legacy *_prompt.yaml)"""
+    prompts_dir = CONFIG_DIR / 'prompts'
+    prompt_files = sorted(prompts_dir.glob('*.yaml')) if prompts_dir.exists() else []
+    return [CONFIG_DIR / 'general_config.yaml', *prompt_files]
+
+
+def get_integration() -> LLMIntegration:
+    """
+    Общий для процесса LLMIntegration
+    
+    Создается один раз (обычно в AgentsConfig.ready) и пересоздается, когда
+    меняются YAML конфигурации или промптов. Запросы, которые уже работают
+    со старым экземпляром, дорабатывают на нем.
+    """
+    global _integration, _integration_signature, _last_reload_check
+    
+    now = time.monotonic()
+    if _integration is not None and now - _last_reload_check < RELOAD_CHECK_INTERVAL:
+        return _integration
+    
+    with _integration_lock:
+        signature = files_signature(_watched_files())
+        _last_reload_check = now
+        if _integration is None or signature != _integration_signature:
+            if _integration is not None:
+                logger.info("Конфигурация или промпты изменились, пересоздаем LLMIntegration")
+            _integration = LLMIntegration()
+            _integration_signature = signature
+        return _integration
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop процесса в фоновом потоке (создается при первом обращении)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='mas-event-loop', daemon=True).start()
+        return _loop
+
+
+def run_async(coro, timeout: Optional[float] = None) -> Any:
+    """
+    Выполнить корутину в общем event loop процесса и дождаться результата
+    
+    Для синхронного кода (DRF views, фоновые задачи) вместо asyncio.run:
+    анализы из разных потоков ждут Ollama в одном loop и делят один пул
+    соединений. Если ожидание прервано (таймаут, исключение в вызывающем
+    потоке), задача в loop отменяется.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
@@ -0,0 +1,319 @@
+"""
+Фоновая очистка временных файлов: брошенные chunked загрузки и /tmp/mas_temp
+
+Janitor периодически:
+- удаляет загрузки без активности дольше UPLOAD_TTL_SECONDS;
+- при превышении глобальной квоты UPLOADS_MAX_TOTAL_BYTES удаляет самые
+  давно неактивные загрузки (LRU по mtime);
+- не трогает загрузки, которые держит финализация (uploads.hold_upload):
+  их задача анализа может еще стоять в очереди;
+- удаляет промежуточные результаты агентов старше MAS_TEMP_TTL_SECONDS и
+  самые старые из них сверх MAS_TEMP_MAX_BYTES.
+
+Квота на одну загрузку (UPLOAD_MAX_BYTES) и глобальная квота проверяются
+еще при приеме чанка через check_upload_quota: при превышении оценки чанк
+отклоняется, а пересчет будит фоновый поток (обход дерева в потоке запроса
+не выполняется).
+
+Каталог промежуточных результатов тот же, что у исполнителей агентов
+(MAS_TEMP_DIR или paths.temp_dir в general_config.yaml).
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .uploads import chunked_uploads_root, upload_released
+
+logger = logging.getLogger(__name__)
+
+
+class UploadQuotaExceeded(Exception):
+    """Чанк не помещается в квоту загрузки или в общую квоту диска"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        # Общая квота может освободиться после очистки - клиент может повторить
+        self.retryable = retryable
+
+
+def _setting(name: str, default: Any) -> Any:
+    return getattr(settings, name, default)
+
+
+def _dir_usage(path: str) -> Tuple[int, float]:
+    """Размер директории в байтах и время последней записи в нее"""
+    total = 0
+    last_modified = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            last_modified = max(last_modified, stat.st_mtime)
+    return total, last_modified
+
+
+class Janitor:
+    """Периодическая очистка и учет дискового пространства временных файлов"""
+
+    def __init__(self,
+                 uploads_root: Optional[str] = None,
+                 temp_dir: Optional[str] = None,
+                 interval: Optional[float] = None):
+        self.uploads_root = uploads_root or chunked_uploads_root()
+        if temp_dir is None:
+            from apps.agents.core.config_cache import mas_temp_dir
+            temp_dir = mas_temp_dir()
+        self.temp_dir = temp_dir
+        self.interval = interval or _setting('JANITOR_INTERVAL_SECONDS', 300)
+        self.upload_ttl = _setting('UPLOAD_TTL_SECONDS', 24 * 3600)
+        self.upload_min_idle = _setting('UPLOAD_MIN_IDLE_SECONDS', 120)
+        self.upload_max_bytes = _setting('UPLOAD_MAX_BYTES', 20 * 1024 ** 3)
+        self.uploads_max_total_bytes = _setting('UPLOADS_MAX_TOTAL_BYTES', 100 * 1024 ** 3)
+        self.temp_ttl = _setting('MAS_TEMP_TTL_SECONDS', 7 * 24 * 3600)
+        self.temp_max_bytes = _setting('MAS_TEMP_MAX_BYTES', 1024 ** 3)
+
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Внеочередной обход (превышена оценка квоты)
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Байты, принятые после последнего обхода (обход пересчитывает точно)
+        self._written_since_sweep = 0
+        self._metrics: Dict[str, Any] = {
+            'sweeps': 0,
+            'last_sweep_at': None,
+            'last_sweep_seconds': 0.0,
+            'uploads_active': 0,
+            'uploads_bytes': 0,
+            'temp_files': 0,
+            'temp_bytes': 0,
+            'uploads_evicted_ttl': 0,
+            'uploads_evicted_quota': 0,
+            'temp_files_evicted': 0,
+            'bytes_freed': 0,
+            'quota_rejections': 0,
+            'errors': 0,
+        }
+
+    # --- фоновый поток ---
+
+    def start(self):
+        """Запускает фоновый поток (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+            self._thread.start()
+        logger.info(f"🧹 Janitor запущен: интервал {self.interval}s, {self.uploads_root}, {self.temp_dir}")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                self._bump('errors')
+                logger.exception(f"❌ Ошибка очистки временных файлов: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def request_sweep(self):
+        """
+        Внеочередной обход в фоне: будит поток janitor, а если он не
+        запущен (JANITOR_ENABLED=false) - выполняет один обход в отдельном потоке
+        """
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+        if running:
+            self._wake.set()
+        elif not self._sweep_lock.locked():
+            threading.Thread(target=self._sweep_once, name='upload-janitor-once', daemon=True).start()
+
+    def _sweep_once(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            self._bump('errors')
+            logger.exception(f"❌ Ошибка очистки временных файлов: {e}")
+
+    # --- квоты ---
+
+    def check_upload_quota(self, upload_bytes: int, incoming_bytes: int):
+        """
+        Проверяет квоты перед приемом чанка
+
+        Args:
+            upload_bytes: уже принято байт в этой загрузке
+            incoming_bytes: размер нового чанка
+
+        Raises:
+            UploadQuotaExceeded: превышена квота загрузки или общая квота
+        """
+        if upload_bytes + incoming_bytes > self.upload_max_bytes:
+            self._bump('quota_rejections')
+            raise UploadQuotaExceeded(
+                f'Превышена квота загрузки: {upload_bytes + incoming_bytes} > {self.upload_max_bytes} bytes'
+            )
+        with self._lock:
+            projected = self._metrics['uploads_bytes'] + self._written_since_sweep + incoming_bytes
+        if projected > self.uploads_max_total_bytes:
+            # Оценка могла устареть: пересчет и очистка идут в фоне, а чанк
+            # отклоняется - клиент повторит его после Retry-After
+            self.request_sweep()
+            self._bump('quota_rejections')
+            raise UploadQuotaExceeded(
+                f'Нет места для загрузок: {projected} > {self.uploads_max_total_bytes} bytes',
+                retryable=True
+            )
+
+    def record_write(self, nbytes: int):
+        """Учитывает принятый чанк до следующего обхода"""
+        with self._lock:
+            self._written_since_sweep += nbytes
+
+    # --- обход ---
+
+    def sweep(self) -> Dict[str, Any]:
+        """Один проход очистки; возвращает метрики"""
+        with self._sweep_lock:
+            started = time.monotonic()
+            now = time.time()
+            self._sweep_uploads(now)
+            self._sweep_temp(now)
+            with self._lock:
+                self._metrics['sweeps'] += 1
+                self._metrics['last_sweep_at'] = now
+                self._metrics['last_sweep_seconds'] = round(time.monotonic() - started, 3)
+        return self.metrics()
+
+    def _remove_upload(self, upload_dir: str, size: int, reason: str) -> bool:
+        """Удаляет загрузку, если ее не держит финализация; возвращает True при удалении"""
+        with upload_released(upload_dir) as released:
+            if not released:
+                logger.info(f"🧹 Загрузка {os.path.basename(upload_dir)} финализируется, не удаляем ({reason})")
+                return False
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        self._bump(f'uploads_evicted_{reason}')
+        self._bump('bytes_freed', size)
+        logger.info(f"🧹 Удалена загрузка {os.path.basename(upload_dir)} ({reason}): {size} bytes")
+        return True
+
+    def _sweep_uploads(self, now: float):
+        uploads: List[Tuple[float, int, str]] = []
+        if os.path.isdir(self.uploads_root):
+            for name in os.listdir(self.uploads_root):
+                upload_dir = os.path.join(self.uploads_root, name)
+                if not os.path.isdir(upload_dir):
+                    continue
+                try:
+                    size, last_modified = _dir_usage(upload_dir)
+                except FileNotFoundError:
+                    continue
+                if now - last_modified > self.upload_ttl and self._remove_upload(upload_dir, size, 'ttl'):
+                    continue
+                uploads.append((last_modified, size, upload_dir))
+
+        total = sum(size for _, size, _ in uploads)
+        if total > self.uploads_max_total_bytes:
+            # Самые давно неактивные первыми; текущие и финализируемые загрузки не трогаем
+            for last_modified, size, upload_dir in sorted(uploads):
+                if total <= self.uploads_max_total_bytes:
+                    break
+                if now - last_modified < self.upload_min_idle:
+                    continue
+                if not self._remove_upload(upload_dir, size, 'quota'):
+                    continue
+                uploads.remove((last_modified, size, upload_dir))
+                total -= size
+
+        with self._lock:
+            self._metrics['uploads_active'] = len(uploads)
+            self._metrics['uploads_bytes'] = total
+            self._written_since_sweep = 0
+
+    def _sweep_temp(self, now: float):
+        files: List[Tuple[float, int, str]] = []
+        if os.path.isdir(self.temp_dir):
+            for entry in os.scandir(self.temp_dir):
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        kept = len(files)
+        for mtime, size, path in files:
+            if now - mtime <= self.temp_ttl and total <= self.temp_max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            kept -= 1
+            self._bump('temp_files_evicted')
+            self._bump('bytes_freed', size)
+
+        with self._lock:
+            self._metrics['temp_files'] = kept
+            self._metrics['temp_bytes'] = total
+
+    # --- метрики ---
+
+    def _bump(self, name: str, value: int = 1):
+        with self._lock:
+            self._metrics[name] += value
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._metrics,
+                'quotas': {
+                    'upload_max_bytes': self.upload_max_bytes,
+                    'uploads_max_total_bytes': self.uploads_max_total_bytes,
+                    'temp_max_bytes': self.temp_max_bytes,
+                    'upload_ttl_seconds': self.upload_ttl,
+                    'temp_ttl_seconds': self.temp_ttl,
+                },
+            }
+
+
+_janitor: Optional[Janitor] = None
+_janitor_lock = threading.Lock()
+
+
+def get_janitor() -> Janitor:
+    """Janitor процесса (создается при первом обращении)"""
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            _janitor = Janitor()
+        return _janitor
+
+
+def start_janitor() -> Optional[Janitor]:
+    """Запускает фоновую очистку, если она не отключена JANITOR_ENABLED"""
+    if not _setting('JANITOR_ENABLED', True):
+        return None
+    janitor = get_janitor()
+    janitor.start()
+    return janitor
@@ -0,0 +1,326 @@
+"""
+Фоновые задачи анализа: запрос сразу получает job_id, работа идет в пуле
+
+- Оркестрация задач (staging, инкрементальный хвост, очистка) - ограниченный
+  ThreadPoolExecutor (ANALYSIS_JOB_WORKERS) с ограниченной очередью
+  (ANALYSIS_JOB_MAX_PENDING): при переполнении задача отклоняется, а не
+  копится в памяти.
+- CPU-bound профилирование - общий для процесса пул процессов
+  (analyzers.parallel_profiler.get_process_pool, ANALYSIS_PROCESS_WORKERS),
+  чтобы тяжелый анализ не держал GIL процесса с API. Пул запускается через
+  forkserver: fork процесса API с живыми потоками может унести в дочерний
+  процесс чужую захваченную блокировку.
+
+Состояние задач хранится в памяти процесса: при нескольких процессах
+API опрос статуса должен попадать в тот же процесс (sticky sessions).
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'success', 'failed')
+FINISHED_STATUSES = ('success', 'failed')
+
+# Long polling статуса держит поток WSGI воркера, поэтому ожидание короткое;
+# дольше ждать - через SSE (job_events_view, async)
+JOB_POLL_MAX_WAIT_SECONDS = 5.0
+
+
+def parse_poll_wait(raw: Optional[str]) -> float:
+    """
+    Параметр wait опроса статуса: неотрицательное конечное число секунд
+    (ограничивается JOB_POLL_MAX_WAIT_SECONDS)
+
+    Raises:
+        ValueError: не число, отрицательное, inf или nan
+    """
+    wait = float(raw or 0)
+    if not 0 <= wait < math.inf:
+        raise ValueError(f'Некорректный параметр wait: {raw}')
+    return min(wait, JOB_POLL_MAX_WAIT_SECONDS)
+
+
+class JobQueueFull(Exception):
+    """Все воркеры заняты и очередь задач заполнена"""
+
+
+class Job:
+    """Состояние одной фоновой задачи"""
+
+    def __init__(self, kind: str, details: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.details = details or {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Растет при каждом изменении: SSE отдает событие только при новой версии
+        self.version = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress, 1),
+            'details': self.details,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """Очередь фоновых задач анализа с ограниченным числом воркеров"""
+
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 max_pending: Optional[int] = None,
+                 process_workers: Optional[int] = None):
+        cpu_count = os.cpu_count() or 1
+        self.workers = workers or getattr(settings, 'ANALYSIS_JOB_WORKERS', min(4, cpu_count))
+        self.max_pending = max_pending or getattr(settings, 'ANALYSIS_JOB_MAX_PENDING', 32)
+        self.process_workers = process_workers or getattr(settings, 'ANALYSIS_PROCESS_WORKERS', cpu_count)
+        self.retention = getattr(settings, 'ANALYSIS_JOB_RETENTION_SECONDS', 3600)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analysis-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = 0
+
+    # --- задачи ---
+
+    def submit(self, kind: str, fn: Callable[[Job], Dict[str, Any]],
+               details: Optional[Dict[str, Any]] = None) -> Job:
+        """
+        Ставит задачу в очередь; fn(job) возвращает результат задачи
+
+        Raises:
+            JobQueueFull: в очереди уже max_pending задач
+        """
+        with self._lock:
+            self._evict_finished()
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f'Очередь анализа заполнена ({self._pending} задач)')
+            job = Job(kind, details)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"🗂️ Задача {kind} поставлена в очередь: {job.id}")
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]):
+        self.update(job, status='running', stage='running', started_at=time.time())
+        try:
+            result = fn(job)
+            self.update(job, status='success', stage='done', progress=100.0, result=result,
+                        finished_at=time.time())
+            logger.info(f"✅ Задача {job.kind} завершена: {job.id}")
+        except Exception as e:
+            logger.exception(f"❌ Ошибка задачи {job.kind} {job.id}: {e}")
+            self.update(job, status='failed', stage='failed', error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def update(self, job: Job, **fields):
+        """Обновляет поля задачи и будит ожидающих (опрос / SSE)"""
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for_change(self, job: Job, version: int, timeout: float) -> int:
+        """Блокирует до изменения задачи или таймаута; возвращает текущую версию"""
+        with self._lock:
+            self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def _evict_finished(self):
+        """Забывает завершенные задачи старше retention (вызывается под lock)"""
+        threshold = time.time() - self.retention
+        stale = [job_id for job_id, job in self._jobs.items()
+                 if job.finished and job.finished_at and job.finished_at < threshold]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+    # --- CPU-bound работа ---
+
+    def run_in_process(self, fn: Callable, *args, **kwargs) -> Any:
+        """Выполняет fn в пуле процессов и ждет результат (из потока задачи)"""
+        from analyzers.parallel_profiler import get_process_pool
+        return get_process_pool(self.process_workers).submit(fn, *args, **kwargs).result()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status = {status: 0 for status in JOB_STATUSES}
+            for job in self._jobs.values():
+                by_status[job.status] += 1
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'jobs': by_status,
+            }
+
+
+async def job_events(job: Job, poll_interval: float = 0.5, keep_alive_every: int = 30) -> AsyncIterator[str]:
+    """
+    SSE поток задачи: progress при каждом изменении, в конце done/failed
+    с результатом; keep-alive после keep_alive_every опросов без изменений
+    """
+    from .sse import KEEP_ALIVE, sse_event
+
+    version = -1
+    idle_ticks = 0
+    while True:
+        if job.version != version:
+            version = job.version
+            idle_ticks = 0
+            finished = job.finished
+            event = ('done' if job.status == 'success' else 'failed') if finished else 'progress'
+            yield sse_event(event, job.to_dict(include_result=finished))
+            if finished:
+                return
+        else:
+            idle_ticks += 1
+            if idle_ticks % keep_alive_every == 0:
+                # Комментарий SSE не дает прокси закрыть соединение
+                yield KEEP_ALIVE
+        await asyncio.sleep(poll_interval)
+
+
+def analyze_file(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """HybridFileAnalyzer.analyze_uploaded_file для запуска в пуле процессов"""
+    from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+    return HybridFileAnalyzer().analyze_uploaded_file(**kwargs)
+
+
+def run_analysis(job: Optional[Job], content_hash: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+    """
+    Профилирование файла: в фоновой задаче - в пуле процессов, иначе на месте
+
+    Режим parallel сам запускает процессы, поэтому выполняется в потоке задачи.
+    С content_hash результат сохраняется в кэш анализа.
+    """
+    if job is None or kwargs.get('mode') == 'parallel':
+        result = analyze_file(kwargs)
+    else:
+        manager = get_job_manager()
+        manager.update(job, stage='profiling')
+        result = manager.run_in_process(analyze_file, kwargs)
+    if content_hash:
+        store_cached_analysis(content_hash, result, **kwargs)
+    return result
+
+
+def _analysis_cache_key(content_hash: str, source_type: str, mode: str, sample_size: int, **_) -> str:
+    from analyzers.result_cache import AnalysisCache
+    return AnalysisCache.make_key(content_hash, source_type, mode, sample_size)
+
+
+def lookup_cached_analysis(content_hash: Optional[str], **kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Готовый результат анализа тех же байт с теми же параметрами
+
+    kwargs - аргументы analyze_uploaded_file; имя файла берется из текущего запроса.
+    """
+    if not content_hash:
+        return None
+    try:
+        # Открытие кэша тоже может упасть (read-only том, битый файл): работаем без кэша
+        cache = get_analysis_cache()
+        if cache is None:
+            return None
+        result = cache.get(_analysis_cache_key(content_hash, **kwargs))
+    except Exception as e:
+        logger.warning(f"⚠️ Кэш анализа недоступен: {e}")
+        return None
+    if result is not None:
+        result['original_filename'] = kwargs.get('original_filename', result.get('original_filename'))
+        logger.info(f"⚡ Результат анализа взят из кэша: {content_hash}")
+    return result
+
+
+def store_cached_analysis(content_hash: str, result: Dict[str, Any], **kwargs):
+    try:
+        cache = get_analysis_cache()
+        if cache is None:
+            return
+        cache.put(_analysis_cache_key(content_hash, **kwargs), result)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить результат в кэш анализа: {e}")
+
+
+_analysis_cache = None
+
+
+def get_analysis_cache():
+    """Кэш результатов анализа процесса или None, если отключен (ANALYSIS_CACHE_ENABLED)"""
+    global _analysis_cache
+    if not getattr(settings, 'ANALYSIS_CACHE_ENABLED', True):
+        return None
+    with _manager_lock:
+        if _analysis_cache is None:
+            from analyzers.result_cache import AnalysisCache
+            _analysis_cache = AnalysisCache(
+                getattr(settings, 'ANALYSIS_CACHE_PATH', '/tmp/mas_analysis_cache.sqlite3'),
+                getattr(settings, 'ANALYSIS_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+            )
+        return _analysis_cache
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Менеджер задач процесса (создается при первом обращении)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def wants_async(request) -> bool:
+    """Клиент просит фоновую задачу: async=true в форме или query string"""
+    value = request.data.get('async') or request.query_params.get('async') or 'false'
+    return str(value).lower() == 'true'
+
+
+def wants_cache(request) -> bool:
+    """Кэш анализа используется, если клиент не передал use_cache=false"""
+    value = request.data.get('use_cache') or request.query_params.get('use_cache') or 'true'
+    return str(value).lower() != 'false'
@@ -0,0 +1,27 @@
+"""
+Server-Sent Events для потоковых ответов API
+
+Каждое событие - блок ``event: <имя>`` / ``data: <JSON>`` с пустой строкой
+в конце; комментарий ``: keep-alive`` не дает прокси закрыть соединение.
+Поток уходит клиенту по мере генерации только под ASGI (config/asgi.py).
+"""
+import json
+from typing import Any, AsyncIterator
+
+from django.http import StreamingHttpResponse
+
+KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def sse_event(event: str, payload: Any) -> str:
+    """Одно событие SSE; payload сериализуется в одну строку JSON"""
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingHttpResponse:
+    """Ответ text/event-stream без кэширования и буферизации в nginx"""
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,357 @@
+"""
+Хранилище чанков для chunked upload и сборка файла без лишних копий
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Режимы сборки в FinalizeChunkedUploadView
+ASSEMBLY_MODES = ('virtual', 'copy')
+
+# Состояние инкрементального анализа хранится рядом с .meta файлами чанков
+INCREMENTAL_STATE_FILE = 'analysis.state'
+INCREMENTAL_LOCK_FILE = 'analysis.lock'
+# Разделяемый flock на этом файле держит финализация (от приема запроса до
+# конца фоновой задачи); janitor удаляет загрузку только под эксклюзивным
+UPLOAD_HOLD_FILE = 'finalize.lock'
+FEED_BLOCK_BYTES = 8 * 1024 * 1024
+
+# Алгоритм хеша чанка, если клиент прислал хеш без префикса "<алгоритм>:"
+DEFAULT_HASH_ALGORITHM = 'sha256'
+CHUNK_HASH_ALGORITHMS = ('sha256', 'sha1', 'md5', 'sha512', 'blake2b')
+
+
+class ChunkIntegrityError(ValueError):
+    """Хеш принятого чанка не совпал с присланным клиентом"""
+
+# Ошибки, при которых ядро не умеет копировать между этими файлами
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def chunked_uploads_root() -> str:
+    """Корневая директория всех chunked загрузок"""
+    return os.path.join(settings.FILE_UPLOAD_TEMP_DIR or '/tmp', 'chunked_uploads')
+
+
+def upload_dir_for(upload_id: str) -> str:
+    """
+    Директория чанков конкретной загрузки
+
+    Raises:
+        ValueError: upload_id не является одним компонентом пути ("..", "a/b")
+    """
+    if upload_id in ('', '.', '..') or os.sep in upload_id or (os.altsep and os.altsep in upload_id):
+        raise ValueError(f'Некорректный upload_id: {upload_id!r}')
+    return os.path.join(chunked_uploads_root(), upload_id)
+
+
+def chunk_path(upload_dir: str, index: int) -> str:
+    return os.path.join(upload_dir, f'chunk_{index:04d}')
+
+
+def chunk_meta_path(upload_dir: str, index: int) -> str:
+    return os.path.join(upload_dir, f'chunk_{index:04d}.meta')
+
+
+def write_atomic(path: str, data: bytes):
+    """Запись через временный файл и rename: читатели не видят недописанный файл"""
+    # Уникальное имя: параллельные повторы одного чанка не пишут в общий tmp
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def parse_chunk_hash(chunk_hash: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Разбирает хеш чанка от клиента: "sha256:<hex>" или просто "<hex>" (sha256)
+
+    Returns:
+        (алгоритм, hex в нижнем регистре) или None, если хеш не передан
+    """
+    if not chunk_hash:
+        return None
+    algorithm, _, digest = chunk_hash.strip().rpartition(':')
+    algorithm = (algorithm or DEFAULT_HASH_ALGORITHM).lower().replace('-', '')
+    if algorithm not in CHUNK_HASH_ALGORITHMS:
+        raise ValueError(f'Неподдерживаемый алгоритм хеша: {algorithm}')
+    return algorithm, digest.lower()
+
+
+def store_chunk(upload_dir: str, index: int, blocks: Iterable[bytes],
+                chunk_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Потоково пишет чанк и одновременно считает его хеш
+
+    Чанк пишется во временный файл с уникальным именем и переименовывается
+    только после проверки, поэтому чанки можно принимать параллельно
+    и в любом порядке, а повторная отправка просто заменяет файл.
+
+    Returns:
+        Поля для .meta: size, sha256, verified, hash_algorithm
+
+    Raises:
+        ChunkIntegrityError: хеш не совпал (временный файл удаляется)
+    """
+    expected = parse_chunk_hash(chunk_hash)
+    sha256 = hashlib.sha256()
+    client_hasher = None
+    if expected and expected[0] != 'sha256':
+        client_hasher = hashlib.new(expected[0])
+
+    path = chunk_path(upload_dir, index)
+    part_path = f'{path}.{uuid.uuid4().hex}.part'
+    size = 0
+    try:
+        with open(part_path, 'wb') as f:
+            for block in blocks:
+                f.write(block)
+                sha256.update(block)
+                if client_hasher:
+                    client_hasher.update(block)
+                size += len(block)
+        if expected:
+            actual = (client_hasher or sha256).hexdigest()
+            if actual != expected[1]:
+                raise ChunkIntegrityError(
+                    f'Хеш чанка {index} не совпадает: ожидался {expected[1]}, получен {actual}'
+                )
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+    return {
+        'size': size,
+        'sha256': sha256.hexdigest(),
+        'verified': expected is not None,
+        'hash_algorithm': expected[0] if expected else None,
+    }
+
+
+def read_chunks_meta(upload_dir: str) -> List[Dict[str, Any]]:
+    """Метаданные всех сохраненных чанков, отсортированные по индексу"""
+    chunks_info = []
+    for file in os.listdir(upload_dir):
+        if file.endswith('.meta'):
+            with open(os.path.join(upload_dir, file), 'r') as f:
+                chunks_info.append(json.load(f))
+    chunks_info.sort(key=lambda x: x['index'])
+    return chunks_info
+
+
+def recorded_total_chunks(chunks_info: List[Dict[str, Any]]) -> Optional[int]:
+    """
+    Количество чанков, записанное в .meta при приеме
+
+    Returns:
+        Общее значение total_chunks или None, если чанки пришли с разными значениями
+    """
+    totals = {info.get('total_chunks') for info in chunks_info}
+    if len(totals) != 1:
+        return None
+    return totals.pop()
+
+
+def upload_status(upload_dir: str, total_chunks: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Состояние возобновляемой загрузки: какие чанки уже приняты и проверены
+
+    Чанк считается принятым, только если есть и файл, и его .meta
+    (оба пишутся атомарно, .meta последним).
+    """
+    chunks_info = read_chunks_meta(upload_dir) if os.path.isdir(upload_dir) else []
+    received = [info for info in chunks_info if os.path.exists(chunk_path(upload_dir, info['index']))]
+    if total_chunks is None and chunks_info:
+        total_chunks = max(info.get('total_chunks', 0) for info in chunks_info)
+    received_indexes = {info['index'] for info in received}
+    missing = [i for i in range(total_chunks or 0) if i not in received_indexes]
+    return {
+        'total_chunks': total_chunks,
+        'received_chunks': sorted(received_indexes),
+        'verified_chunks': sorted(info['index'] for info in received if info.get('verified')),
+        'missing_chunks': missing,
+        'received_bytes': sum(info.get('size', 0) for info in received),
+        'complete': bool(total_chunks) and not missing,
+    }
+
+
+def ordered_chunk_paths(upload_dir: str, chunks_info: List[Dict[str, Any]]) -> List[str]:
+    """Пути к файлам чанков в порядке индексов (только существующие)"""
+    paths = [chunk_path(upload_dir, info['index']) for info in chunks_info]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _copy_range(src_fd: int, dst_fd: int, count: int) -> int:
+    """
+    Копирование count байт внутри ядра: copy_file_range (Linux, Python 3.8+),
+    затем sendfile; данные не проходят через память процесса
+    """
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    copied = 0
+    while copied < count:
+        if copy_file_range is not None:
+            n = copy_file_range(src_fd, dst_fd, count - copied)
+        else:
+            n = os.sendfile(dst_fd, src_fd, None, count - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def assemble_chunks(paths: List[str], dest_path: str) -> int:
+    """
+    Склеивает чанки в dest_path без чтения их в память Python
+
+    Returns:
+        Количество записанных байт
+    """
+    total = 0
+    with open(dest_path, 'wb') as out:
+        for path in paths:
+            size = os.path.getsize(path)
+            with open(path, 'rb') as src:
+                try:
+                    total += _copy_range(src.fileno(), out.fileno(), size)
+                    continue
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                # Файловая система не поддерживает копирование в ядре
+                src.seek(0)
+                out.seek(total)
+                shutil.copyfileobj(src, out, 1024 * 1024)
+                total += size
+    return total
+
+
+@contextmanager
+def _analysis_lock(upload_dir: str, blocking: bool) -> Iterator[bool]:
+    """Эксклюзивная блокировка состояния анализа загрузки (flock)"""
+    import fcntl
+
+    with open(os.path.join(upload_dir, INCREMENTAL_LOCK_FILE), 'a') as lock_file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def hold_upload(upload_dir: str) -> IO:
+    """
+    Защищает загрузку от удаления janitor, пока открыт возвращенный файл
+
+    Ждет, если janitor как раз удаляет загрузку: после возврата нужно
+    проверить, что директория еще существует.
+
+    Raises:
+        FileNotFoundError: директории загрузки нет
+    """
+    import fcntl
+
+    hold = open(os.path.join(upload_dir, UPLOAD_HOLD_FILE), 'a')
+    fcntl.flock(hold.fileno(), fcntl.LOCK_SH)
+    return hold
+
+
+@contextmanager
+def upload_released(upload_dir: str) -> Iterator[bool]:
+    """
+    Эксклюзивная блокировка загрузки для удаления (без ожидания)
+
+    Дает False, если загрузку держит финализация (hold_upload)
+    """
+    import fcntl
+
+    try:
+        lock_file = open(os.path.join(upload_dir, UPLOAD_HOLD_FILE), 'a')
+    except FileNotFoundError:
+        yield False
+        return
+    with lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def _load_incremental(upload_dir: str, source_type: str):
+    from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+    from analyzers.incremental import IncrementalProfile
+
+    guess_type = HybridFileAnalyzer()._guess_type
+    state_path = os.path.join(upload_dir, INCREMENTAL_STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            return IncrementalProfile.from_state(json.load(f), guess_type)
+    return IncrementalProfile(source_type, guess_type)
+
+
+def _drain_ready_chunks(upload_dir: str, profile) -> None:
+    """Скармливает профилю все подряд идущие чанки, для которых уже записан .meta"""
+    while os.path.exists(chunk_meta_path(upload_dir, profile.next_index)):
+        with open(chunk_path(upload_dir, profile.next_index), 'rb') as f:
+            for block in iter(lambda: f.read(FEED_BLOCK_BYTES), b''):
+                profile.feed(block)
+        profile.next_index += 1
+
+
+def advance_incremental_analysis(upload_dir: str, source_type: str) -> Optional[int]:
+    """
+    Анализирует очередные по порядку чанки, пока идет загрузка
+
+    Не ждет блокировку: если другой запрос уже анализирует эту загрузку,
+    он сам подхватит новые чанки (а остаток доберет финализация).
+
+    Returns:
+        Количество проанализированных чанков или None, если анализ занят
+    """
+    with _analysis_lock(upload_dir, blocking=False) as acquired:
+        if not acquired:
+            return None
+        profile = _load_incremental(upload_dir, source_type)
+        _drain_ready_chunks(upload_dir, profile)
+        write_atomic(os.path.join(upload_dir, INCREMENTAL_STATE_FILE), json.dumps(profile.to_state()).encode('utf-8'))
+        return profile.next_index
+
+
+def finish_incremental_analysis(upload_dir: str, total_chunks: int) -> Optional[Dict[str, Any]]:
+    """
+    Дочитывает оставшиеся чанки и закрывает последнюю неполную запись
+
+    Returns:
+        Профиль файла или None, если инкрементальный анализ не велся или неприменим
+    """
+    if not os.path.exists(os.path.join(upload_dir, INCREMENTAL_STATE_FILE)):
+        return None
+    try:
+        with _analysis_lock(upload_dir, blocking=True):
+            profile = _load_incremental(upload_dir, '')
+            _drain_ready_chunks(upload_dir, profile)
+            if profile.unsupported or profile.next_index != total_chunks:
+                return None
+            profile.finish()
+            return profile.result()
+    except Exception as e:
+        logger.warning(f"⚠️ Инкрементальный анализ недоступен, выполняем полный: {e}")
+        return None
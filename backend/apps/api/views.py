@@ -1,4 +1,5 @@
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
@@ -6,23 +7,53 @@ from .serializers import (
     DataSourceAnalysisRequestSer, DAGGenerationRequestSer,
     DataSourceAnalysisResponseSer, DAGDeploymentRequestSer
 )
-from apps.agents.integration import LLMIntegration
+from apps.agents.integration import get_integration, run_async
 from services.airflow import render_dag_py, deploy_dag_to_airflow, get_recs_for_source, delete_dag_properly
 
 # Create your views here.
 
+def submit_job_response(kind, fn, details=None, on_reject=None):
+    """
+    Ставит fn(job) в фоновую очередь и отвечает 202 с job_id
+    (503 с Retry-After, если очередь заполнена)
+    """
+    from .jobs import JobQueueFull, get_job_manager
+    
+    try:
+        job = get_job_manager().submit(kind, fn, details)
+    except JobQueueFull as e:
+        if on_reject:
+            on_reject()
+        response = Response({'error': str(e), 'status': 'failed'}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    return Response({
+        'status': 'accepted',
+        'job_id': job.id,
+        'status_url': f'/api/v1/jobs/{job.id}',
+        'events_url': f'/api/v1/jobs/{job.id}/events'
+    }, status=202)
+
 # /api/v1/analyze
 class AnalyzeDataSourceView(APIView):
     def post(self, request):
-        import asyncio
+        from .jobs import wants_async
         
         ser = DataSourceAnalysisRequestSer(data=request.data)
         ser.is_valid(raise_exception=True)
         
+        if wants_async(request):
+            validated_data = ser.validated_data
+            
+            def run_mas_analysis(job=None):
+                return run_async(get_integration().analyze_data_source(validated_data))
+            
+            return submit_job_response('analyze', run_mas_analysis)
+        
         try:
-            mas = LLMIntegration()
-            # Запускаем async функцию в event loop
-            result = asyncio.run(mas.analyze_data_source(ser.validated_data))
+            mas = get_integration()
+            # Запускаем async функцию в общем event loop процесса
+            result = run_async(mas.analyze_data_source(ser.validated_data))
             return Response(result)
         except Exception as e:
             return Response({
@@ -44,6 +75,11 @@ class AnalyzeFileStreamView(APIView):
         - file: файл для анализа
         - source_type: тип источника (csv, json, xml)
         - sample_size: количество строк для анализа (по умолчанию 1000)
+        - profile_mode: sample (первые sample_size строк), stream (полный проход),
+          columnar (векторный вывод типов, pandas) или parallel (полный проход
+          на всех ядрах для CSV/NDJSON)
+        - async: true - сразу вернуть job_id (202), анализ идет в фоне
+        - use_cache: false - не брать результат из кэша анализа по содержимому файла
         """
         import tempfile
         import os
@@ -66,6 +102,16 @@ class AnalyzeFileStreamView(APIView):
             # Получаем параметры
             source_type = request.data.get('source_type', 'csv').lower()
             sample_size = int(request.data.get('sample_size', 1000))
+            profile_mode = request.data.get('profile_mode', 'sample').lower()
+            
+            from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+            from .jobs import lookup_cached_analysis, run_analysis, wants_async, wants_cache
+            if profile_mode not in HybridFileAnalyzer.PROFILE_MODES:
+                return Response({
+                    'error': f'Неизвестный режим профилирования: {profile_mode}',
+                    'details': {'allowed': list(HybridFileAnalyzer.PROFILE_MODES)},
+                    'status': 'failed'
+                }, status=400)
             
             # Валидация размера файла
             max_size = 1024 * 1024 * 1024  # 1 GB
@@ -87,59 +133,92 @@ class AnalyzeFileStreamView(APIView):
                 # Записываем файл по частям (chunks) чтобы не загружать в память
                 chunk_size = 64 * 1024  # 64KB chunks
                 total_written = 0
+                # Хеш содержимого считаем по ходу записи - ключ кэша анализа
+                import hashlib
+                content_digest = hashlib.sha256()
                 
                 for chunk in uploaded_file.chunks(chunk_size):
                     tmp_file.write(chunk)
+                    content_digest.update(chunk)
                     total_written += len(chunk)
                 
                 tmp_file.flush()
                 logger.info(f"📝 Записано во временный файл: {total_written} bytes")
-                
+            
+            file_name = uploaded_file.name
+            file_size = uploaded_file.size
+            use_cache = wants_cache(request)
+            content_hash = f'sha256:{content_digest.hexdigest()}' if use_cache else None
+            analysis_kwargs = {
+                'source_type': source_type,
+                'sample_size': sample_size,
+                'original_filename': file_name,
+                'mode': profile_mode
+            }
+            file_info = {
+                'name': file_name,
+                'size': file_size,
+                'processed_size': total_written,
+                'source_type': source_type,
+                'sample_size': sample_size,
+                'profile_mode': profile_mode,
+                'content_hash': content_hash
+            }
+            
+            def remove_tmp_file():
+                try:
+                    os.unlink(tmp_file.name)
+                    logger.info(f"🧹 Удален временный файл: {tmp_file.name}")
+                except Exception as cleanup_error:
+                    logger.warning(f"⚠️ Не удалось удалить временный файл: {cleanup_error}")
+            
+            # Тот же файл с теми же параметрами уже анализировали - отвечаем сразу
+            cached_result = lookup_cached_analysis(content_hash, **analysis_kwargs)
+            if cached_result is not None:
+                remove_tmp_file()
+                return Response({
+                    'status': 'success',
+                    'analysis_result': cached_result,
+                    'file_info': {**file_info, 'cache': 'hit'}
+                })
+            
+            def run_file_analysis(job=None):
                 try:
                     # Используем гибридный анализатор (Stack Overflow + наши улучшения)
-                    from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
-                    
-                    analyzer = HybridFileAnalyzer()
-                    result = analyzer.analyze_uploaded_file(
-                        file_path=tmp_file.name,
-                        source_type=source_type,
-                        sample_size=sample_size,
-                        original_filename=uploaded_file.name
-                    )
+                    result = run_analysis(job, content_hash, file_path=tmp_file.name, **analysis_kwargs)
                     
-                    logger.info(f"✅ Streaming анализ завершен для файла {uploaded_file.name}")
+                    logger.info(f"✅ Streaming анализ завершен для файла {file_name}")
                     
-                    return Response({
+                    return {
                         'status': 'success',
                         'analysis_result': result,
-                        'file_info': {
-                            'name': uploaded_file.name,
-                            'size': uploaded_file.size,
-                            'processed_size': total_written,
-                            'source_type': source_type,
-                            'sample_size': sample_size
-                        }
-                    })
-                    
-                except Exception as analysis_error:
-                    logger.exception(f"❌ Ошибка анализа файла {uploaded_file.name}: {analysis_error}")
-                    
-                    return Response({
-                        'error': f'Ошибка анализа файла: {str(analysis_error)}',
-                        'details': {
-                            'file_name': uploaded_file.name,
-                            'analysis_error': str(analysis_error)
-                        },
-                        'status': 'failed'
-                    }, status=500)
-                
+                        'file_info': {**file_info, 'cache': 'miss' if use_cache else 'bypass'}
+                    }
                 finally:
                     # Очищаем временный файл
-                    try:
-                        os.unlink(tmp_file.name)
-                        logger.info(f"🧹 Удален временный файл: {tmp_file.name}")
-                    except Exception as cleanup_error:
-                        logger.warning(f"⚠️ Не удалось удалить временный файл: {cleanup_error}")
+                    remove_tmp_file()
+            
+            if wants_async(request):
+                return submit_job_response('analyze_file_stream', run_file_analysis, {
+                    'file_name': file_name,
+                    'source_type': source_type,
+                    'profile_mode': profile_mode
+                }, on_reject=remove_tmp_file)
+            
+            try:
+                return Response(run_file_analysis())
+                
+            except Exception as analysis_error:
+                logger.exception(f"❌ Ошибка анализа файла {file_name}: {analysis_error}")
+                
+                return Response({
+                    'error': f'Ошибка анализа файла: {str(analysis_error)}',
+                    'details': {
+                        'file_name': file_name,
+                        'analysis_error': str(analysis_error)
+                    },
+                    'status': 'failed'
+                }, status=500)
         
         except Exception as e:
             logger.exception(f"💥 Критическая ошибка streaming upload: {e}")
@@ -149,6 +228,39 @@ class AnalyzeFileStreamView(APIView):
                 'status': 'failed'
             }, status=500)
 
+# /api/v1/llm_health
+class LLMHealthView(APIView):
+    """
+    Доступность Ollama и загруженные модели (GET /api/tags, без генерации),
+    а также очередь допуска к моделям: занятые слоты, глубина очереди, ожидание
+    """
+    def get(self, request):
+        from apps.agents.core import LLMManager
+        from apps.agents.core.admission import get_admission_controller
+        
+        force = str(request.query_params.get('force', 'false')).lower() == 'true'
+        health = LLMManager().check_health(force=force)
+        return Response({
+            'status': 'success' if health['available'] else 'unavailable',
+            **health,
+            'admission': get_admission_controller().metrics()
+        }, status=200 if health['available'] else 503)
+
+# /api/v1/metrics
+class MetricsView(APIView):
+    """
+    Метрики этапов пайплайна в формате Prometheus: время этапа, ожидание
+    слота модели, токены, повторы, попадания в кэш, а также очередь допуска.
+    Счетчики свои у каждого процесса (воркера)
+    """
+    def get(self, request):
+        from django.http import HttpResponse
+        from apps.agents.core.admission import get_admission_controller
+        from apps.agents.core.metrics import PROMETHEUS_CONTENT_TYPE, get_stage_metrics
+
+        body = get_stage_metrics().render_prometheus(get_admission_controller().metrics())
+        return HttpResponse(body, content_type=PROMETHEUS_CONTENT_TYPE)
+
 # /api/v1/generate_dag
 class GenerateDAGView(APIView):
     def post(self, request):
@@ -391,7 +503,10 @@ class UploadChunkView(APIView):
         - total_chunks: общее количество чанков
         - file_name: имя файла
         - source_type: тип файла
-        - chunk_hash: хеш для проверки целостности
+        - chunk_hash: хеш для проверки целостности ("sha256:<hex>" или "<hex>"),
+          проверяется потоково при записи; при несовпадении чанк отклоняется (422)
+        - incremental: true - анализировать чанки (csv/ndjson) по мере поступления
+          (результат используется при финализации с profile_mode=stream)
         """
         import os
         import logging
@@ -414,43 +529,103 @@ class UploadChunkView(APIView):
             file_name = request.data.get('file_name')
             source_type = request.data.get('source_type')
             chunk_hash = request.data.get('chunk_hash')
+            incremental = str(request.data.get('incremental', 'false')).lower() == 'true'
             
             logger.info(f"📦 Получен чанк {chunk_index + 1}/{total_chunks} для файла {file_name}")
             
             # Создаем директорию для временных файлов загрузки
-            upload_dir = os.path.join(settings.FILE_UPLOAD_TEMP_DIR or '/tmp', 'chunked_uploads', upload_id)
+            if not upload_id or not 0 <= chunk_index < total_chunks:
+                return Response({
+                    'error': f'Некорректный upload_id или индекс чанка: {chunk_index}/{total_chunks}',
+                    'status': 'failed'
+                }, status=400)
+            
+            from .janitor import UploadQuotaExceeded, get_janitor
+            from .uploads import (
+                ChunkIntegrityError, advance_incremental_analysis, chunk_meta_path, read_chunks_meta,
+                store_chunk, upload_dir_for, upload_status, write_atomic
+            )
+            try:
+                upload_dir = upload_dir_for(upload_id)
+            except ValueError as e:
+                return Response({'error': str(e), 'status': 'failed'}, status=400)
+            
+            # Квоты диска: на загрузку и на все загрузки (повтор чанка заменяет старый)
+            janitor = get_janitor()
+            uploaded_bytes = 0
+            if os.path.isdir(upload_dir):
+                uploaded_bytes = sum(
+                    info.get('size', 0) for info in read_chunks_meta(upload_dir) if info['index'] != chunk_index
+                )
+            try:
+                janitor.check_upload_quota(uploaded_bytes, chunk.size)
+            except UploadQuotaExceeded as e:
+                logger.warning(f"⚠️ {e}")
+                response = Response({
+                    'error': str(e),
+                    'details': {'upload_id': upload_id, 'chunk_index': chunk_index, 'retry': e.retryable},
+                    'status': 'failed'
+                }, status=413)
+                if e.retryable:
+                    response['Retry-After'] = '5'
+                return response
+            
             os.makedirs(upload_dir, exist_ok=True)
             
-            # Сохраняем чанк
-            chunk_path = os.path.join(upload_dir, f'chunk_{chunk_index:04d}')
-            with open(chunk_path, 'wb') as f:
-                for chunk_data in chunk.chunks():
-                    f.write(chunk_data)
+            # Сохраняем чанк атомарно с потоковой проверкой хеша: .meta появляется
+            # только после полного и проверенного файла, поэтому чанки можно
+            # принимать параллельно и в любом порядке
+            try:
+                stored = store_chunk(upload_dir, chunk_index, chunk.chunks(), chunk_hash)
+            except ChunkIntegrityError as e:
+                logger.warning(f"⚠️ {e}")
+                return Response({
+                    'error': str(e),
+                    'details': {'upload_id': upload_id, 'chunk_index': chunk_index, 'retry': True},
+                    'status': 'failed'
+                }, status=422)
+            except ValueError as e:
+                return Response({'error': str(e), 'status': 'failed'}, status=400)
+            
+            janitor.record_write(stored['size'])
             
             # Сохраняем метаданные чанка
-            metadata_path = os.path.join(upload_dir, f'chunk_{chunk_index:04d}.meta')
-            with open(metadata_path, 'w') as f:
-                import json
-                json.dump({
-                    'index': chunk_index,
-                    'total_chunks': total_chunks,
-                    'file_name': file_name,
-                    'source_type': source_type,
-                    'chunk_hash': chunk_hash,
-                    'size': chunk.size
-                }, f)
+            import json
+            write_atomic(chunk_meta_path(upload_dir, chunk_index), json.dumps({
+                'index': chunk_index,
+                'total_chunks': total_chunks,
+                'file_name': file_name,
+                'source_type': source_type,
+                'chunk_hash': chunk_hash,
+                **stored
+            }).encode('utf-8'))
+            
+            logger.info(f"✅ Чанк {chunk_index + 1}/{total_chunks} сохранен: {stored['size']} bytes")
             
-            logger.info(f"✅ Чанк {chunk_index + 1}/{total_chunks} сохранен: {chunk.size} bytes")
+            # Прогресс считаем по фактически принятым чанкам: они приходят не по порядку
+            status = upload_status(upload_dir, total_chunks)
+            details = {
+                'upload_id': upload_id,
+                'chunk_index': chunk_index,
+                'chunk_size': stored['size'],
+                'verified': stored['verified'],
+                'progress': round(len(status['received_chunks']) / total_chunks * 100, 1),
+                'missing_chunks': len(status['missing_chunks'])
+            }
+            
+            if incremental and source_type in ('csv', 'json'):
+                # Профилируем все готовые по порядку чанки, пока клиент шлет следующие
+                try:
+                    analyzed = advance_incremental_analysis(upload_dir, source_type)
+                    if analyzed is not None:
+                        details['analyzed_chunks'] = analyzed
+                except Exception as e:
+                    logger.warning(f"⚠️ Инкрементальный анализ чанка {chunk_index} не удался: {e}")
             
             return Response({
                 'status': 'success',
                 'message': f'Чанк {chunk_index + 1}/{total_chunks} успешно загружен',
-                'details': {
-                    'upload_id': upload_id,
-                    'chunk_index': chunk_index,
-                    'chunk_size': chunk.size,
-                    'progress': round(((chunk_index + 1) / total_chunks) * 100, 1)
-                }
+                'details': details
             })
             
         except Exception as e:
@@ -468,6 +643,17 @@ class FinalizeChunkedUploadView(APIView):
     def post(self, request):
         """
         Объединяет все чанки в один файл и запускает streaming анализ
+        
+        Form data:
+        - assembly_mode: virtual (анализ чанков на месте, без склейки; по умолчанию)
+          или copy (склейка в один файл через copy_file_range/sendfile)
+        - async: true - сразу вернуть job_id (202), анализ идет в фоне
+        - use_cache: false - не брать результат из кэша анализа; ключ кэша -
+          sha256 собранного содержимого, тот же, что у загрузки файла целиком
+        - total_chunks: должно совпадать с total_chunks, присланным с чанками
+
+        Результат инкрементального анализа (incremental=true при загрузке чанков)
+        используется только для profile_mode=stream: он считает тот же полный профиль
         """
         import os
         import logging
@@ -476,6 +662,9 @@ class FinalizeChunkedUploadView(APIView):
         from django.conf import settings
         
         logger = logging.getLogger(__name__)
+        # Защита загрузки от janitor; после постановки задачи ее закрывает задача
+        hold = None
+        handed_off = False
         
         try:
             data = request.data
@@ -484,26 +673,52 @@ class FinalizeChunkedUploadView(APIView):
             source_type = data.get('source_type')
             file_size = data.get('file_size', 0)
             sample_size = int(data.get('sample_size', 1000))
+            profile_mode = data.get('profile_mode', 'sample').lower()
+            assembly_mode = data.get('assembly_mode', 'virtual').lower()
+            
+            from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+            from .uploads import (
+                ASSEMBLY_MODES, assemble_chunks, finish_incremental_analysis, hold_upload, ordered_chunk_paths,
+                read_chunks_meta, recorded_total_chunks, upload_dir_for, upload_status
+            )
+            from analyzers.result_cache import hash_source
+            from .jobs import (
+                lookup_cached_analysis, run_analysis, store_cached_analysis, wants_async, wants_cache
+            )
+            if profile_mode not in HybridFileAnalyzer.PROFILE_MODES:
+                return Response({
+                    'error': f'Неизвестный режим профилирования: {profile_mode}',
+                    'details': {'allowed': list(HybridFileAnalyzer.PROFILE_MODES)},
+                    'status': 'failed'
+                }, status=400)
+            if assembly_mode not in ASSEMBLY_MODES:
+                return Response({
+                    'error': f'Неизвестный режим сборки: {assembly_mode}',
+                    'details': {'allowed': list(ASSEMBLY_MODES)},
+                    'status': 'failed'
+                }, status=400)
             
             logger.info(f"🔗 Финализация chunked upload: {file_name} ({file_size} bytes)")
             
-            upload_dir = os.path.join(settings.FILE_UPLOAD_TEMP_DIR or '/tmp', 'chunked_uploads', upload_id)
+            try:
+                upload_dir = upload_dir_for(upload_id)
+            except ValueError as e:
+                return Response({'error': str(e), 'status': 'failed'}, status=400)
             
-            if not os.path.exists(upload_dir):
+            # Janitor не удаляет загрузку, пока ее держит финализация (в том числе
+            # пока задача стоит в очереди); если он как раз удалял ее - директории уже нет
+            try:
+                hold = hold_upload(upload_dir)
+            except FileNotFoundError:
+                pass
+            if hold is None or not os.path.exists(upload_dir):
                 return Response({
                     'error': f'Данные загрузки не найдены: {upload_id}',
                     'status': 'failed'
                 }, status=404)
             
-            # Собираем информацию о чанках
-            chunks_info = []
-            for file in os.listdir(upload_dir):
-                if file.endswith('.meta'):
-                    with open(os.path.join(upload_dir, file), 'r') as f:
-                        chunks_info.append(json.load(f))
-            
-            # Сортируем чанки по индексу
-            chunks_info.sort(key=lambda x: x['index'])
+            # Собираем информацию о чанках (отсортирована по индексу)
+            chunks_info = read_chunks_meta(upload_dir)
             
             if not chunks_info:
                 return Response({
@@ -511,65 +726,154 @@ class FinalizeChunkedUploadView(APIView):
                     'status': 'failed'
                 }, status=400)
             
-            # Создаем временный файл для объединенных данных
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{source_type}') as combined_file:
-                combined_path = combined_file.name
-                
-                # Объединяем чанки
-                total_size = 0
-                for chunk_info in chunks_info:
-                    chunk_path = os.path.join(upload_dir, f'chunk_{chunk_info["index"]:04d}')
-                    if os.path.exists(chunk_path):
-                        with open(chunk_path, 'rb') as chunk_file:
-                            data_chunk = chunk_file.read()
-                            combined_file.write(data_chunk)
-                            total_size += len(data_chunk)
-                
-                logger.info(f"📁 Объединено {len(chunks_info)} чанков в файл: {total_size} bytes")
+            # Число чанков берем из .meta, записанных при приеме, а не со слов клиента
+            total_chunks = recorded_total_chunks(chunks_info)
+            expected_chunks = data.get('total_chunks')
+            if total_chunks is None or (expected_chunks and int(expected_chunks) != total_chunks):
+                return Response({
+                    'error': 'Число чанков не совпадает с указанным при загрузке',
+                    'details': {
+                        'upload_id': upload_id,
+                        'total_chunks': expected_chunks,
+                        'recorded_total_chunks': sorted({info.get('total_chunks') for info in chunks_info})
+                    },
+                    'status': 'failed'
+                }, status=409)
             
-            try:
-                # Запускаем гибридный анализ объединенного файла
-                from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
-                
-                analyzer = HybridFileAnalyzer()
-                result = analyzer.analyze_uploaded_file(
-                    file_path=combined_path,
-                    source_type=source_type,
-                    sample_size=sample_size,
-                    original_filename=file_name
-                )
-                
-                logger.info(f"✅ Chunked анализ завершен для файла {file_name}")
-                
+            # Не анализируем файл с дырами: клиент должен дослать недостающие чанки
+            status = upload_status(upload_dir, total_chunks)
+            if not status['complete']:
+                logger.warning(f"⚠️ Загрузка {upload_id} неполная: нет чанков {status['missing_chunks'][:20]}")
+                return Response({
+                    'error': 'Загружены не все чанки файла',
+                    'details': {
+                        'upload_id': upload_id,
+                        'total_chunks': status['total_chunks'],
+                        'missing_chunks': status['missing_chunks']
+                    },
+                    'status': 'failed'
+                }, status=409)
+            
+            # Ключ кэша - sha256 собранного содержимого, как у обычной загрузки:
+            # тот же файл, загруженный целиком или по чанкам, попадает в одну запись
+            content_hash = hash_source(ordered_chunk_paths(upload_dir, chunks_info)) if wants_cache(request) else None
+            analysis_kwargs = {
+                'source_type': source_type,
+                'sample_size': sample_size,
+                'original_filename': file_name,
+                'mode': profile_mode
+            }
+            
+            cached_result = lookup_cached_analysis(content_hash, **analysis_kwargs)
+            if cached_result is not None:
+                import shutil
+                shutil.rmtree(upload_dir, ignore_errors=True)
                 return Response({
                     'status': 'success',
-                    'analysis_result': result,
+                    'analysis_result': cached_result,
                     'file_info': {
                         'name': file_name,
                         'size': file_size,
-                        'processed_size': total_size,
+                        'processed_size': sum(info.get('size', 0) for info in chunks_info),
                         'source_type': source_type,
                         'sample_size': sample_size,
-                        'chunks_processed': len(chunks_info)
+                        'profile_mode': cached_result.get('profile_mode', profile_mode),
+                        'assembly_mode': assembly_mode,
+                        'chunks_processed': len(chunks_info),
+                        'content_hash': content_hash,
+                        'cache': 'hit'
                     }
                 })
-                
-            finally:
-                # Очищаем временные файлы
-                try:
-                    os.unlink(combined_path)
-                    logger.info(f"🧹 Удален объединенный файл: {combined_path}")
-                except:
-                    pass
-                
-                # Очищаем директорию с чанками
+            
+            def run_finalize(job=None):
+                chunk_paths = ordered_chunk_paths(upload_dir, chunks_info)
+                combined_path = None
+                mode = profile_mode
                 try:
-                    import shutil
-                    shutil.rmtree(upload_dir)
-                    logger.info(f"🧹 Удалена директория чанков: {upload_dir}")
-                except:
-                    pass
+                    # Если чанки анализировались по мере загрузки, остается закрыть хвост.
+                    # Инкрементальный профиль - это полный stream-профиль, поэтому
+                    # для остальных режимов (и под их ключом кэша) он не подходит
+                    incremental_result = None
+                    if mode == 'stream':
+                        incremental_result = finish_incremental_analysis(upload_dir, total_chunks)
+                    
+                    if incremental_result is not None:
+                        total_size = sum(os.path.getsize(path) for path in chunk_paths)
+                        logger.info(f"📁 Чанки проанализированы инкрементально: {total_size} bytes")
+                        result = {
+                            'original_filename': file_name,
+                            'source_type': source_type,
+                            'profile_mode': mode,
+                            **incremental_result
+                        }
+                        if content_hash:
+                            store_cached_analysis(content_hash, result, **analysis_kwargs)
+                    else:
+                        if assembly_mode == 'copy':
+                            # Склеиваем чанки в ядре (copy_file_range/sendfile), без чтения в память
+                            import tempfile
+                            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{source_type}') as combined_file:
+                                combined_path = combined_file.name
+                            total_size = assemble_chunks(chunk_paths, combined_path)
+                            analysis_source = combined_path
+                            logger.info(f"📁 Объединено {len(chunk_paths)} чанков в файл: {total_size} bytes")
+                        else:
+                            # Анализируем чанки на месте как один виртуальный поток
+                            total_size = sum(os.path.getsize(path) for path in chunk_paths)
+                            analysis_source = chunk_paths
+                            logger.info(f"📁 Анализ {len(chunk_paths)} чанков без склейки: {total_size} bytes")
+                        
+                        # Запускаем гибридный анализ объединенного файла
+                        result = run_analysis(job, content_hash, file_path=analysis_source, **analysis_kwargs)
+                    
+                    logger.info(f"✅ Chunked анализ завершен для файла {file_name}")
+                    
+                    return {
+                        'status': 'success',
+                        'analysis_result': result,
+                        'file_info': {
+                            'name': file_name,
+                            'size': file_size,
+                            'processed_size': total_size,
+                            'source_type': source_type,
+                            'sample_size': sample_size,
+                            'profile_mode': mode,
+                            'assembly_mode': assembly_mode,
+                            'chunks_processed': len(chunks_info),
+                            'incremental': incremental_result is not None,
+                            'content_hash': content_hash,
+                            'cache': 'miss' if content_hash else 'bypass'
+                        }
+                    }
+                    
+                finally:
+                    # Очищаем временные файлы
+                    if combined_path:
+                        try:
+                            os.unlink(combined_path)
+                            logger.info(f"🧹 Удален объединенный файл: {combined_path}")
+                        except:
+                            pass
+                    
+                    # Очищаем директорию с чанками
+                    try:
+                        import shutil
+                        shutil.rmtree(upload_dir)
+                        logger.info(f"🧹 Удалена директория чанков: {upload_dir}")
+                    except:
+                        pass
+                    hold.close()
+            
+            if wants_async(request):
+                response = submit_job_response('finalize_chunked_upload', run_finalize, {
+                    'upload_id': upload_id,
+                    'file_name': file_name,
+                    'source_type': source_type,
+                    'profile_mode': profile_mode
+                })
+                handed_off = response.status_code == 202
+                return response
+            return Response(run_finalize())
                     
         except Exception as e:
             logger.exception(f"❌ Ошибка финализации chunked upload: {e}")
@@ -577,6 +881,162 @@ class FinalizeChunkedUploadView(APIView):
                 'error': f'Ошибка обработки загрузки: {str(e)}',
                 'status': 'failed'
             }, status=500)
+        finally:
+            if hold is not None and not handed_off:
+                hold.close()
+
+# /api/v1/jobs/<job_id>
+class JobStatusView(APIView):
+    """
+    Статус фоновой задачи анализа (опрос)
+    """
+    def get(self, request, job_id):
+        """
+        Query params:
+        - wait: секунды long polling - ответ придет при изменении задачи
+          (максимум JOB_POLL_MAX_WAIT_SECONDS: ожидание держит поток WSGI воркера;
+          для долгого ожидания есть SSE /api/v1/jobs/<job_id>/events)
+        """
+        from .jobs import get_job_manager, parse_poll_wait
+        
+        try:
+            wait = parse_poll_wait(request.query_params.get('wait'))
+        except ValueError:
+            return Response({
+                'error': f"Некорректный параметр wait: {request.query_params.get('wait')}",
+                'status': 'failed'
+            }, status=400)
+        
+        manager = get_job_manager()
+        job = manager.get(job_id)
+        if job is None:
+            return Response({
+                'error': f'Задача не найдена: {job_id}',
+                'status': 'failed'
+            }, status=404)
+        
+        if wait > 0 and not job.finished:
+            manager.wait_for_change(job, job.version, wait)
+        data = job.to_dict()
+        if not job.finished:
+            data['events_url'] = f'/api/v1/jobs/{job.id}/events'
+        return Response(data)
+
+# /api/v1/jobs/<job_id>/events
+async def job_events_view(request, job_id):
+    """
+    SSE поток прогресса задачи: событие progress при каждом изменении,
+    финальное событие done/failed с результатом. Async view под ASGI
+    не занимает поток на время ожидания.
+    """
+    from django.http import JsonResponse
+    from .jobs import get_job_manager, job_events
+    from .sse import sse_response
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return JsonResponse({'error': f'Задача не найдена: {job_id}', 'status': 'failed'}, status=404)
+    
+    return sse_response(job_events(job))
+
+# /api/v1/analyze_stream
+@csrf_exempt
+async def analyze_stream_view(request):
+    """
+    Потоковый анализ источника (SSE): тело запроса как у /api/v1/analyze,
+    в ответ сразу идет событие start, затем stage_start / token / stage_end
+    по каждому этапу и итоговое done (или error). Клиент читает поток через
+    fetch + ReadableStream (EventSource не умеет POST).
+    """
+    import json
+    from django.http import JsonResponse
+    from .sse import sse_event, sse_response
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Поддерживается только POST', 'status': 'failed'}, status=405)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return JsonResponse({'error': f'Некорректный JSON: {e}', 'status': 'failed'}, status=400)
+    
+    ser = DataSourceAnalysisRequestSer(data=payload)
+    if not ser.is_valid():
+        return JsonResponse({'error': ser.errors, 'status': 'failed'}, status=400)
+    validated_data = ser.validated_data
+    
+    async def events():
+        async for event in get_integration().analyze_data_source_stream(validated_data):
+            yield sse_event(event['event'], event)
+    
+    return sse_response(events())
+
+# /api/v1/upload_status
+class UploadStatusView(APIView):
+    """
+    Endpoint для возобновления загрузки: какие чанки уже приняты и проверены
+    """
+    def get(self, request):
+        """
+        Query params:
+        - upload_id: ID загрузки
+        - total_chunks: ожидаемое число чанков (необязательно, иначе берется из .meta)
+        
+        Клиент после обрыва связи досылает только missing_chunks
+        """
+        import logging
+        from .uploads import upload_dir_for, upload_status
+        
+        logger = logging.getLogger(__name__)
+        
+        try:
+            upload_id = request.query_params.get('upload_id')
+            if not upload_id:
+                return Response({
+                    'error': 'upload_id не указан',
+                    'status': 'failed'
+                }, status=400)
+            total_chunks = request.query_params.get('total_chunks')
+            try:
+                upload_dir = upload_dir_for(upload_id)
+            except ValueError as e:
+                return Response({'error': str(e), 'status': 'failed'}, status=400)
+            
+            status = upload_status(upload_dir, int(total_chunks) if total_chunks else None)
+            return Response({
+                'status': 'success',
+                'upload_id': upload_id,
+                **status
+            })
+            
+        except Exception as e:
+            logger.exception(f"❌ Ошибка получения статуса загрузки: {e}")
+            return Response({
+                'error': f'Ошибка получения статуса: {str(e)}',
+                'status': 'failed'
+            }, status=500)
+
+# /api/v1/storage_metrics
+class StorageMetricsView(APIView):
+    """
+    Метрики временных файлов (занятое место, вытеснения, отказы по квотам),
+    очереди фоновых задач и кэша анализа
+    """
+    def get(self, request):
+        from .janitor import get_janitor
+        from .jobs import get_analysis_cache, get_job_manager
+        
+        try:
+            cache = get_analysis_cache()
+            cache_stats = cache.stats() if cache else None
+        except Exception as e:
+            cache_stats = {'error': str(e)}
+        return Response({
+            'status': 'success',
+            'metrics': get_janitor().metrics(),
+            'jobs': get_job_manager().metrics(),
+            'analysis_cache': cache_stats
+        })
 
 # /api/v1/cleanup_upload
 class CleanupUploadView(APIView):
@@ -588,7 +1048,7 @@ class CleanupUploadView(APIView):
         import os
         import logging
         import shutil
-        from django.conf import settings
+        from .uploads import upload_dir_for, upload_released
         
         logger = logging.getLogger(__name__)
         
@@ -600,10 +1060,20 @@ class CleanupUploadView(APIView):
                     'status': 'failed'
                 }, status=400)
             
-            upload_dir = os.path.join(settings.FILE_UPLOAD_TEMP_DIR or '/tmp', 'chunked_uploads', upload_id)
+            try:
+                upload_dir = upload_dir_for(upload_id)
+            except ValueError as e:
+                return Response({'error': str(e), 'status': 'failed'}, status=400)
             
             if os.path.exists(upload_dir):
-                shutil.rmtree(upload_dir)
+                # Как и janitor, не удаляем загрузку, которую держит финализация
+                with upload_released(upload_dir) as released:
+                    if not released:
+                        return Response({
+                            'error': f'Загрузка {upload_id} финализируется',
+                            'status': 'failed'
+                        }, status=409)
+                    shutil.rmtree(upload_dir)
                 logger.info(f"🧹 Очищена директория неудачной загрузки: {upload_id}")
             
             return Response({
@@ -0,0 +1,51 @@
+"""
+Benchmark: parallel profiling scaling across worker counts.
+
+Profiles one CSV with ``mode="parallel"`` for each worker count and prints
+wall time, throughput and speedup over a single worker. Run from
+``backend/``:
+
+    python -m benchmarks.bench_parallel_profile --rows 5000000
+    python -m benchmarks.bench_parallel_profile --file /data/upload.csv --workers 1 4 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+from benchmarks.bench_type_inference import make_csv
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--file", help="existing CSV to profile instead of a synthetic one")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    analyzer = HybridFileAnalyzer()
+    path = args.file
+    tmp = None
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
+        tmp.close()
+        path = tmp.name
+        make_csv(path, args.rows)
+    try:
+        print(f"file: {path} ({os.path.getsize(path) / 1e6:.1f} MB), cpus: {os.cpu_count()}")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            result = analyzer.analyze_uploaded_file(path, "csv", mode="parallel", workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"workers={workers:<3} ranges={result['ranges']:<3} {elapsed:8.2f} s  "
+                  f"{result['total_rows'] / elapsed:>12,.0f} rows/s  x{baseline / elapsed:.2f}")
+    finally:
+        if tmp:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
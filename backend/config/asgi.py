@@ -0,0 +1,20 @@
+"""
+ASGI config for config project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Потоковые ответы (SSE /api/v1/analyze_stream, /api/v1/jobs/<id>/events)
+отдаются клиенту по мере генерации только под ASGI-сервером:
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+application = get_asgi_application()
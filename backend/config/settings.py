@@ -44,6 +44,29 @@ FILE_UPLOAD_HANDLERS = [
 STREAMING_CHUNK_SIZE = 8192  # 8KB чанки для чтения файлов
 PANDAS_CHUNK_SIZE = 10000    # Количество строк в чанке для pandas
 
+# Очистка временных файлов (apps.api.janitor)
+JANITOR_ENABLED = os.getenv('JANITOR_ENABLED', 'true').lower() == 'true'
+JANITOR_INTERVAL_SECONDS = int(os.getenv('JANITOR_INTERVAL_SECONDS', 300))
+UPLOAD_TTL_SECONDS = int(os.getenv('UPLOAD_TTL_SECONDS', 24 * 3600))          # Брошенная загрузка
+UPLOAD_MIN_IDLE_SECONDS = int(os.getenv('UPLOAD_MIN_IDLE_SECONDS', 120))     # Не вытеснять активные
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 20 * 1024 ** 3))         # Квота одной загрузки
+UPLOADS_MAX_TOTAL_BYTES = int(os.getenv('UPLOADS_MAX_TOTAL_BYTES', 100 * 1024 ** 3))  # Все загрузки
+# Каталог промежуточных результатов агентов - MAS_TEMP_DIR или paths.temp_dir
+# в general_config.yaml (apps.agents.core.config_cache.mas_temp_dir)
+MAS_TEMP_TTL_SECONDS = int(os.getenv('MAS_TEMP_TTL_SECONDS', 7 * 24 * 3600))
+MAS_TEMP_MAX_BYTES = int(os.getenv('MAS_TEMP_MAX_BYTES', 1024 ** 3))
+
+# Фоновые задачи анализа (apps.api.jobs)
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', min(4, os.cpu_count() or 1)))
+ANALYSIS_JOB_MAX_PENDING = int(os.getenv('ANALYSIS_JOB_MAX_PENDING', 32))     # Дальше - 503
+ANALYSIS_PROCESS_WORKERS = int(os.getenv('ANALYSIS_PROCESS_WORKERS', os.cpu_count() or 1))
+ANALYSIS_JOB_RETENTION_SECONDS = int(os.getenv('ANALYSIS_JOB_RETENTION_SECONDS', 3600))
+
+# Кэш результатов анализа по содержимому файла (analyzers.result_cache)
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH', '/tmp/mas_analysis_cache.sqlite3')
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
 
 # Application definition
 
@@ -93,6 +116,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+# Основной сервер - ASGI (uvicorn config.asgi:application): под WSGI Django
+# дочитывает async-генератор StreamingHttpResponse целиком, и SSE не стримится
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
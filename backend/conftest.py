@@ -0,0 +1,7 @@
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("JANITOR_ENABLED", "false")
+django.setup()
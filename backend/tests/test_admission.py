@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from apps.agents.core.admission import AdmissionController, AdmissionTimeout
+
+
+def _queue_thread(controller, order, name, priority):
+    def worker():
+        with controller.slot("llama", priority):
+            order.append(name)
+
+    expected = controller.metrics()["models"]["llama"]["queue_depth"] + 1
+    thread = threading.Thread(target=worker)
+    thread.start()
+    # Wait until the thread is in the queue so arrival order is deterministic
+    deadline = time.time() + 5
+    while controller.metrics()["models"]["llama"]["queue_depth"] < expected and time.time() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+def test_interactive_before_batch_and_fifo_within_priority():
+    controller = AdmissionController(max_in_flight_per_model=1)
+    controller.acquire("llama")
+    order = []
+    threads = [
+        _queue_thread(controller, order, "batch-1", "batch"),
+        _queue_thread(controller, order, "interactive-1", "interactive"),
+        _queue_thread(controller, order, "batch-2", "batch"),
+        _queue_thread(controller, order, "interactive-2", "interactive"),
+    ]
+
+    controller.release("llama")
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["interactive-1", "interactive-2", "batch-1", "batch-2"]
+    metrics = controller.metrics()["models"]["llama"]
+    assert metrics["in_flight"] == 0 and metrics["queue_depth"] == 0 and metrics["admitted"] == 5
+
+
+def test_queue_timeout_frees_the_place():
+    controller = AdmissionController(max_in_flight_per_model=1, queue_timeout=0.05)
+    controller.acquire("llama")
+
+    with pytest.raises(AdmissionTimeout):
+        controller.acquire("llama")
+
+    controller.release("llama")
+    controller.acquire("llama", timeout=0)
+    assert controller.metrics()["models"]["llama"]["timeouts"] == 1
+
+
+def test_async_waiters_share_the_queue_with_threads():
+    controller = AdmissionController(max_in_flight_per_model=1)
+    controller.acquire("llama")
+    order = []
+
+    async def waiter(name, priority):
+        async with controller.aslot("llama", priority):
+            order.append(name)
+
+    async def scenario():
+        batch = asyncio.ensure_future(waiter("batch", "batch"))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.ensure_future(waiter("interactive", "interactive"))
+        await asyncio.sleep(0.01)
+        controller.release("llama")
+        await asyncio.gather(batch, interactive)
+
+    asyncio.run(scenario())
+
+    assert order == ["interactive", "batch"]
+
+
+def test_models_have_separate_limits():
+    controller = AdmissionController(max_in_flight_per_model=1, per_model={"qwen": 2})
+    controller.acquire("llama")
+    controller.acquire("qwen")
+    controller.acquire("qwen", timeout=0)
+
+    with pytest.raises(AdmissionTimeout):
+        controller.acquire("qwen", timeout=0)
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from apps.agents.core.agent_executor import AgentExecutor
+
+STAGE = "report_generation"
+
+
+class FakeLLM:
+    model = "fake-model"
+
+
+class SlowManager:
+    """LLMManager double whose model answers after ``delay`` seconds."""
+
+    schema_cache = None
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = False
+        self.stream_closed = False
+
+    async def aget_llm(self, agent_type, use_tools=False):
+        return FakeLLM()
+
+    def is_fallback(self, llm):
+        return False
+
+    async def ainvoke_with_retry(self, llm, messages, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return AIMessage(content="# Report")
+
+    async def astream_with_retry(self, llm, messages, **kwargs):
+        try:
+            for part in ("# ", "Re", "port"):
+                await asyncio.sleep(self.delay)
+                yield AIMessageChunk(content=part)
+        finally:
+            self.stream_closed = True
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(AgentExecutor, "_ensure_directories", lambda self: None)
+
+    def make(delay, timeout):
+        manager = SlowManager(delay)
+        executor = AgentExecutor(STAGE, llm_manager=manager)
+        executor.general_config = {"agents_config": {
+            "timeouts": {STAGE: timeout}, "save_intermediate": False, "verbose": False,
+        }}
+        return executor, manager
+
+    return make
+
+
+def _state():
+    return {"use_llm_cache": False, "errors": [], "messages": []}
+
+
+def _stats(state):
+    return state["execution_stats"]["stages"][STAGE]
+
+
+def test_aexecute_finishes_within_the_timeout(executor):
+    agent, _ = executor(delay=0, timeout=5)
+    state = asyncio.run(agent.aexecute(_state()))
+
+    assert state["errors"] == []
+    assert _stats(state)["outcome"] == "ok"
+
+
+def test_aexecute_timeout_cancels_the_model_call(executor):
+    agent, manager = executor(delay=5, timeout=0.05)
+    state = _state()
+
+    asyncio.run(asyncio.wait_for(agent.aexecute(state), 2))
+
+    assert manager.cancelled
+    assert "таймаут" in state["errors"][-1]["error"]
+    assert _stats(state)["outcome"] == "error"
+
+
+def test_cancelling_the_task_propagates(executor):
+    agent, manager = executor(delay=5, timeout=None)
+    state = _state()
+
+    async def run():
+        task = asyncio.create_task(agent.aexecute(state))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert manager.cancelled
+    assert state["errors"] == []
+    assert _stats(state)["outcome"] == "cancelled"
+
+
+def test_astream_timeout_closes_the_stream(executor):
+    agent, manager = executor(delay=0.04, timeout=0.1)
+    state = _state()
+
+    async def run():
+        return [event["content"] async for event in agent.astream(state)]
+
+    tokens = asyncio.run(asyncio.wait_for(run(), 2))
+
+    assert 1 <= len(tokens) < 3
+    assert manager.stream_closed
+    assert "таймаут" in state["errors"][-1]["error"]
@@ -0,0 +1,44 @@
+import gzip
+import json
+import os
+
+from apps.agents.core.agent_log import AgentLogWriter
+
+
+def _read_all(directory):
+    records = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".gz"):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                records += [json.loads(line) for line in f]
+        elif name.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                records += [json.loads(line) for line in f]
+    return records
+
+
+def test_writers_in_several_processes_share_rotation(tmp_path):
+    # Two writers stand in for two API worker processes with the same log
+    first = AgentLogWriter(str(tmp_path), max_bytes=200, backup_count=100, compression="gzip")
+    second = AgentLogWriter(str(tmp_path), max_bytes=200, backup_count=100, compression="gzip")
+
+    for i in range(30):
+        writer = first if i % 3 else second
+        writer._write_batch([{"n": i, "payload": "x" * 40}])
+
+    assert sorted(record["n"] for record in _read_all(tmp_path)) == list(range(30))
+    assert any(name.endswith(".gz") for name in os.listdir(tmp_path))
+    # Each writer's size accounting follows the shared active file
+    active = os.path.getsize(tmp_path / "agent_io.jsonl")
+    assert first._size == active or second._size == active
+
+
+def test_backup_count_limits_segments(tmp_path):
+    writer = AgentLogWriter(str(tmp_path), max_bytes=50, backup_count=2, compression="gzip")
+    for i in range(10):
+        writer._write_batch([{"n": i, "payload": "y" * 60}])
+
+    segments = [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+    assert len(segments) == 2
+    assert writer.metrics()["rotations"] == 9
@@ -0,0 +1,86 @@
+import errno
+import io
+
+import pytest
+
+from analyzers.chunked_source import ChunkedFileReader, open_binary, open_text, source_size
+from apps.api import uploads
+
+PARTS = [b"id,name\n1,a", b"", b"lpha\n2,", b"b\n"]
+WHOLE = b"".join(PARTS)
+
+
+@pytest.fixture
+def chunks(tmp_path):
+    paths = []
+    for i, data in enumerate(PARTS):
+        path = uploads.chunk_path(str(tmp_path), i)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def test_reads_across_chunk_boundaries(chunks):
+    with open_binary(chunks) as f:
+        assert f.read() == WHOLE
+    assert source_size(chunks) == len(WHOLE)
+    with open_text(chunks) as f:
+        assert f.read().splitlines() == ["id,name", "1,alpha", "2,b"]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64])
+def test_small_reads_match_the_whole_file(chunks, size):
+    reader = ChunkedFileReader(chunks)
+    out = bytearray()
+    for block in iter(lambda: reader.read(size), b""):
+        out += block
+    assert bytes(out) == WHOLE
+
+
+def test_seek_and_tell(chunks):
+    with open_binary(chunks) as f:
+        assert f.seek(9) == 9 and f.read(4) == WHOLE[9:13]
+        assert f.seek(-3, io.SEEK_CUR) == 10 and f.read(2) == WHOLE[10:12]
+        assert f.seek(-2, io.SEEK_END) == len(WHOLE) - 2 and f.read() == b"b\n"
+        assert f.seek(100) == 100 and f.read(1) == b""
+        with pytest.raises(ValueError):
+            f.seek(-1)
+
+
+def test_raw_reads_stop_at_chunk_ends(chunks):
+    # Like a raw file, readinto returns what is left in the current chunk
+    reader = ChunkedFileReader(chunks)
+    reader.seek(9)
+    assert reader.read(4) == b",a"
+    assert reader.read(4) == b"lpha"
+    reader.close()
+    assert reader.closed
+
+
+def test_readline_spans_chunks(chunks):
+    with open_binary(chunks) as f:
+        f.seek(8)
+        assert f.readline() == b"1,alpha\n"
+        assert f.tell() == 16
+
+
+def test_ordered_paths_skip_missing_chunks(chunks, tmp_path):
+    info = [{"index": i} for i in range(len(PARTS) + 1)]
+    assert uploads.ordered_chunk_paths(str(tmp_path), info) == chunks
+
+
+def test_assemble_chunks_copies_in_order(chunks, tmp_path):
+    dest = tmp_path / "combined"
+    assert uploads.assemble_chunks(chunks, str(dest)) == len(WHOLE)
+    assert dest.read_bytes() == WHOLE
+
+
+def test_assemble_falls_back_when_kernel_copy_is_unsupported(chunks, tmp_path, monkeypatch):
+    def unsupported(src_fd, dst_fd, count):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    monkeypatch.setattr(uploads, "_copy_range", unsupported)
+    dest = tmp_path / "combined"
+    assert uploads.assemble_chunks(chunks, str(dest)) == len(WHOLE)
+    assert dest.read_bytes() == WHOLE
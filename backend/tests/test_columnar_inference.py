@@ -0,0 +1,33 @@
+import pytest
+
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+
+SHAPE_KEYS = ("total_rows", "columns", "column_types", "null_counts", "data_quality_score")
+
+
+@pytest.mark.parametrize("content", [b"", b"\n", b"\xef\xbb\xbf", b"id,name\n", b"\xef\xbb\xbfid,name\r\n"])
+def test_empty_and_header_only_files_match_stream_mode(tmp_path, content):
+    path = tmp_path / "data.csv"
+    path.write_bytes(content)
+    analyzer = HybridFileAnalyzer()
+
+    columnar = analyzer.analyze_uploaded_file(str(path), "csv", mode="columnar")
+    stream = analyzer.analyze_uploaded_file(str(path), "csv", mode="stream")
+
+    assert columnar["profile_mode"] == "columnar"
+    assert {key: columnar[key] for key in SHAPE_KEYS} == {key: stream[key] for key in SHAPE_KEYS}
+    assert set(columnar["profile"]) == set(columnar["columns"])
+
+
+def test_column_types(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("id,price,flag,day,at,name\n"
+                    "1,1.5,true,2024-01-01,2024-01-01T10:00:00,a\n"
+                    "2,2,false,2024-01-02,2024-01-02T11:30:00,\n")
+
+    result = HybridFileAnalyzer().analyze_uploaded_file(str(path), "csv", mode="columnar")
+
+    assert result["column_types"] == {
+        "id": "integer", "price": "float", "flag": "boolean", "day": "date", "at": "datetime", "name": "string",
+    }
+    assert result["null_counts"]["name"] == 1
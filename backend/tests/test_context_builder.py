@@ -0,0 +1,75 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from apps.agents.core.context_builder import ContextBuilder, estimate_tokens, truncate_to_tokens
+
+
+def _wide_metadata(columns=500):
+    return {"columns": {f"col_{i}": {"type": "integer" if i % 2 else "string"} for i in range(columns)}}
+
+
+def test_small_state_is_rendered_in_full():
+    state = {"source_metadata": {"rows": 10}, "user_feedback": "use ClickHouse"}
+    context, report = ContextBuilder().build(state)
+
+    assert context == 'Метаданные: {"rows": 10}\n\nОбратная связь: use ClickHouse'
+    assert report["truncated"] == []
+    assert report["tokens"] == estimate_tokens(context)
+
+
+def test_wide_schema_is_summarized_within_its_budget():
+    builder = ContextBuilder({"sections": {"source_metadata": 400}, "max_columns": 20})
+    context, report = builder.build({"source_metadata": _wide_metadata()})
+
+    assert report["sections"]["source_metadata"] <= 400
+    assert report["truncated"] == ["source_metadata"]
+    columns = json.loads(context[len("Метаданные: "):])["columns"]
+    # First max_columns in detail, the rest as a count, types and names
+    assert len(columns) == 21
+    assert columns["_omitted"]["count"] == 480
+    assert columns["_omitted"]["by_type"] == {"string": 240, "integer": 240}
+    assert columns["_omitted"]["names"][-1] == "... еще 440"
+
+
+def test_total_budget_goes_to_important_sections_first():
+    builder = ContextBuilder({"max_tokens": 300, "sections": {"user_feedback": 250, "data_sample": 250}})
+    state = {"user_feedback": "x" * 800, "data_sample": [{"id": i, "name": "y" * 50} for i in range(100)]}
+    context, report = builder.build(state)
+
+    # Feedback fits its own budget in full; the sample gets what is left of max_tokens
+    assert report["sections"]["user_feedback"] == 200
+    assert report["sections"]["data_sample"] <= 100
+    assert report["truncated"] == ["data_sample"]
+    assert report["tokens"] <= 300
+    # Output order follows SECTIONS, not the budget priority
+    assert context.index("Образец данных") < context.index("Обратная связь")
+
+
+def test_exhausted_budget_drops_sections():
+    builder = ContextBuilder({"max_tokens": 50})
+    context, report = builder.build({"user_feedback": "z" * 1000, "source_config": {"type": "csv"}})
+
+    assert "source_config" not in report["sections"]
+    assert "source_config" in report["truncated"]
+    assert "Конфигурация источника" not in context
+
+
+def test_truncate_to_tokens_marks_the_cut():
+    text = "абв" * 1000
+    cut = truncate_to_tokens(text, 100)
+
+    assert estimate_tokens(cut) <= 100
+    assert "обрезано" in cut
+    assert truncate_to_tokens("short", 100) == "short"
+
+
+def test_history_keeps_newest_messages_within_budget():
+    builder = ContextBuilder({"history_max_tokens": 100, "history_messages": 3})
+    messages = [HumanMessage(content=f"old {i}") for i in range(5)] + [AIMessage(content="n" * 1000)]
+
+    kept, tokens = builder.trim_history(messages)
+
+    assert len(kept) == 1
+    assert isinstance(kept[0], AIMessage)
+    assert tokens <= 100
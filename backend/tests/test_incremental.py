@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+from analyzers.incremental import IncrementalProfile
+from apps.api.uploads import (
+    advance_incremental_analysis, chunk_meta_path, finish_incremental_analysis, recorded_total_chunks,
+    store_chunk, write_atomic
+)
+
+
+def _stream_profile(path, source_type):
+    result = HybridFileAnalyzer().analyze_uploaded_file(str(path), source_type, mode="stream")
+    return {key: result[key] for key in ("total_rows", "columns", "column_types", "null_counts", "profile")}
+
+
+def _feed_in_chunks(data, source_type, chunk_size):
+    profile = IncrementalProfile(source_type, HybridFileAnalyzer()._guess_type)
+    for start in range(0, len(data), chunk_size):
+        profile.feed(data[start:start + chunk_size])
+        # Every request stores and reloads the state
+        profile = IncrementalProfile.from_state(json.loads(json.dumps(profile.to_state())), profile.guess_type)
+    profile.finish()
+    return profile.result()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 10_000])
+def test_ndjson_matches_stream_with_unicode_separators(tmp_path, chunk_size):
+    rows = [{"id": i, "text": f"a\u2028b\x85c\u2029{i}", "nested": {"v": None if i % 2 else i}} for i in range(15)]
+    data = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode("utf-8")
+    path = tmp_path / "data.ndjson"
+    path.write_bytes(data)
+
+    result = _feed_in_chunks(data, "json", chunk_size)
+
+    assert result["total_rows"] == 15
+    assert {key: result[key] for key in _stream_profile(path, "json")} == _stream_profile(path, "json")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 33, 10_000])
+def test_csv_matches_stream_with_quoted_newlines(tmp_path, chunk_size):
+    data = b'\xef\xbb\xbfid,comment,amount\n1,"multi\nline",1.5\n2,"form\x0cfeed",\n3,"say ""hi""",7\n'
+    path = tmp_path / "data.csv"
+    path.write_bytes(data)
+
+    result = _feed_in_chunks(data, "csv", chunk_size)
+
+    assert {key: result[key] for key in _stream_profile(path, "csv")} == _stream_profile(path, "csv")
+
+
+def _upload(upload_dir, data, chunk_size, total_chunks=None):
+    pieces = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    for index, piece in enumerate(pieces):
+        stored = store_chunk(str(upload_dir), index, [piece])
+        write_atomic(chunk_meta_path(str(upload_dir), index), json.dumps({
+            "index": index, "total_chunks": total_chunks or len(pieces), **stored
+        }).encode("utf-8"))
+        advance_incremental_analysis(str(upload_dir), "json")
+    return len(pieces)
+
+
+def test_finish_requires_recorded_chunk_count(tmp_path):
+    data = b'{"a": 1}\n{"a": 2}\n{"a": 3}\n'
+    total = _upload(tmp_path, data, 9)
+
+    assert finish_incremental_analysis(str(tmp_path), total + 1) is None
+    assert finish_incremental_analysis(str(tmp_path), total - 1) is None
+    assert finish_incremental_analysis(str(tmp_path), total)["total_rows"] == 3
+
+
+def test_recorded_total_chunks_detects_conflicting_meta():
+    assert recorded_total_chunks([{"total_chunks": 3}, {"total_chunks": 3}]) == 3
+    assert recorded_total_chunks([{"total_chunks": 3}, {"total_chunks": 4}]) is None
@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+from apps.agents.core.config_cache import mas_temp_dir
+from apps.api.janitor import Janitor, UploadQuotaExceeded
+from apps.api.uploads import hold_upload
+
+
+@pytest.fixture
+def janitor(tmp_path):
+    uploads = tmp_path / "uploads"
+    temp = tmp_path / "mas_temp"
+    uploads.mkdir()
+    temp.mkdir()
+    janitor = Janitor(uploads_root=str(uploads), temp_dir=str(temp), interval=3600)
+    janitor.upload_max_bytes = 1000
+    janitor.uploads_max_total_bytes = 2000
+    return janitor
+
+
+def _upload(janitor, name, size, age=0):
+    upload_dir = os.path.join(janitor.uploads_root, name)
+    os.makedirs(upload_dir)
+    path = os.path.join(upload_dir, "chunk_0000")
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    os.utime(upload_dir, (stamp, stamp))
+    return upload_dir
+
+
+def test_temp_dir_follows_general_config(monkeypatch):
+    monkeypatch.delenv("MAS_TEMP_DIR", raising=False)
+    assert mas_temp_dir({"paths": {"temp_dir": "/data/mas"}}) == "/data/mas"
+    assert Janitor(uploads_root="/nonexistent").temp_dir == mas_temp_dir()
+    monkeypatch.setenv("MAS_TEMP_DIR", "/env/mas")
+    assert mas_temp_dir({"paths": {"temp_dir": "/data/mas"}}) == "/env/mas"
+
+
+def test_per_upload_quota(janitor):
+    with pytest.raises(UploadQuotaExceeded) as exc:
+        janitor.check_upload_quota(900, 200)
+    assert not exc.value.retryable
+
+
+def test_global_quota_rejects_without_sweeping_inline(janitor, monkeypatch):
+    requested = []
+    monkeypatch.setattr(janitor, "sweep", lambda: pytest.fail("sweep ran on the request thread"))
+    monkeypatch.setattr(janitor, "request_sweep", lambda: requested.append(True))
+    janitor.record_write(1900)
+
+    with pytest.raises(UploadQuotaExceeded) as exc:
+        janitor.check_upload_quota(0, 200)
+
+    assert exc.value.retryable
+    assert requested == [True]
+
+
+def test_background_sweep_refreshes_estimate(janitor):
+    janitor.record_write(1900)
+    janitor.request_sweep()
+    deadline = time.time() + 5
+    while janitor.metrics()["sweeps"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    janitor.check_upload_quota(0, 200)
+
+
+def test_sweep_evicts_expired_and_least_recent_uploads(janitor):
+    janitor.upload_ttl = 3600
+    janitor.upload_min_idle = 60
+    expired = _upload(janitor, "expired", 100, age=7200)
+    oldest = _upload(janitor, "oldest", 1500, age=600)
+    recent = _upload(janitor, "recent", 1000, age=300)
+    active = _upload(janitor, "active", 900, age=0)
+
+    metrics = janitor.sweep()
+
+    assert not os.path.exists(expired)
+    assert not os.path.exists(oldest)
+    assert os.path.exists(recent) and os.path.exists(active)
+    assert metrics["uploads_evicted_ttl"] == 1
+    assert metrics["uploads_evicted_quota"] == 1
+    assert metrics["uploads_bytes"] == 1900
+
+
+def test_sweep_keeps_uploads_held_by_finalize(janitor):
+    janitor.upload_ttl = 3600
+    janitor.upload_min_idle = 60
+    queued = _upload(janitor, "queued", 2500, age=600)
+    hold = hold_upload(queued)
+    # Taking the hold is activity too; age the upload past min_idle again
+    stamp = time.time() - 600
+    for path in [queued] + [os.path.join(queued, name) for name in os.listdir(queued)]:
+        os.utime(path, (stamp, stamp))
+    try:
+        metrics = janitor.sweep()
+        assert os.path.exists(queued)
+        assert metrics["uploads_evicted_quota"] == 0
+        assert metrics["uploads_bytes"] == 2500
+    finally:
+        hold.close()
+
+    janitor.sweep()
+    assert not os.path.exists(queued)
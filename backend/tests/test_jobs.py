@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from apps.api import jobs
+from apps.api.jobs import JOB_POLL_MAX_WAIT_SECONDS, JobManager, JobQueueFull, job_events, parse_poll_wait
+
+
+@pytest.fixture
+def manager():
+    return JobManager(workers=1, max_pending=2, process_workers=1)
+
+
+def _wait_finished(manager, job):
+    while not job.finished:
+        manager.wait_for_change(job, job.version, 5)
+    return job
+
+
+def test_job_runs_to_success_or_failure(manager):
+    ok = manager.submit("analysis", lambda job: {"rows": 3})
+    failed = manager.submit("analysis", lambda job: 1 / 0)
+
+    assert _wait_finished(manager, ok).to_dict()["result"] == {"rows": 3}
+    _wait_finished(manager, failed)
+    assert failed.status == "failed" and "division by zero" in failed.error
+    assert manager.metrics()["jobs"]["success"] == 1 and manager.metrics()["pending"] == 0
+
+
+def test_queue_is_bounded(manager):
+    release = threading.Event()
+    blocked = [manager.submit("analysis", lambda job: release.wait(5)) for _ in range(2)]
+
+    with pytest.raises(JobQueueFull):
+        manager.submit("analysis", lambda job: None)
+
+    release.set()
+    for job in blocked:
+        _wait_finished(manager, job)
+    manager.submit("analysis", lambda job: None)
+
+
+def test_wait_for_change_returns_on_update(manager):
+    release = threading.Event()
+    job = manager.submit("analysis", lambda job: release.wait(5))
+    version = job.version
+
+    threading.Timer(0.05, lambda: manager.update(job, stage="profiling", progress=50.0)).start()
+
+    assert manager.wait_for_change(job, version, 5) != version
+    release.set()
+    _wait_finished(manager, job)
+
+
+@pytest.mark.parametrize("raw, expected", [(None, 0.0), ("", 0.0), ("1.5", 1.5), ("600", JOB_POLL_MAX_WAIT_SECONDS)])
+def test_poll_wait_is_capped(raw, expected):
+    assert parse_poll_wait(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["-1", "abc", "inf", "nan"])
+def test_invalid_poll_wait_is_rejected(raw):
+    with pytest.raises(ValueError):
+        parse_poll_wait(raw)
+
+
+def test_events_stream_progress_then_done(manager):
+    release = threading.Event()
+    job = manager.submit("analysis", lambda job: release.wait(5) and {"rows": 1})
+
+    async def collect():
+        events = []
+        async for text in job_events(job, poll_interval=0.01, keep_alive_every=3):
+            events.append(text)
+            if len(events) == 1:
+                manager.update(job, stage="profiling", progress=40.0)
+            elif text.startswith("event: progress") and '"profiling"' in text:
+                release.set()
+        return events
+
+    events = asyncio.run(collect())
+
+    kinds = [text.split("\n", 1)[0] for text in events if not text.startswith(":")]
+    assert kinds[0] == "event: progress" and kinds[-1] == "event: done"
+    done = json.loads(events[-1].split("data: ", 1)[1])
+    assert done["result"] == {"rows": 1} and done["progress"] == 100.0
+    assert all("result" not in json.loads(text.split("data: ", 1)[1])
+               for text in events[:-1] if text.startswith("event:"))
+
+
+def test_analysis_runs_in_the_process_pool(tmp_path, manager, monkeypatch):
+    monkeypatch.setattr(jobs, "get_job_manager", lambda: manager)
+    path = tmp_path / "data.csv"
+    path.write_text("id,name\n1,a\n2,\n")
+    kwargs = {"file_path": str(path), "source_type": "csv", "mode": "stream", "original_filename": "data.csv"}
+
+    job = manager.submit("analysis", lambda job: jobs.run_analysis(job, **kwargs))
+
+    result = _wait_finished(manager, job).result
+    assert result["total_rows"] == 2 and result["null_counts"] == {"id": 0, "name": 1}
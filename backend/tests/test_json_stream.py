@@ -0,0 +1,61 @@
+import json
+import sys
+
+import pytest
+
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+from analyzers.json_stream import first_significant_byte, flatten_record, iter_json_records
+
+RECORDS = [{"id": 1, "user": {"name": "a", "tags": ["x"]}}, {"id": 2, "user": {}}]
+BOM = b"\xef\xbb\xbf"
+
+
+@pytest.fixture(params=["ijson", "stdlib"])
+def reader(request, monkeypatch):
+    if request.param == "stdlib":
+        # A None entry makes "import ijson" raise ImportError
+        monkeypatch.setitem(sys.modules, "ijson", None)
+    return iter_json_records
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_flatten_record_uses_dotted_paths():
+    assert flatten_record({"a": {"b": {"c": 1}, "d": [1, 2]}, "e": {}}) == {"a.b.c": 1, "a.d": [1, 2], "e": {}}
+
+
+@pytest.mark.parametrize("bom", [b"", BOM])
+def test_array_and_ndjson_yield_the_same_records(tmp_path, reader, bom):
+    array = _write(tmp_path, "array.json", bom + b"  \n" + json.dumps(RECORDS).encode("utf-8"))
+    ndjson = _write(tmp_path, "rows.ndjson", bom + "\n".join(json.dumps(r) for r in RECORDS).encode("utf-8") + b"\n")
+
+    assert list(reader(array)) == RECORDS
+    assert list(reader(ndjson)) == RECORDS
+
+
+def test_first_significant_byte_skips_bom_and_rewinds(tmp_path):
+    path = _write(tmp_path, "a.json", BOM + b" \r\n[{}]")
+    with open(path, "rb") as f:
+        assert first_significant_byte(f) == b"["
+        assert f.tell() == 0
+
+
+def test_chunk_list_is_read_as_one_document(tmp_path):
+    data = json.dumps(RECORDS).encode("utf-8")
+    chunks = [_write(tmp_path, "chunk_0000", data[:7]), _write(tmp_path, "chunk_0001", data[7:])]
+
+    assert list(iter_json_records(chunks)) == RECORDS
+
+
+def test_stream_mode_profiles_flattened_columns(tmp_path):
+    path = _write(tmp_path, "rows.json", json.dumps(RECORDS).encode("utf-8"))
+
+    result = HybridFileAnalyzer().analyze_uploaded_file(path, "json", mode="stream")
+
+    assert result["total_rows"] == 2
+    assert result["columns"] == ["id", "user.name", "user.tags", "user"]
+    assert result["column_types"]["id"] == "integer"
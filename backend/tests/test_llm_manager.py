@@ -0,0 +1,50 @@
+import sys
+
+import yaml
+
+from apps.agents.apps import is_server_process
+from apps.agents.core.llm_manager import LLMManager
+
+
+def _manager(tmp_path, **ollama):
+    path = tmp_path / "general_config.yaml"
+    path.write_text(yaml.safe_dump({"llm_config": {
+        "ollama": {"enabled": False, "models": {"input_analysis": "llama3.2"}, **ollama},
+        "response_cache": {"enabled": False},
+        "semantic_cache": {"enabled": False},
+    }}))
+    return LLMManager(str(path))
+
+
+def test_fallback_stub_is_reused_while_ollama_is_down(tmp_path):
+    manager = _manager(tmp_path)
+
+    first = manager.get_llm("input_analysis")
+
+    assert manager.is_fallback(first)
+    assert manager.get_llm("input_analysis") is first
+    assert manager.get_llm("ddl_generation") is not first
+
+
+def test_new_config_version_gets_new_fallback(tmp_path):
+    first = _manager(tmp_path).get_llm("input_analysis")
+    assert _manager(tmp_path).get_llm("input_analysis") is not first
+
+
+def test_preload_only_in_server_processes(monkeypatch):
+    monkeypatch.delenv("RUN_MAIN", raising=False)
+    for argv, expected in [
+        (["manage.py", "migrate"], False),
+        (["manage.py", "shell"], False),
+        (["manage.py", "collectstatic"], False),
+        (["manage.py", "runserver"], False),
+        (["manage.py", "runserver", "--noreload"], True),
+        (["/usr/local/bin/gunicorn", "config.wsgi"], True),
+        (["uvicorn", "config.asgi:application"], True),
+    ]:
+        monkeypatch.setattr(sys, "argv", argv)
+        assert is_server_process() is expected, argv
+
+    monkeypatch.setattr(sys, "argv", ["manage.py", "runserver"])
+    monkeypatch.setenv("RUN_MAIN", "true")
+    assert is_server_process()
@@ -0,0 +1,71 @@
+import re
+
+from apps.agents.core.metrics import StageMetrics
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[^}]*\})? (\S+)$')
+
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def _metrics():
+    metrics = StageMetrics(buckets=(1, 5))
+    metrics.observe("ddl_generation", {
+        "model": "llama3.2", "wall_seconds": 0.5, "queue_wait_seconds": 2.0, "retries": 1,
+        "prompt_tokens": {"actual": 120}, "completion_tokens": 30, "llm_seconds": 0.4,
+    })
+    metrics.observe("ddl_generation", {"model": "llama3.2", "wall_seconds": 3.0, "cache": "schema"})
+    metrics.observe("ddl_generation", {"model": "llama3.2", "wall_seconds": 9.0}, outcome="error")
+    return metrics
+
+
+def test_counters_and_runs():
+    samples = _samples(_metrics().render_prometheus())
+    labels = '{stage="ddl_generation",model="llama3.2"'
+
+    assert samples[f'mas_stage_runs_total{labels},outcome="ok"}}'] == 2
+    assert samples[f'mas_stage_runs_total{labels},outcome="error"}}'] == 1
+    assert samples[f'mas_stage_cache_hits_total{labels},cache="schema"}}'] == 1
+    assert samples[f"mas_stage_retries_total{labels}}}"] == 1
+    assert samples[f"mas_stage_prompt_tokens_total{labels}}}"] == 120
+    assert samples[f"mas_stage_completion_tokens_total{labels}}}"] == 30
+
+
+def test_histogram_buckets_are_cumulative():
+    samples = _samples(_metrics().render_prometheus())
+    labels = 'stage="ddl_generation",model="llama3.2"'
+
+    assert samples[f'mas_stage_duration_seconds_bucket{{{labels},le="1"}}'] == 1
+    assert samples[f'mas_stage_duration_seconds_bucket{{{labels},le="5"}}'] == 2
+    assert samples[f'mas_stage_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 3
+    assert samples[f"mas_stage_duration_seconds_sum{{{labels}}}"] == 12.5
+    assert samples[f"mas_stage_duration_seconds_count{{{labels}}}"] == 3
+    assert samples[f'mas_stage_queue_wait_seconds_bucket{{{labels},le="+Inf"}}'] == 1
+
+
+def test_every_family_has_help_and_type():
+    text = _metrics().render_prometheus({"models": {"llama3.2": {"in_flight": 1, "queue_depth": 2, "limit": 4}}})
+    families = {line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")}
+
+    for name in _samples(text):
+        base = re.sub(r"(_bucket|_sum|_count)$", "", name.split("{")[0])
+        assert name.split("{")[0] in families or base in families, name
+    assert _samples(text)['mas_admission_queue_depth{model="llama3.2"}'] == 2
+    assert _samples(text)['mas_admission_timeouts_total{model="llama3.2"}'] == 0
+    assert text.endswith("\n")
+
+
+def test_label_values_are_escaped():
+    metrics = StageMetrics()
+    metrics.observe("input_analysis", {"model": 'a"b\\c\nd'})
+
+    line = next(line for line in metrics.render_prometheus().splitlines() if line.startswith("mas_stage_runs_total"))
+    assert line == 'mas_stage_runs_total{stage="input_analysis",model="a\\"b\\\\c\\nd",outcome="ok"} 1'
@@ -0,0 +1,95 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+from apps.agents.core.model_registry import ModelRegistry
+
+OLLAMA = {"url": "http://ollama.test:11434", "temperature": 0.1, "max_tokens": 64}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(registry, "check_health", lambda base_url, force=False: {
+        "available": True, "models": ["llama3.2:latest", "qwen:latest"], "checked_at": 0,
+    })
+    return registry
+
+
+def test_models_are_shared_and_use_one_connection_pool(registry):
+    first = registry.get_chat_model(OLLAMA, "llama3.2")
+    again = registry.get_chat_model(OLLAMA, "llama3.2")
+    other = registry.get_chat_model(OLLAMA, "qwen")
+
+    assert first is again
+    transport = registry._transports[OLLAMA["url"]]
+    assert first.sync_client_kwargs["transport"] is transport
+    assert other.sync_client_kwargs["transport"] is transport
+
+
+def test_missing_model_is_not_registered(registry):
+    assert registry.get_chat_model(OLLAMA, "mistral") is None
+
+
+def test_reset_closes_transports(registry):
+    registry.get_chat_model(OLLAMA, "llama3.2")
+    transport = registry._transports[OLLAMA["url"]]
+    closed = []
+    transport.close = lambda: closed.append(True)
+
+    registry.reset()
+
+    assert closed == [True]
+    assert registry.get_chat_model(OLLAMA, "llama3.2").sync_client_kwargs["transport"] is not transport
+
+
+def test_async_models_are_per_event_loop(registry):
+    async def model():
+        return registry.get_chat_model(OLLAMA, "llama3.2", for_async=True)
+
+    first = asyncio.run(model())
+    second = asyncio.run(model())
+
+    assert first is not second
+    assert first.async_client_kwargs["transport"] is not second.async_client_kwargs["transport"]
+    # Closed loops are dropped instead of pinning their pools
+    gc.collect()
+    assert len(registry._loop_state) <= 1
+
+
+def test_async_health_check_does_not_block_the_loop(monkeypatch):
+    registry = ModelRegistry()
+    threads = []
+
+    def slow_health(base_url, force=False):
+        threads.append(threading.current_thread())
+        time.sleep(0.2)
+        registry._health[base_url] = {"available": True, "models": ["llama3.2:latest"], "checked_at": time.time()}
+        return registry._health[base_url]
+
+    monkeypatch.setattr(registry, "check_health", slow_health)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        await registry.acheck_health(OLLAMA["url"])
+        model = registry.get_chat_model(OLLAMA, "llama3.2", for_async=True)
+        task.cancel()
+        return ticks, model
+
+    ticks, model = asyncio.run(scenario())
+
+    assert ticks >= 5
+    assert threads and threads[0] is not threading.main_thread()
+    # The model lookup used the refreshed status instead of a second request
+    assert model is not None and len(threads) == 1
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from analyzers import parallel_profiler
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+
+# Characters str.splitlines() treats as line breaks but CSV/JSON do not
+ODD_BREAKS = ["\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029"]
+
+
+def _comparable(result):
+    return {key: value for key, value in result.items() if key not in ("profile_mode", "ranges", "peak_rss_mb")}
+
+
+def _both_modes(path, source_type):
+    analyzer = HybridFileAnalyzer()
+    stream = analyzer.analyze_uploaded_file(str(path), source_type, mode="stream")
+    parallel = analyzer.analyze_uploaded_file(str(path), source_type, mode="parallel", workers=2)
+    return stream, parallel
+
+
+@pytest.fixture
+def tiny_ranges(monkeypatch):
+    # Force several byte ranges (and worker processes) on small files
+    monkeypatch.setattr(parallel_profiler, "MIN_RANGE_BYTES", 1)
+
+
+def test_csv_odd_line_breaks_in_quoted_fields(tmp_path, tiny_ranges):
+    lines = ["id,note,score"]
+    for i in range(10):
+        note = f"a{ODD_BREAKS[i % len(ODD_BREAKS)]}b"
+        lines.append(f'{i},"{note}",{"" if i % 3 == 0 else i * 1.5}')
+    path = tmp_path / "odd.csv"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    stream, parallel = _both_modes(path, "csv")
+
+    assert stream["total_rows"] == 10
+    assert parallel["ranges"] > 1
+    assert _comparable(parallel) == _comparable(stream)
+
+
+def test_ndjson_line_separator_inside_string(tmp_path, tiny_ranges):
+    rows = [{"id": i, "text": f"x y{ODD_BREAKS[i % len(ODD_BREAKS)]}z", "n": None if i % 4 else i}
+            for i in range(12)]
+    path = tmp_path / "odd.ndjson"
+    path.write_text("\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\n", encoding="utf-8")
+
+    stream, parallel = _both_modes(path, "json")
+
+    assert stream["total_rows"] == 12
+    assert parallel["ranges"] > 1
+    assert _comparable(parallel) == _comparable(stream)
+
+
+@pytest.mark.parametrize("source_type, body", [
+    ("csv", "id,name\n1,a\n2,b\n3,\n"),
+    ("json", '{"id": 1, "name": "a"}\n{"id": 2, "name": "b"}\n{"id": 3}\n'),
+])
+def test_bom_is_stripped_in_every_mode(tmp_path, source_type, body):
+    path = tmp_path / f"bom.{source_type}"
+    path.write_bytes(b"\xef\xbb\xbf" + body.encode("utf-8"))
+
+    stream, parallel = _both_modes(path, source_type)
+
+    assert stream["columns"][0] == "id"
+    assert _comparable(parallel) == _comparable(stream)
+
+
+def test_workers_come_from_one_non_forking_pool(tmp_path, tiny_ranges):
+    path = tmp_path / "data.csv"
+    path.write_text("id\n" + "".join(f"{i}\n" for i in range(50)))
+
+    _both_modes(path, "csv")
+    pool = parallel_profiler.get_process_pool()
+    _both_modes(path, "csv")
+
+    assert parallel_profiler.get_process_pool() is pool
+    assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
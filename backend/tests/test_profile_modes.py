@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from analyzers import parallel_profiler
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+
+# Columnar inference names the float type differently from the type voter
+COLUMNAR_TYPES = {"float": "number"}
+
+SHARED_KEYS = ("total_rows", "columns", "null_counts", "data_quality_score")
+
+
+def _csv(rows=200):
+    lines = ["id,price,flag,name,comment"]
+    for i in range(rows):
+        price = "" if i % 7 == 0 else f"{i * 1.25}"
+        name = "" if i % 5 == 0 else f"name {i % 13}"
+        lines.append(f'{i},{price},{"true" if i % 2 else "false"},{name},"line\nbreak, {i}"')
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@pytest.fixture
+def modes(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel_profiler, "MIN_RANGE_BYTES", 1)
+    analyzer = HybridFileAnalyzer()
+
+    def run(data, source_type):
+        path = tmp_path / f"data.{source_type}"
+        path.write_bytes(data)
+        results = {
+            mode: analyzer.analyze_uploaded_file(str(path), source_type, mode=mode, workers=2)
+            for mode in ("stream", "parallel")
+        }
+        if source_type == "csv":
+            results["columnar"] = analyzer.analyze_uploaded_file(str(path), source_type, mode="columnar")
+        return results
+
+    return run
+
+
+def test_csv_parallel_and_columnar_agree_with_stream(modes):
+    results = modes(_csv(), "csv")
+    stream = results["stream"]
+
+    assert stream["total_rows"] == 200
+    for key in (*SHARED_KEYS, "column_types", "profile"):
+        assert results["parallel"][key] == stream[key], key
+
+    columnar = results["columnar"]
+    for key in SHARED_KEYS:
+        assert columnar[key] == stream[key], key
+    assert {name: COLUMNAR_TYPES.get(kind, kind) for name, kind in columnar["column_types"].items()} == \
+        stream["column_types"]
+
+
+def test_ndjson_parallel_agrees_with_stream(modes):
+    rows = [{"id": i, "user": {"name": f"u{i % 9}", "age": None if i % 4 == 0 else i}, "tags": i % 3 == 0}
+            for i in range(150)]
+    data = "\n".join(json.dumps(row) for row in rows).encode("utf-8") + b"\n"
+
+    results = modes(data, "json")
+    stream = results["stream"]
+
+    assert stream["total_rows"] == 150
+    for key in (*SHARED_KEYS, "column_types", "profile"):
+        assert results["parallel"][key] == stream[key], key
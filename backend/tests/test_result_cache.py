@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+from django.conf import settings
+
+from analyzers.result_cache import AnalysisCache, hash_source
+from apps.api import jobs
+
+
+def test_keys_separate_parameters_that_change_the_answer():
+    key = AnalysisCache.make_key
+    assert key("sha256:a", "csv", "sample", 100) != key("sha256:a", "csv", "sample", 200)
+    assert key("sha256:a", "csv", "sample", 100) != key("sha256:a", "csv", "stream", 100)
+    assert key("sha256:a", "csv", "stream", 100) != key("sha256:a", "json", "stream", 100)
+    assert key("sha256:a", "csv", "stream", 100) != key("sha256:b", "csv", "stream", 100)
+    # Full-pass modes do not depend on the sample size
+    assert key("sha256:a", "csv", "stream", 100) == key("sha256:a", "csv", "stream", 200)
+
+
+def test_chunked_and_whole_file_hashes(tmp_path):
+    parts = []
+    for i, data in enumerate([b"id\n1\n", b"2\n"]):
+        path = tmp_path / f"chunk_{i}"
+        path.write_bytes(data)
+        parts.append(str(path))
+    whole = tmp_path / "whole"
+    whole.write_bytes(b"id\n1\n2\n")
+
+    # Same key as a single-file upload, which hashes the bytes as they arrive
+    uploaded_whole = "sha256:" + hashlib.sha256(b"id\n1\n2\n").hexdigest()
+    assert hash_source(parts) == hash_source(str(whole)) == uploaded_whole
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+    # Random hex does not compress below the cap
+    payload = {"blob": os.urandom(10_000).hex()}
+    cache.put("big", payload)
+    assert cache.get("big") is None
+
+    for i in range(20):
+        cache.put(f"k{i}", {"i": i, "noise": os.urandom(1000).hex()})
+    assert cache.get("k19")["i"] == 19
+    assert cache.get("k0") is None
+    assert cache.stats()["bytes"] <= 10_000
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(jobs, "_analysis_cache", None)
+
+
+def test_store_and_lookup_use_request_filename(tmp_path, monkeypatch, fresh_cache):
+    monkeypatch.setattr(settings, "ANALYSIS_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    kwargs = {"source_type": "csv", "sample_size": 10, "original_filename": "a.csv", "mode": "stream"}
+    jobs.store_cached_analysis("sha256:abc", {"total_rows": 3, "original_filename": "a.csv"}, **kwargs)
+
+    hit = jobs.lookup_cached_analysis("sha256:abc", **{**kwargs, "original_filename": "b.csv"})
+    assert hit == {"total_rows": 3, "original_filename": "b.csv"}
+    assert jobs.lookup_cached_analysis("sha256:abc", **{**kwargs, "mode": "sample"}) is None
+
+
+def test_unopenable_cache_falls_back_to_no_cache(tmp_path, monkeypatch, fresh_cache):
+    # A directory cannot be opened as an SQLite database
+    monkeypatch.setattr(settings, "ANALYSIS_CACHE_PATH", str(tmp_path))
+    kwargs = {"source_type": "csv", "sample_size": 10, "original_filename": "a.csv", "mode": "stream"}
+
+    jobs.store_cached_analysis("sha256:abc", {"total_rows": 1}, **kwargs)
+    assert jobs.lookup_cached_analysis("sha256:abc", **kwargs) is None
+
+
+def test_connections_are_closed(tmp_path, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("k", {"i": 1})
+    assert cache.get("k") == {"i": 1}
+    cache.stats()
+
+    assert len(opened) == 4
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
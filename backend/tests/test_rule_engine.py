@@ -0,0 +1,163 @@
+import asyncio
+import io
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from apps.agents.core.rule_engine import RuleEngine
+from apps.agents.integration import LLMIntegration
+
+METADATA = {
+    "source_type": "csv",
+    "original_filename": "Orders 2024.csv",
+    "total_rows": 3,
+    "columns": ["ID", "Order Date", "amount"],
+    "column_types": {"ID": "integer", "Order Date": "datetime", "amount": "number"},
+    "null_counts": {"ID": 0, "Order Date": 0, "amount": 1},
+}
+
+
+class _TaskInstance:
+    def __init__(self, payload):
+        self.payload = payload
+        self.log = types.SimpleNamespace(info=lambda message: None)
+
+    def xcom_pull(self, task_ids):
+        return self.payload
+
+
+@pytest.fixture
+def airflow(monkeypatch):
+    """Модули Airflow и хуков провайдеров, записывающие вызовы load"""
+    calls = []
+
+    class PostgresHook:
+        def __init__(self, postgres_conn_id):
+            self.conn_id = postgres_conn_id
+
+        def insert_rows(self, table, rows, target_fields, commit_every):
+            calls.append(("postgres", self.conn_id, table, list(rows), target_fields))
+
+    class HDFSClient:
+        def write(self, path, data, overwrite):
+            calls.append(("hdfs", path, pd.read_parquet(io.BytesIO(data))))
+
+    class WebHDFSHook:
+        def __init__(self, webhdfs_conn_id):
+            self.conn_id = webhdfs_conn_id
+
+        def get_conn(self):
+            return HDFSClient()
+
+    class DAG:
+        def __init__(self, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    class PythonOperator:
+        def __init__(self, task_id, python_callable):
+            pass
+
+        def __rshift__(self, other):
+            return other
+
+    modules = {
+        "airflow": {"DAG": DAG},
+        "airflow.operators": {},
+        "airflow.operators.python": {"PythonOperator": PythonOperator},
+        "airflow.providers": {},
+        "airflow.providers.postgres": {},
+        "airflow.providers.postgres.hooks": {},
+        "airflow.providers.postgres.hooks.postgres": {"PostgresHook": PostgresHook},
+        "airflow.providers.apache": {},
+        "airflow.providers.apache.hdfs": {},
+        "airflow.providers.apache.hdfs.hooks": {},
+        "airflow.providers.apache.hdfs.hooks.webhdfs": {"WebHDFSHook": WebHDFSHook},
+    }
+    for name, attrs in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        monkeypatch.setitem(sys.modules, name, module)
+    return calls
+
+
+def _load(storage, frame):
+    engine = RuleEngine()
+    spec = engine.pipeline_generation(engine.profile_from_state({"source_metadata": METADATA}), storage)
+    namespace = {}
+    exec(compile(spec["dag_code"], "dag.py", "exec"), namespace)
+    context = {"ti": _TaskInstance(frame.to_json(orient="records")), "ds": "2024-05-01", "ts_nodash": "20240501T000000"}
+    namespace["load"](**context)
+    return spec
+
+
+def test_generated_load_inserts_into_postgres(airflow):
+    frame = pd.DataFrame({"ID": [1, 2], "Order Date": ["2024-01-01", "2024-01-02"], "amount": [1.5, None]})
+
+    spec = _load("postgres", frame)
+
+    assert "apache-airflow-providers-postgres" in spec["dependencies"]
+    [(kind, conn_id, table, rows, fields)] = airflow
+    assert (kind, conn_id, table) == ("postgres", "postgres_default", "orders_2024")
+    assert fields == ["id", "order_date", "amount"]
+    assert rows[0][2] == 1.5 and rows[1][2] is None
+
+
+def test_generated_load_writes_hdfs_partition(airflow):
+    pytest.importorskip("pyarrow")
+    frame = pd.DataFrame({"ID": [1], "Order Date": ["2024-01-01"], "amount": [2.0]})
+
+    _load("hdfs", frame)
+
+    [(kind, path, written)] = airflow
+    assert path == "/data/raw/orders_2024/load_date=2024-05-01/20240501T000000.parquet"
+    assert list(written.columns) == ["id", "order_date", "amount"]
+
+
+def test_background_llm_runs_on_a_fork(monkeypatch):
+    integration = LLMIntegration.__new__(LLMIntegration)
+    integration.llm_manager = types.SimpleNamespace(config={"agents_config": {"fallback": {
+        "enabled": True, "slo_seconds": 0.05, "continue_in_background": True,
+    }}})
+    integration.rule_engine = types.SimpleNamespace(apply=lambda state, stages: {**state, "report": "rules"})
+    integration._background = set()
+    state = {"messages": [], "errors": [], "execution_stats": {}}
+
+    async def slow_llm(branch):
+        await asyncio.sleep(0.2)
+        branch["messages"].append("llm")
+        branch["execution_stats"]["llm"] = True
+        branch["report"] = "llm"
+        return branch
+
+    async def scenario():
+        result = await integration._run_with_fallback(state, ["report_generation"], slow_llm, "slo_seconds")
+        await asyncio.gather(*integration._background)
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result["report"] == "rules"
+    assert state == {"messages": [], "errors": [], "execution_stats": {}}
+
+
+def test_same_profile_gives_same_answers():
+    state = {"source_config": {"analysis_result": METADATA}}
+    stages = ["input_analysis", "ddl_generation", "pipeline_generation", "report_generation"]
+
+    first = RuleEngine().apply(dict(state, messages=[], completed_agents=[]), stages)
+    second = RuleEngine().apply(dict(state, messages=[], completed_agents=[]), stages)
+
+    assert [m.content for m in first["messages"]] == [m.content for m in second["messages"]]
+    assert first["completed_agents"] == stages
+    # A time column with numeric measures is a time series
+    assert first["storage_recommendation"] == "clickhouse"
+    assert "ORDER BY (order_date, id)" in first["ddl_scripts"][0]["ddl"]
+    assert first["pipeline_config"]["dag_id"] == "orders_2024_etl"
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from apps.agents.core.schema_cache import SchemaCache, extract_schema
+
+
+def _schema(columns):
+    return {f"col_{i}": ("integer", 0.0) for i in range(columns)}
+
+
+def _store(cache, stage, schema):
+    scope = SchemaCache.make_scope(stage, "model", {"source_type": "csv"})
+    cache.store(scope, schema, AIMessage(content=f"{stage} answer"), {"ddl_scripts": "CREATE TABLE t ()"})
+    return scope
+
+
+def test_exact_fingerprint_hit(tmp_path):
+    cache = SchemaCache(str(tmp_path / "schema.sqlite3"))
+    scope = _store(cache, "ddl_generation", _schema(21))
+
+    response, fields, similarity = cache.lookup(scope, _schema(21))
+
+    assert response.content == "ddl_generation answer"
+    assert fields == {"ddl_scripts": "CREATE TABLE t ()"}
+    assert similarity == 1.0
+
+
+def test_ddl_needs_identical_schema(tmp_path):
+    cache = SchemaCache(str(tmp_path / "schema.sqlite3"), similarity_threshold=0.9)
+    scope = _store(cache, "ddl_generation", _schema(21))
+
+    assert cache.lookup(scope, _schema(20)) is None
+    assert cache.threshold_for("pipeline_generation") == 1.0
+
+
+def test_input_analysis_reuses_nearest_schema(tmp_path):
+    cache = SchemaCache(str(tmp_path / "schema.sqlite3"), similarity_threshold=0.9)
+    scope = _store(cache, "input_analysis", _schema(21))
+
+    response, _, similarity = cache.lookup(scope, _schema(20))
+
+    assert response.response_metadata["semantic_cache"] == "hit"
+    assert round(similarity, 4) == round(20 / 21, 4)
+
+
+def test_explicit_stage_threshold_enables_nearest_match(tmp_path):
+    cache = SchemaCache(str(tmp_path / "schema.sqlite3"), stage_thresholds={"ddl_generation": 0.9})
+    scope = _store(cache, "ddl_generation", _schema(21))
+
+    assert cache.lookup(scope, _schema(20)) is not None
+
+
+def test_extract_schema_normalizes_analyzer_output():
+    state = {"source_config": {"analysis_result": {
+        "total_rows": 10,
+        "columns": ["ID", " Name "],
+        "column_types": {"ID": "Integer", " Name ": "string"},
+        "null_counts": {"ID": 0, " Name ": 5},
+    }}}
+
+    assert extract_schema(state) == {"id": ("integer", 0.0), "name": ("string", 0.5)}
+
+
+def test_connections_are_closed(tmp_path, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    cache = SchemaCache(str(tmp_path / "schema.sqlite3"))
+    scope = _store(cache, "ddl_generation", _schema(3))
+    assert cache.lookup(scope, _schema(3)) is not None
+
+    assert opened
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,115 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from apps.agents.core.session_store import (
+    FileKVSessionStore, SessionConflict, SQLSessionStore, apply_delta, create_session_store, snapshot_state,
+    state_delta
+)
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLSessionStore(str(tmp_path / "sessions.sqlite3"), snapshot_every=3)
+    return FileKVSessionStore(str(tmp_path / "sessions"), snapshot_every=3)
+
+
+def _step(store, session_id, state, baseline, version):
+    version = store.append(session_id, state_delta(baseline, state), version, state=state)
+    return version, snapshot_state(state)
+
+
+def test_delta_round_trip_with_messages(store):
+    state = {"messages": [HumanMessage(content="hi")], "ddl_scripts": None, "source_type": "csv"}
+    version, baseline = _step(store, "s1", state, {}, 0)
+    for i in range(5):
+        state["messages"].append(AIMessage(content=f"answer {i}"))
+        state["ddl_scripts"] = f"CREATE TABLE t{i} ()"
+        if i == 2:
+            del state["source_type"]
+        version, baseline = _step(store, "s1", state, baseline, version)
+
+    loaded, loaded_version = store.load("s1")
+
+    assert loaded_version == version == 6
+    assert loaded == state
+    assert isinstance(loaded["messages"][-1], AIMessage)
+
+
+def test_stale_version_conflicts(store):
+    state = {"step": 1}
+    version, baseline = _step(store, "s2", state, {}, 0)
+    state["step"] = 2
+    _step(store, "s2", state, baseline, version)
+
+    with pytest.raises(SessionConflict):
+        store.append("s2", {"set": {"step": 3}}, version)
+    with pytest.raises(SessionConflict):
+        store.append("s2", {"set": {"step": 1}}, 0)
+    assert store.load("s2")[0] == {"step": 2}
+
+
+def test_delta_captures_appends_sets_and_unsets():
+    baseline = snapshot_state({"errors": ["a"], "x": 1, "gone": True})
+    state = {"errors": ["a", "b"], "x": 2}
+
+    delta = state_delta(baseline, state)
+
+    assert delta == {"set": {"x": 2}, "append": {"errors": ["b"]}, "unset": ["gone"]}
+    assert apply_delta(dict(baseline), delta) == state
+
+
+def test_file_load_retries_when_snapshot_removes_listed_deltas(tmp_path, monkeypatch):
+    store = FileKVSessionStore(str(tmp_path), snapshot_every=3)
+    state, version, baseline = {"n": 0}, 0, {}
+    for n in range(1, 3):
+        state["n"] = n
+        version, baseline = _step(store, "s3", state, baseline, version)
+
+    listed = store._versions
+    calls = []
+
+    def versions_then_snapshot(directory):
+        result = listed(directory)
+        if not calls:
+            calls.append(result)
+            # A concurrent append writes snapshot 3 and deletes versions 1-2
+            # right after this load listed them
+            monkeypatch.setattr(store, "_versions", listed)
+            state["n"] = 3
+            store.append("s3", state_delta(baseline, state), 2, state=state)
+            monkeypatch.setattr(store, "_versions", versions_then_snapshot)
+        else:
+            calls.append(result)
+        return result
+
+    monkeypatch.setattr(store, "_versions", versions_then_snapshot)
+
+    assert store.load("s3") == ({"n": 3}, 3)
+    assert len(calls) == 2
+
+
+def test_concurrent_create_conflicts_instead_of_integrity_error(tmp_path, monkeypatch):
+    store = SQLSessionStore(str(tmp_path / "sessions.sqlite3"))
+    store.append("s3", {"set": {"step": 1}}, 0)
+    query = store._query
+
+    def racing_query(conn, sql, params=()):
+        # The other writer's row is not visible yet when the existence check runs
+        if sql.startswith("SELECT 1 FROM mas_sessions"):
+            return []
+        return query(conn, sql, params)
+
+    monkeypatch.setattr(store, "_query", racing_query)
+    with pytest.raises(SessionConflict):
+        store.append("s3", {"set": {"step": 2}}, 0)
+    monkeypatch.undo()
+    assert store.load("s3") == ({"step": 1}, 1)
+
+
+def test_sqlite_url_slashes_follow_sqlalchemy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert create_session_store("sqlite:///rel/sessions.sqlite3").dsn == "rel/sessions.sqlite3"
+    assert (tmp_path / "rel" / "sessions.sqlite3").exists()
+    absolute = tmp_path / "abs.sqlite3"
+    assert create_session_store(f"sqlite:///{absolute}").dsn == str(absolute)
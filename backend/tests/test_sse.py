@@ -0,0 +1,86 @@
+import asyncio
+import json
+import sys
+import types
+
+from django.urls import path
+
+from apps.api.sse import KEEP_ALIVE, sse_event, sse_response
+
+
+def _parse(stream):
+    events = []
+    for block in stream.split("\n\n"):
+        if block and not block.startswith(":"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_event_is_one_data_line_per_block():
+    text = sse_event("token", {"stage": "ddl_generation", "content": "CREATE TABLE t (\n  id Int64\n);"})
+
+    assert text.endswith("\n\n") and text.count("\n") == 3
+    assert _parse(text + KEEP_ALIVE) == [
+        ("token", {"stage": "ddl_generation", "content": "CREATE TABLE t (\n  id Int64\n);"}),
+    ]
+
+
+async def _slow_view(request):
+    async def events():
+        yield sse_event("start", {"n": 0})
+        await asyncio.sleep(0.3)
+        yield sse_event("done", {"n": 1})
+
+    return sse_response(events())
+
+
+def test_asgi_application_sends_events_as_they_are_generated(monkeypatch):
+    from django.conf import settings
+    from config.asgi import application
+
+    urlconf = types.ModuleType("sse_test_urls")
+    urlconf.urlpatterns = [path("stream", _slow_view)]
+    monkeypatch.setitem(sys.modules, "sse_test_urls", urlconf)
+    monkeypatch.setattr(settings, "ROOT_URLCONF", "sse_test_urls")
+    monkeypatch.setattr(settings, "ALLOWED_HOSTS", ["*"])
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        received = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            if not received:
+                received.append(None)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        sent = []
+
+        async def send(message):
+            sent.append((loop.time() - started, message))
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/stream", "raw_path": b"/stream", "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 1),
+            "server": ("testserver", 80),
+        }
+        await application(scope, receive, send)
+        disconnect.set()
+        return sent
+
+    sent = asyncio.run(scenario())
+
+    start = next(message for message in sent if message[1]["type"] == "http.response.start")[1]
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream") in [(k.lower(), v) for k, v in start["headers"]]
+    bodies = [(at, message.get("body", b"")) for at, message in sent if message["type"] == "http.response.body"]
+    first_at, first = next((at, body) for at, body in bodies if body)
+    assert _parse(first.decode()) == [("start", {"n": 0})]
+    # The first event left before the generator finished sleeping
+    assert first_at < 0.25
+    assert _parse(b"".join(body for _, body in bodies).decode()) == [("start", {"n": 0}), ("done", {"n": 1})]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from apps.agents.core.stage_graph import Stage, StageGraph
+
+STAGES = ["input_analysis", "ddl_generation", "pipeline_generation", "report_generation"]
+
+# Finish order of the parallel stages is the reverse of their declaration order
+DELAYS = {"ddl_generation": 0.05, "pipeline_generation": 0.0}
+
+
+def _runner(events):
+    async def run_stage(name, branch):
+        events.append(("start", name))
+        await asyncio.sleep(DELAYS.get(name, 0))
+        branch["messages"].append(name)
+        branch["completed_agents"].append(name)
+        branch[f"{name}_done"] = True
+        if name == "report_generation":
+            # The report sees the fields of both parallel stages
+            branch["report"] = branch.get("ddl_generation_done") and branch.get("pipeline_generation_done")
+        events.append(("end", name))
+        return branch
+    return run_stage
+
+
+def test_default_graph_runs_ddl_and_pipeline_in_parallel():
+    graph = StageGraph.from_config(None, STAGES)
+    events = []
+    state = {"messages": ["request"]}
+
+    result = asyncio.run(graph.run(state, _runner(events)))
+
+    assert graph.dependencies["ddl_generation"] == {"input_analysis"}
+    assert graph.dependencies["report_generation"] == {"input_analysis", "ddl_generation", "pipeline_generation"}
+    starts = [name for kind, name in events if kind == "start"]
+    assert starts[0] == "input_analysis" and starts[-1] == "report_generation"
+    # Both branches started before either finished
+    assert events.index(("start", "pipeline_generation")) < events.index(("end", "ddl_generation"))
+    assert result is state
+    assert result["report"] is True
+
+
+def test_append_lists_merge_in_declaration_order():
+    graph = StageGraph.from_config(None, STAGES)
+
+    result = asyncio.run(graph.run({"messages": ["request"]}, _runner([])))
+
+    assert result["messages"] == ["request", *STAGES]
+    assert result["completed_agents"] == STAGES
+
+
+def test_stage_failure_cancels_the_rest():
+    graph = StageGraph.from_config(None, STAGES)
+    started = []
+
+    async def run_stage(name, branch):
+        started.append(name)
+        if name == "pipeline_generation":
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.05)
+        return branch
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(graph.run({}, run_stage))
+    assert "report_generation" not in started
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        StageGraph([Stage("a", reads=["y"], writes=["x"]), Stage("b", reads=["x"], writes=["y"])])
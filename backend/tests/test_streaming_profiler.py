@@ -0,0 +1,79 @@
+import pytest
+
+from analyzers import parallel_profiler
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+from analyzers.incremental import IncrementalProfile
+from analyzers.streaming_profiler import StreamingProfiler, unique_column_names
+
+DUPLICATE_HEADER = b"a,a,b,a.1\n1,2,x,z\n3,4,y,w\n"
+# "Привет" in cp1251: six bytes that are not valid UTF-8
+CP1251_CSV = "id,name\n1,Привет\n2,ok\n".encode("cp1251")
+
+
+@pytest.mark.parametrize("header, expected", [
+    (["a", "a", "b"], ["a", "a.1", "b"]),
+    (["a", "a", "a"], ["a", "a.1", "a.2"]),
+    (["a", "a", "b", "a.1"], ["a", "a.2", "b", "a.1"]),
+])
+def test_unique_column_names_follow_pandas(header, expected):
+    assert unique_column_names(header) == expected
+
+
+def test_duplicate_header_keeps_one_profile_per_position(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel_profiler, "MIN_RANGE_BYTES", 1)
+    path = tmp_path / "dup.csv"
+    path.write_bytes(DUPLICATE_HEADER)
+    analyzer = HybridFileAnalyzer()
+
+    results = {mode: analyzer.analyze_uploaded_file(str(path), "csv", mode=mode, workers=2)
+               for mode in ("stream", "parallel", "columnar")}
+    incremental = IncrementalProfile("csv", analyzer._guess_type)
+    incremental.feed(DUPLICATE_HEADER)
+    incremental.finish()
+    results["incremental"] = incremental.result()
+
+    for mode, result in results.items():
+        assert result["columns"] == ["a", "a.2", "b", "a.1"], mode
+        assert result["column_types"]["b"] == "string", mode
+        assert "replaced_chars" not in result, mode
+    stream = results["stream"]["profile"]
+    assert (stream["a"]["min"], stream["a.2"]["min"]) == (1, 2)
+    assert stream["b"]["min"] == "x"
+
+
+def test_non_utf8_bytes_are_replaced_and_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel_profiler, "MIN_RANGE_BYTES", 1)
+    path = tmp_path / "cp1251.csv"
+    path.write_bytes(CP1251_CSV)
+    analyzer = HybridFileAnalyzer()
+
+    results = {mode: analyzer.analyze_uploaded_file(str(path), "csv", mode=mode, workers=2)
+               for mode in ("stream", "parallel", "columnar")}
+    incremental = IncrementalProfile("csv", analyzer._guess_type)
+    incremental.feed(CP1251_CSV[:14])
+    incremental.feed(CP1251_CSV[14:])
+    incremental.finish()
+    results["incremental"] = incremental.result()
+    sample = analyzer.analyze_uploaded_file(str(path), "csv", mode="sample")
+
+    for mode, result in results.items():
+        assert result["total_rows"] == 2, mode
+        assert result["replaced_chars"] == 6, mode
+        assert result["column_types"]["id"] == "integer", mode
+    assert sample["total_rows"] == 2
+
+
+def test_state_round_trip_and_merge():
+    guess = HybridFileAnalyzer()._guess_type
+    first = StreamingProfiler(guess, columns=["id", "name"])
+    first.add_values(["1", "a"])
+    second = StreamingProfiler(guess, columns=["id", "name"])
+    second.add_values(["7", ""])
+
+    first = StreamingProfiler.from_state(first.to_state(), guess)
+    first.merge(second)
+    result = first.result()
+
+    assert result["total_rows"] == 2
+    assert result["null_counts"] == {"id": 0, "name": 1}
+    assert (result["profile"]["id"]["min"], result["profile"]["id"]["max"]) == (1, 7)
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from apps.agents.core.structured_output import (
+    STAGE_SCHEMAS, StructuredOutputError, extract_json, parse_stage_output, validate
+)
+
+INPUT_ANALYSIS = {
+    "storage_recommendation": "PostgreSQL",
+    "reasoning": "точечные чтения по ключу",
+    "data_characteristics": {
+        "volume": "small", "velocity": "batch", "variety": "structured", "main_use_case": "transactional",
+    },
+    "alternative_storages": [{"storage": "clickhouse", "reason": "аналитика", "priority": 2}],
+}
+
+
+def test_extract_json_from_fenced_or_wrapped_answer():
+    assert extract_json('{"a": 1}') == {"a": 1}
+    assert extract_json('```json\n{"a": [1, 2]}\n```') == {"a": [1, 2]}
+    assert extract_json('Вот ответ: {"a": {"b": true}} - готово') == {"a": {"b": True}}
+    with pytest.raises(StructuredOutputError):
+        extract_json("нет объекта")
+    with pytest.raises(StructuredOutputError):
+        extract_json('{"a": }')
+
+
+def test_input_analysis_is_normalized_and_mapped():
+    fields = parse_stage_output("input_analysis", json.dumps(INPUT_ANALYSIS, ensure_ascii=False))
+
+    assert fields["storage_recommendation"] == "postgres"
+    assert fields["storage_alternatives"][0]["storage"] == "clickhouse"
+    assert fields["data_profile"]["characteristics"]["volume"] == "small"
+    assert fields["data_profile"]["potential_issues"] == []
+
+
+def test_schema_violations_are_reported_with_paths():
+    data = {**INPUT_ANALYSIS, "storage_recommendation": "mongo",
+            "data_characteristics": {"volume": "huge"},
+            "alternative_storages": [{"storage": "hdfs", "reason": "x", "priority": True}]}
+
+    errors = validate(data, STAGE_SCHEMAS["input_analysis"])
+
+    assert "$.storage_recommendation: 'mongo' не из ['postgres', 'clickhouse', 'hdfs']" in errors
+    assert "$.data_characteristics: нет поля velocity" in errors
+    assert "$.alternative_storages[0].priority: ожидается integer, получено bool" in errors
+    with pytest.raises(StructuredOutputError):
+        parse_stage_output("input_analysis", json.dumps(data))
+
+
+def test_ddl_and_pipeline_fields():
+    ddl = parse_stage_output("ddl_generation", json.dumps({
+        "main_table": {"name": "t", "ddl": "CREATE TABLE t ()", "engine": "MergeTree"},
+        "indexes": [{"name": "i", "ddl": "CREATE INDEX i ON t (a)"}],
+    }))
+    pipeline = parse_stage_output("pipeline_generation", json.dumps({
+        "dag_id": "t_etl", "schedule": "@daily", "dag_code": "dag = None", "config": {"retries": 1},
+    }))
+
+    assert [script["type"] for script in ddl["ddl_scripts"]] == ["table", "index"]
+    assert ddl["ddl_recommendations"]["engine"] == "MergeTree"
+    assert pipeline["pipeline_config"] == {
+        "dag_id": "t_etl", "schedule": "@daily", "retries": 1, "dependencies": [], "notes": [],
+    }
+    with pytest.raises(StructuredOutputError):
+        parse_stage_output("pipeline_generation", json.dumps({"dag_id": "t_etl"}))
+
+
+def test_report_is_split_into_sections():
+    fields = parse_stage_output("report_generation", "# Отчет\n\n## Хранилище\npostgres\n\n## DDL\nнет\n")
+
+    assert fields["report_sections"] == {"Хранилище": "postgres", "DDL": "нет"}
@@ -0,0 +1,52 @@
+import hashlib
+import os
+
+import pytest
+
+from apps.api.uploads import (
+    ChunkIntegrityError, chunk_path, chunked_uploads_root, parse_chunk_hash, store_chunk, upload_dir_for
+)
+
+DATA = [b"id,name\n", b"1,a\n", b"2,b\n"]
+
+
+def test_verified_chunk_is_stored(tmp_path):
+    digest = hashlib.sha256(b"".join(DATA)).hexdigest()
+
+    stored = store_chunk(str(tmp_path), 0, DATA, f"sha256:{digest}")
+
+    assert stored == {"size": 16, "sha256": digest, "verified": True, "hash_algorithm": "sha256"}
+    assert open(chunk_path(str(tmp_path), 0), "rb").read() == b"".join(DATA)
+
+
+def test_client_algorithm_is_checked_and_sha256_recorded(tmp_path):
+    md5 = hashlib.md5(b"".join(DATA)).hexdigest()
+
+    stored = store_chunk(str(tmp_path), 1, DATA, f"MD5:{md5.upper()}")
+
+    assert stored["hash_algorithm"] == "md5"
+    assert stored["sha256"] == hashlib.sha256(b"".join(DATA)).hexdigest()
+
+
+def test_hash_mismatch_keeps_previous_chunk(tmp_path):
+    store_chunk(str(tmp_path), 0, [b"good"])
+
+    with pytest.raises(ChunkIntegrityError):
+        store_chunk(str(tmp_path), 0, DATA, "0" * 64)
+
+    assert os.listdir(tmp_path) == ["chunk_0000"]
+    assert open(chunk_path(str(tmp_path), 0), "rb").read() == b"good"
+
+
+def test_unknown_hash_algorithm_is_rejected():
+    assert parse_chunk_hash(None) is None
+    assert parse_chunk_hash("ABC") == ("sha256", "abc")
+    with pytest.raises(ValueError):
+        parse_chunk_hash("crc32:0000")
+
+
+def test_upload_dir_is_one_path_component():
+    assert upload_dir_for("abc-123") == os.path.join(chunked_uploads_root(), "abc-123")
+    for upload_id in ("", ".", "..", "../etc", "a/b"):
+        with pytest.raises(ValueError):
+            upload_dir_for(upload_id)
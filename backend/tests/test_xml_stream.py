@@ -0,0 +1,62 @@
+from analyzers.hybrid_file_analyzer import HybridFileAnalyzer
+from analyzers.xml_stream import detect_record_path, iter_xml_records
+
+EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<export xmlns="urn:example" version="2">
+  <meta><created>2024-01-01</created></meta>
+  <items>
+    <item id="1"><name>a</name><price currency="EUR">1.5</price><tag>x</tag><tag>y</tag></item>
+    <item id="2"><name>b</name><owner><email>b@example.com</email></owner></item>
+    <item id="3">plain</item>
+  </items>
+</export>
+"""
+
+
+def _write(tmp_path, data, name="export.xml"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_detects_shallowest_repeated_element_without_namespace(tmp_path):
+    assert detect_record_path(_write(tmp_path, EXPORT)) == ("export", "items", "item")
+
+
+def test_single_child_is_the_only_record(tmp_path):
+    path = _write(tmp_path, b"<root><config><a>1</a><b>2</b></config></root>")
+    assert detect_record_path(path) == ("root", "config")
+
+
+def test_truncated_document_is_detected_from_the_prefix(tmp_path):
+    path = _write(tmp_path, b"<rows><row><v>1</v></row><row><v>2</v></row><row><v>")
+    assert detect_record_path(path) == ("rows", "row")
+    assert detect_record_path(_write(tmp_path, b"<root/>", "empty.xml")) is None
+
+
+def test_records_are_flattened(tmp_path):
+    records = list(iter_xml_records(_write(tmp_path, EXPORT), ("export", "items", "item")))
+
+    assert records == [
+        {"@id": "1", "name": "a", "price@currency": "EUR", "price": "1.5", "tag": ["x", "y"]},
+        {"@id": "2", "name": "b", "owner.email": "b@example.com"},
+        {"@id": "3", "#text": "plain"},
+    ]
+
+
+def test_records_split_across_chunks(tmp_path):
+    cut = EXPORT.index(b"<owner>") + 3
+    chunks = [_write(tmp_path, EXPORT[:cut], "chunk_0000"), _write(tmp_path, EXPORT[cut:], "chunk_0001")]
+
+    assert detect_record_path(chunks) == ("export", "items", "item")
+    assert len(list(iter_xml_records(chunks, ("export", "items", "item")))) == 3
+
+
+def test_stream_mode_reports_record_path(tmp_path):
+    result = HybridFileAnalyzer().analyze_uploaded_file(_write(tmp_path, EXPORT), "xml", mode="stream")
+
+    assert result["record_path"] == "/export/items/item"
+    assert result["record_element"] == "item"
+    assert result["total_rows"] == 3
+    assert result["column_types"]["price"] == "number"
+    assert result["null_counts"]["name"] == 1